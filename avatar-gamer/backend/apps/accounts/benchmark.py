@@ -0,0 +1,222 @@
+import json
+import platform
+import subprocess
+import time
+from dataclasses import dataclass
+from statistics import mean, median
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.metrics.latency import summarize
+from apps.metrics.queries import QueryBudgetExceeded
+
+from .dataset import DEFAULT_PASSWORD
+from .models import OperatorUserLink, Role
+
+
+class _Rollback(Exception):
+    pass
+
+
+@dataclass
+class Endpoint:
+    name: str
+    method: str
+    path: str
+    actor: str = None           # rol cuyo token se envía (None = anónimo)
+    body: dict = None
+
+
+def endpoints(actors):
+    """Endpoints calientes de apps/accounts/urls.py (y los de JWT en config/urls.py)."""
+    login = {"username": actors["user"].username, "password": DEFAULT_PASSWORD}
+    selected = [
+        Endpoint("login", "post", "/api/v1/login", body=login),
+        Endpoint("auth/token", "post", "/api/v1/auth/token", body=login),
+        Endpoint("me", "get", "/api/v1/me", "user"),
+        Endpoint("users/linked", "get", "/api/v1/users/linked", "operator"),
+        Endpoint("users/operators", "get", "/api/v1/users/operators", "user"),
+        Endpoint("admin/users", "get", "/api/v1/admin/users", "admin"),
+        Endpoint("admin/users?role=operator", "get", "/api/v1/admin/users?role=operator", "admin"),
+        Endpoint("admin/metrics", "get", "/api/v1/admin/metrics", "admin"),
+        Endpoint("link-requests/sent", "get", "/api/v1/link-requests/sent", "operator"),
+        Endpoint("link-requests/received", "get", "/api/v1/link-requests/received", "user"),
+    ]
+    if actors.get("unlinked_user"):
+        selected.append(Endpoint("link-requests (create)", "post", "/api/v1/link-requests", "operator",
+                                 body={"user_id": actors["unlinked_user"].id, "message": "benchmark"}))
+    return selected
+
+
+def pick_actors(prefix):
+    """
+    Elige usuarios del dataset: el operador con más vínculos, un usuario
+    vinculado a él y uno que no lo está (para crear solicitudes).
+    """
+    seeded = User.objects.filter(username__startswith=f"{prefix}-")
+    admin = seeded.filter(profile__role=Role.ADMIN).order_by("id").first()
+    link = (
+        OperatorUserLink.objects.filter(operator__username__startswith=f"{prefix}-")
+        .values("operator")
+        .annotate(total=Count("id"))
+        .order_by("-total", "operator")
+        .first()
+    )
+    if admin is None or link is None:
+        return None
+    operator = User.objects.get(id=link["operator"])
+    user = User.objects.filter(linked_operators__operator=operator).order_by("id").first()
+    unlinked = (
+        seeded.filter(profile__role=Role.USER)
+        .exclude(linked_operators__operator=operator)
+        .exclude(received_link_requests__operator=operator)
+        .order_by("id")
+        .first()
+    )
+    return {"admin": admin, "operator": operator, "user": user, "unlinked_user": unlinked}
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class ApiBenchmark:
+    """
+    Mide latencia y cantidad de queries de cada endpoint con el cliente de
+    pruebas de Django (sin red, pasando por middlewares, autenticación y
+    serializadores).
+
+    Cada request corre dentro de una transacción que se revierte, así los
+    endpoints que escriben (login registra AuthEvent, crear solicitudes) no
+    alteran el dataset entre iteraciones ni entre corridas.
+
+    Con ``enforce_budgets`` se activa el perfilador de queries en modo
+    estricto y los requests que superan su ``@query_budget`` quedan con
+    estado ``budget_exceeded``.
+    """
+
+    def __init__(self, actors, *, iterations=30, warmup=3, only=None, enforce_budgets=False):
+        self.actors = actors
+        self.iterations = iterations
+        self.warmup = warmup
+        self.only = set(only or [])
+        self.enforce_budgets = enforce_budgets
+        self.client = Client()
+        self.tokens = {role: str(AccessToken.for_user(user)) for role, user in actors.items() if user}
+
+    def _request(self, endpoint):
+        headers = {}
+        if endpoint.actor:
+            headers["HTTP_AUTHORIZATION"] = f"Bearer {self.tokens[endpoint.actor]}"
+        call = getattr(self.client, endpoint.method)
+        if endpoint.method == "get":
+            return call(endpoint.path, **headers)
+        return call(endpoint.path, data=json.dumps(endpoint.body or {}), content_type="application/json", **headers)
+
+    def _measure(self, endpoint):
+        try:
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    try:
+                        status_code = self._request(endpoint).status_code
+                    except QueryBudgetExceeded:
+                        status_code = "budget_exceeded"
+                    elapsed = time.perf_counter() - started
+                raise _Rollback
+        except _Rollback:
+            pass
+        return elapsed, len(queries), status_code
+
+    def run_endpoint(self, endpoint):
+        for _ in range(self.warmup):
+            self._measure(endpoint)
+        timings, query_counts, statuses = [], [], {}
+        for _ in range(self.iterations):
+            elapsed, queries, status_code = self._measure(endpoint)
+            timings.append(elapsed)
+            query_counts.append(queries)
+            statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+        stats = summarize(timings)
+        stats["mean"] = round(mean(timings) * 1000, 2)
+        view = resolve(endpoint.path.split("?")[0]).func
+        return {
+            "method": endpoint.method.upper(),
+            "path": endpoint.path,
+            "latencyMs": stats,
+            "queries": {
+                "median": median(query_counts),
+                "max": max(query_counts),
+                "budget": getattr(getattr(view, "view_class", view), "query_budget", None),
+            },
+            "status": statuses,
+        }
+
+    def run(self, progress=None):
+        if not self.enforce_budgets:
+            return self._run(progress)
+        profiler = {**settings.QUERY_PROFILER, "ENABLED": True, "STRICT": True}
+        with override_settings(QUERY_PROFILER=profiler):
+            self.client = Client()  # el stack de middlewares se arma con la configuración activa
+            return self._run(progress)
+
+    def _run(self, progress):
+        results = {}
+        for endpoint in endpoints(self.actors):
+            if self.only and endpoint.name not in self.only:
+                continue
+            results[endpoint.name] = self.run_endpoint(endpoint)
+            if progress:
+                progress(endpoint.name, results[endpoint.name])
+        return {
+            "meta": {
+                "revision": _git_revision(),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "iterations": self.iterations,
+                "users": User.objects.count(),
+            },
+            "endpoints": results,
+        }
+
+
+def compare(current, baseline, *, tolerance=0.2, metric="p50"):
+    """
+    Compara contra una línea base. Es regresión si la latencia ``metric``
+    crece más que ``tolerance`` (fracción) o si aumenta el número de queries.
+    """
+    rows = []
+    for name, result in current["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous is None:
+            rows.append({"endpoint": name, "status": "new"})
+            continue
+        before = previous["latencyMs"][metric]
+        after = result["latencyMs"][metric]
+        change = (after - before) / before if before else 0.0
+        queries_before = previous["queries"]["max"]
+        queries_after = result["queries"]["max"]
+        regressed = change > tolerance or queries_after > queries_before
+        rows.append({
+            "endpoint": name,
+            "before": before,
+            "after": after,
+            "change": round(change * 100, 1),
+            "queriesBefore": queries_before,
+            "queriesAfter": queries_after,
+            "status": "regression" if regressed else "ok",
+        })
+    return rows
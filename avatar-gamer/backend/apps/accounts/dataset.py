@@ -0,0 +1,333 @@
+import random
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+from apps.chat.ids import uuid7
+from apps.chat.models import ChatMessage, Conversation, ConversationParticipant
+
+from .models import (
+    AuthEvent,
+    LinkRequest,
+    LinkRequestStatus,
+    OperatorUserLink,
+    Profile,
+    Role,
+    UserConsent,
+)
+
+# Todas las fechas se generan hacia atrás desde este instante, así dos corridas
+# con la misma semilla producen exactamente los mismos datos.
+ANCHOR = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+SPAN_DAYS = 365
+
+DEFAULT_PASSWORD = "seed-password"
+# Sal fija: el hash se calcula una sola vez y se reutiliza para todos los usuarios.
+_PASSWORD_SALT = "seeddataset"
+
+CONSENTS = (("terms", "1.0", 1.0), ("privacy", "1.0", 1.0), ("marketing", "1.0", 0.3))
+USER_AGENTS = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/124.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148",
+    "Mozilla/5.0 (Linux; Android 14) AppleWebKit/537.36 Chrome/124.0 Mobile Safari/537.36",
+    "okhttp/4.12.0",
+)
+PHRASES = (
+    "Hola, ¿cómo estás hoy?",
+    "Recuerda tomar agua y descansar un poco.",
+    "¿Quieres que juguemos una partida más tarde?",
+    "Hoy me sentí bastante cansado después del colegio.",
+    "Mañana tenemos la sesión a las cinco.",
+    "Gracias por avisarme, lo reviso en un rato.",
+    "El avatar se veía muy bien en la última sesión.",
+    "¿Pudiste dormir mejor esta semana?",
+    "Vamos a practicar los ejercicios de respiración.",
+    "Te escribo para confirmar la hora de mañana.",
+)
+
+
+@dataclass
+class DatasetSize:
+    users: int = 100_000
+    operator_ratio: float = 0.05
+    admins: int = 5
+    max_links_per_user: int = 2
+    link_ratio: float = 0.8
+    auth_events: int = 2_000_000
+    messages: int = 2_000_000
+
+
+@dataclass
+class SeedReport:
+    counts: dict = field(default_factory=dict)
+
+    def add(self, name, amount):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+
+@contextmanager
+def _keep_timestamps(*models):
+    """Desactiva auto_now/auto_now_add para que bulk_create respete las fechas generadas."""
+    saved = []
+    for model in models:
+        for model_field in model._meta.concrete_fields:
+            if getattr(model_field, "auto_now", False) or getattr(model_field, "auto_now_add", False):
+                saved.append((model_field, model_field.auto_now, model_field.auto_now_add))
+                model_field.auto_now = model_field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for model_field, auto_now, auto_now_add in saved:
+            model_field.auto_now = auto_now
+            model_field.auto_now_add = auto_now_add
+
+
+def _chunks(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seeded_users(prefix):
+    return User.objects.filter(username__startswith=f"{prefix}-")
+
+
+def delete_dataset(prefix):
+    """Elimina los datos generados con ``prefix`` (mensajes y eventos primero, sin cargarlos en memoria)."""
+    users = seeded_users(prefix)
+    ChatMessage.objects.filter(sender__in=users).delete()
+    Conversation.objects.filter(participants__user__in=users).delete()
+    AuthEvent.objects.filter(username__startswith=f"{prefix}-").delete()
+    users.delete()
+
+
+class DatasetSeeder:
+    """
+    Genera un volumen realista de datos con bulk_create, de forma determinista.
+
+    Con la misma semilla, tamaños y prefijo se obtienen los mismos usuarios,
+    vínculos, eventos y mensajes (incluidos ids y fechas), lo que permite
+    comparar benchmarks entre commits sobre el mismo dataset.
+    """
+
+    def __init__(self, size, *, seed=42, prefix="seed", batch_size=5000, progress=None):
+        self.size = size
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.progress = progress or (lambda name, done: None)
+        self.report = SeedReport()
+        self.admin_ids = []
+        self.operator_ids = []
+        self.user_ids = []
+        self.links = []
+
+    def _when(self, max_days=SPAN_DAYS):
+        return ANCHOR - timedelta(seconds=self.rng.randrange(max_days * 86400))
+
+    def _bulk(self, model, objects, name):
+        created = []
+        for batch in _chunks(objects, self.batch_size):
+            created.extend(model.objects.bulk_create(batch))
+            self.report.add(name, len(batch))
+            self.progress(name, self.report.counts[name])
+        return created
+
+    def run(self):
+        with _keep_timestamps(Profile, AuthEvent, LinkRequest, OperatorUserLink, UserConsent, Conversation):
+            self.seed_users()
+            self.seed_links()
+            self.seed_consents()
+            self.seed_auth_events()
+            self.seed_messages()
+        return self.report
+
+    def seed_users(self):
+        size = self.size
+        operators = max(1, int(size.users * size.operator_ratio))
+        password = make_password(DEFAULT_PASSWORD, salt=_PASSWORD_SALT)
+
+        plan = (
+            [(Role.ADMIN, index) for index in range(size.admins)]
+            + [(Role.OPERATOR, index) for index in range(operators)]
+            + [(Role.USER, index) for index in range(max(0, size.users - operators - size.admins))]
+        )
+        users = []
+        for role, index in plan:
+            joined = self._when()
+            users.append(User(
+                username=f"{self.prefix}-{role.value}-{index}",
+                email=f"{self.prefix}-{role.value}-{index}@example.com",
+                first_name=role.label,
+                last_name=str(index),
+                password=password,
+                is_staff=role == Role.ADMIN,
+                date_joined=joined,
+            ))
+        created = self._bulk(User, users, "users")
+
+        profiles = []
+        for user, (role, _) in zip(created, plan):
+            {Role.ADMIN: self.admin_ids, Role.OPERATOR: self.operator_ids, Role.USER: self.user_ids}[role].append(user.id)
+            profiles.append(Profile(
+                user_id=user.id,
+                role=role,
+                created_at=user.date_joined,
+                updated_at=user.date_joined,
+            ))
+        self._bulk(Profile, profiles, "profiles")
+
+    def seed_links(self):
+        size = self.size
+        approved = []
+        others = []
+        for user_id in self.user_ids:
+            if self.rng.random() < size.link_ratio:
+                count = self.rng.randint(1, min(size.max_links_per_user, len(self.operator_ids)))
+                for operator_id in self.rng.sample(self.operator_ids, count):
+                    created_at = self._when()
+                    approved.append(LinkRequest(
+                        operator_id=operator_id,
+                        user_id=user_id,
+                        status=LinkRequestStatus.APPROVED,
+                        message="Solicitud de vinculación",
+                        created_at=created_at,
+                        updated_at=created_at + timedelta(hours=self.rng.randint(1, 72)),
+                    ))
+            # Solicitudes pendientes o rechazadas que no generaron vínculo.
+            roll = self.rng.random()
+            if roll < 0.15:
+                created_at = self._when(30)
+                others.append(LinkRequest(
+                    operator_id=self.rng.choice(self.operator_ids),
+                    user_id=user_id,
+                    status=LinkRequestStatus.PENDING if roll < 0.10 else LinkRequestStatus.REJECTED,
+                    created_at=created_at,
+                    updated_at=created_at,
+                ))
+
+        # Una solicitud pendiente nunca repite la pareja de un vínculo aprobado.
+        linked_pairs = {(request.operator_id, request.user_id) for request in approved}
+        others = [request for request in others if (request.operator_id, request.user_id) not in linked_pairs]
+
+        requests = self._bulk(LinkRequest, approved, "link_requests")
+        self._bulk(LinkRequest, others, "link_requests")
+        self.links = self._bulk(OperatorUserLink, (
+            OperatorUserLink(
+                operator_id=request.operator_id,
+                user_id=request.user_id,
+                link_request_id=request.id,
+                created_at=request.updated_at,
+            )
+            for request in requests
+        ), "links")
+
+    def seed_consents(self):
+        consents = []
+        for user_id in self.admin_ids + self.operator_ids + self.user_ids:
+            for consent_type, version, probability in CONSENTS:
+                if self.rng.random() < probability:
+                    consents.append(UserConsent(
+                        user_id=user_id,
+                        consent_type=consent_type,
+                        version=version,
+                        accepted_at=self._when(),
+                        ip_address=f"10.{self.rng.randrange(256)}.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}",
+                        user_agent=self.rng.choice(USER_AGENTS),
+                    ))
+        self._bulk(UserConsent, consents, "consents")
+
+    def seed_auth_events(self):
+        all_ids = self.admin_ids + self.operator_ids + self.user_ids
+        usernames = dict(seeded_users(self.prefix).values_list("id", "username"))
+
+        def events():
+            for _ in range(self.size.auth_events):
+                user_id = self.rng.choice(all_ids)
+                success = self.rng.random() < 0.9
+                yield AuthEvent(
+                    username=usernames[user_id],
+                    user_id=user_id if success else None,
+                    success=success,
+                    ip=f"10.{self.rng.randrange(256)}.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}",
+                    user_agent=self.rng.choice(USER_AGENTS),
+                    created_at=self._when(),
+                )
+
+        self._bulk(AuthEvent, events(), "auth_events")
+
+    def seed_messages(self):
+        if not self.links or not self.size.messages:
+            return
+        # Distribución sesgada: pocas conversaciones concentran muchos mensajes.
+        weights = [self.rng.paretovariate(1.2) for _ in self.links]
+        scale = self.size.messages / sum(weights)
+        counts = [int(weight * scale) for weight in weights]
+        # Reparte lo que se perdió al truncar para llegar exactamente a --messages.
+        by_remainder = sorted(range(len(weights)), key=lambda index: counts[index] - weights[index] * scale)
+        for index in by_remainder[:self.size.messages - sum(counts)]:
+            counts[index] += 1
+        active = [(link, count) for link, count in zip(self.links, counts) if count]
+        conversations = self._bulk(Conversation, (
+            Conversation(
+                key=f"conversation:{Role.OPERATOR.value}-{link.operator_id}:{Role.USER.value}-{link.user_id}",
+                created_at=link.created_at,
+            )
+            for link, _ in active
+        ), "conversations")
+        summaries = []
+
+        def messages():
+            for conversation, (link, count) in zip(conversations, active):
+                created_at = link.created_at
+                step = max(1, int((ANCHOR - created_at).total_seconds() / count))
+                message = None
+                for seq in range(1, count + 1):
+                    created_at += timedelta(seconds=self.rng.randint(1, step))
+                    from_operator = self.rng.random() < 0.5
+                    message = ChatMessage(
+                        id=uuid7(created_at, self.rng),
+                        conversation_id=conversation.id,
+                        sender_id=link.operator_id if from_operator else link.user_id,
+                        sender_role=Role.OPERATOR if from_operator else Role.USER,
+                        recipient_id=link.user_id if from_operator else link.operator_id,
+                        text=self.rng.choice(PHRASES),
+                        seq=seq,
+                        created_at=created_at,
+                    )
+                    yield message
+                summaries.append((conversation, link, message, count))
+
+        self._bulk(ChatMessage, messages(), "messages")
+
+        for conversation, _, last, count in summaries:
+            conversation.message_count = count
+            conversation.last_message_id = last.id
+            conversation.last_message_text = last.text[:Conversation.PREVIEW_LENGTH]
+            conversation.last_message_sender_id = last.sender_id
+            conversation.last_message_seq = last.seq
+            conversation.last_message_at = last.created_at
+        Conversation.objects.bulk_update(
+            conversations,
+            ["message_count", "last_message_id", "last_message_text", "last_message_sender",
+             "last_message_seq", "last_message_at"],
+            batch_size=self.batch_size,
+        )
+        self._bulk(ConversationParticipant, (
+            participant
+            for conversation, link, last, _ in summaries
+            for participant in (
+                ConversationParticipant(conversation_id=conversation.id, user_id=link.operator_id,
+                                        role=Role.OPERATOR, last_message_at=last.created_at),
+                ConversationParticipant(conversation_id=conversation.id, user_id=link.user_id,
+                                        role=Role.USER, last_message_at=last.created_at),
+            )
+        ), "participants")
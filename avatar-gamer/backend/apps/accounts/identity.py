@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from .models import Profile, Role
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "identity:"
+
+
+class IdentityCache:
+    """
+    LRU en memoria con TTL que mapea user_id -> identidad (rol, is_active y
+    nombres) para autenticar sockets sin tocar la base de datos.
+
+    Opcionalmente se respalda en la caché compartida (Redis) para que un
+    worker recién iniciado no tenga que consultar Postgres en cada reconexión.
+    """
+
+    def __init__(self, max_size, ttl, shared=True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_local(self, user_id):
+        """Lectura sin I/O: segura de llamar desde el event loop."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, identity = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return identity
+
+    def get(self, user_id):
+        identity = self.get_local(user_id)
+        if identity is not None or not self.shared:
+            return identity
+        try:
+            identity = cache.get(f"{CACHE_PREFIX}{user_id}")
+        except Exception as exc:
+            logger.warning("No se pudo leer la caché de identidades: %s", exc)
+            return None
+        if identity is not None:
+            self._remember(user_id, identity)
+        return identity
+
+    def set(self, user_id, identity):
+        self._remember(user_id, identity)
+        if self.shared:
+            try:
+                cache.set(f"{CACHE_PREFIX}{user_id}", identity, self.ttl)
+            except Exception as exc:
+                logger.warning("No se pudo escribir la caché de identidades: %s", exc)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if self.shared:
+            try:
+                cache.delete(f"{CACHE_PREFIX}{user_id}")
+            except Exception as exc:
+                logger.warning("No se pudo invalidar la caché de identidades: %s", exc)
+
+    def _remember(self, user_id, identity):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, identity)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+identity_cache = IdentityCache(
+    max_size=settings.IDENTITY_CACHE["MAX_SIZE"],
+    ttl=settings.IDENTITY_CACHE["TTL"],
+    shared=settings.IDENTITY_CACHE["SHARED"],
+)
+
+
+def get_identity(user_id):
+    """
+    Devuelve la identidad del usuario o None si no existe. En un miss se
+    resuelve con una sola query (usuario + perfil) y se crea el perfil si falta.
+    """
+    identity = identity_cache.get(user_id)
+    if identity is not None:
+        return identity
+
+    user = User.objects.select_related("profile").filter(id=user_id).first()
+    if user is None:
+        return None
+
+    profile = getattr(user, "profile", None)
+    if profile is None:
+        profile, _ = Profile.objects.get_or_create(user=user, defaults={"role": Role.USER, "bio": ""})
+
+    identity = {
+        "user_id": user.id,
+        "role": profile.role,
+        "is_active": user.is_active,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+    }
+    identity_cache.set(user_id, identity)
+    return identity
+
+
+def invalidate_identity(user_id):
+    identity_cache.invalidate(user_id)
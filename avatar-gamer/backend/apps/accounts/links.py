@@ -0,0 +1,71 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import OperatorUserLink
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "links:"
+
+
+def _key(user_id):
+    return f"{CACHE_PREFIX}{user_id}"
+
+
+def linked_user_ids_many(user_ids):
+    """
+    Devuelve, para cada usuario, el conjunto de contrapartes vinculadas por
+    OperatorUserLink (usuarios de un operador u operadores de un usuario).
+
+    Se lee primero la caché compartida y solo se consulta la base de datos
+    para los ids que falten, con una sola query.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+
+    try:
+        cached = cache.get_many([_key(uid) for uid in user_ids])
+    except Exception as exc:  # la caché no debe botar la funcionalidad
+        logger.warning("No se pudo leer la caché de vínculos: %s", exc)
+        cached = {}
+
+    result = {uid: set(cached[_key(uid)]) for uid in user_ids if _key(uid) in cached}
+    missing = user_ids - result.keys()
+    if not missing:
+        return result
+
+    fresh = {uid: set() for uid in missing}
+    pairs = OperatorUserLink.objects.filter(
+        Q(operator_id__in=missing) | Q(user_id__in=missing)
+    ).values_list("operator_id", "user_id")
+    for operator_id, user_id in pairs:
+        if operator_id in fresh:
+            fresh[operator_id].add(user_id)
+        if user_id in fresh:
+            fresh[user_id].add(operator_id)
+
+    try:
+        cache.set_many(
+            {_key(uid): sorted(ids) for uid, ids in fresh.items()},
+            settings.LINKS_CACHE_TTL,
+        )
+    except Exception as exc:
+        logger.warning("No se pudo escribir la caché de vínculos: %s", exc)
+
+    result.update(fresh)
+    return result
+
+
+def linked_user_ids(user_id):
+    return linked_user_ids_many([user_id])[user_id]
+
+
+def invalidate_linked_user_ids(*user_ids):
+    try:
+        cache.delete_many([_key(uid) for uid in user_ids])
+    except Exception as exc:
+        logger.warning("No se pudo invalidar la caché de vínculos: %s", exc)
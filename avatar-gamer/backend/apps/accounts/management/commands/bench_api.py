@@ -0,0 +1,94 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.accounts.benchmark import ApiBenchmark, compare, endpoints, pick_actors
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de los endpoints REST más usados sobre el dataset de seed_dataset: "
+        "latencia (p50/p95/p99) y queries por request. Guarda una línea base JSON y "
+        "compara contra una anterior para detectar regresiones entre commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--prefix", default="seed", help="Prefijo usado en seed_dataset.")
+        parser.add_argument("--iterations", type=int, default=30)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--endpoint", action="append", dest="only",
+                            help="Medir solo este endpoint (repetible).")
+        parser.add_argument("--output", help="Archivo JSON donde guardar los resultados.")
+        parser.add_argument("--compare", dest="baseline", help="Línea base JSON contra la cual comparar.")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="Aumento de latencia p50 tolerado (0.2 = 20%%).")
+        parser.add_argument("--enforce-budgets", action="store_true",
+                            help="Perfilador en modo estricto: falla si un endpoint supera su @query_budget.")
+        parser.add_argument("--list", action="store_true", help="Listar los endpoints y salir.")
+
+    def handle(self, *args, **options):
+        actors = pick_actors(options["prefix"])
+        if actors is None or actors["user"] is None:
+            raise CommandError(f'No hay dataset "{options["prefix"]}"; ejecuta primero seed_dataset.')
+
+        if options["list"]:
+            for endpoint in endpoints(actors):
+                self.stdout.write(f"{endpoint.name:<28}{endpoint.method.upper():<6}{endpoint.path}")
+            return
+
+        baseline = None
+        if options["baseline"]:
+            try:
+                with open(options["baseline"]) as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"No se pudo leer la línea base: {exc}")
+
+        self.stdout.write(
+            f'{"endpoint":<28}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"queries":>9}{"budget":>8}  status'
+        )
+
+        def progress(name, result):
+            latency = result["latencyMs"]
+            queries = result["queries"]
+            statuses = ",".join(f"{code}x{count}" for code, count in result["status"].items())
+            self.stdout.write(
+                f'{name:<28}{latency["p50"]:>10}{latency["p95"]:>10}{latency["p99"]:>10}'
+                f'{queries["max"]:>9}{"-" if queries["budget"] is None else queries["budget"]:>8}  {statuses}'
+            )
+
+        results = ApiBenchmark(
+            actors,
+            iterations=options["iterations"],
+            warmup=options["warmup"],
+            only=options["only"],
+            enforce_budgets=options["enforce_budgets"],
+        ).run(progress)
+        over_budget = [name for name, result in results["endpoints"].items() if "budget_exceeded" in result["status"]]
+
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(f'Resultados guardados en {options["output"]}')
+
+        if over_budget:
+            raise CommandError(f'Superan su presupuesto de queries: {", ".join(over_budget)}')
+        if baseline is None:
+            return
+        rows = compare(results, baseline, tolerance=options["tolerance"])
+        self.stdout.write("")
+        self.stdout.write(f'Comparación con {baseline.get("meta", {}).get("revision") or options["baseline"]}:')
+        for row in rows:
+            if row["status"] == "new":
+                self.stdout.write(f'{row["endpoint"]:<28}(sin línea base)')
+                continue
+            line = (
+                f'{row["endpoint"]:<28}{row["before"]:>9} -> {row["after"]:<9} ms ({row["change"]:+}%)  '
+                f'queries {row["queriesBefore"]} -> {row["queriesAfter"]}'
+            )
+            self.stdout.write(self.style.ERROR(line) if row["status"] == "regression" else line)
+
+        regressions = [row["endpoint"] for row in rows if row["status"] == "regression"]
+        if regressions:
+            raise CommandError(f'Regresiones en: {", ".join(regressions)}')
+        self.stdout.write(self.style.SUCCESS("Sin regresiones."))
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.accounts.dataset import DEFAULT_PASSWORD, DatasetSeeder, DatasetSize, delete_dataset, seeded_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un dataset grande y determinista (usuarios, perfiles, vínculos, solicitudes, "
+        "consentimientos, AuthEvent y ChatMessage) con bulk_create, para benchmarks (bench_api)."
+    )
+
+    def add_arguments(self, parser):
+        defaults = DatasetSize()
+        parser.add_argument("--users", type=int, default=defaults.users)
+        parser.add_argument("--operator-ratio", type=float, default=defaults.operator_ratio)
+        parser.add_argument("--admins", type=int, default=defaults.admins)
+        parser.add_argument("--max-links", type=int, default=defaults.max_links_per_user,
+                            help="Máximo de operadores vinculados por usuario.")
+        parser.add_argument("--link-ratio", type=float, default=defaults.link_ratio,
+                            help="Fracción de usuarios con al menos un operador.")
+        parser.add_argument("--auth-events", type=int, default=defaults.auth_events)
+        parser.add_argument("--messages", type=int, default=defaults.messages)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--prefix", default="seed", help="Prefijo de los username generados.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--reset", action="store_true",
+                            help="Borra antes los datos generados con el mismo prefijo.")
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if seeded_users(prefix).exists():
+            if not options["reset"]:
+                raise CommandError(f'Ya existen usuarios "{prefix}-*"; usa --reset para regenerarlos.')
+            self.stdout.write(f'Borrando el dataset "{prefix}"...')
+            delete_dataset(prefix)
+
+        size = DatasetSize(
+            users=options["users"],
+            operator_ratio=options["operator_ratio"],
+            admins=options["admins"],
+            max_links_per_user=options["max_links"],
+            link_ratio=options["link_ratio"],
+            auth_events=options["auth_events"],
+            messages=options["messages"],
+        )
+        if size.users <= size.admins:
+            raise CommandError("--users debe ser mayor que --admins.")
+
+        started = time.monotonic()
+        last = {}
+
+        def progress(name, done):
+            # Un aviso cada ~10 lotes para no inundar la salida.
+            if done - last.get(name, 0) >= options["batch_size"] * 10:
+                last[name] = done
+                self.stdout.write(f"  {name}: {done:,}")
+
+        report = DatasetSeeder(
+            size,
+            seed=options["seed"],
+            prefix=prefix,
+            batch_size=options["batch_size"],
+            progress=progress,
+        ).run()
+
+        for name, count in report.counts.items():
+            self.stdout.write(f"{name:<16}{count:>12,}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Dataset \"{prefix}\" generado en {time.monotonic() - started:.1f}s "
+            f"(contraseña de todos los usuarios: {DEFAULT_PASSWORD})."
+        ))
@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Profile
+from .identity import invalidate_identity
+from .links import invalidate_linked_user_ids
+from .models import OperatorUserLink, Profile
 
 @receiver(post_save, sender=User)
 def ensure_profile(sender, instance, created, **kwargs):
@@ -12,3 +15,24 @@ def ensure_profile(sender, instance, created, **kwargs):
             instance.profile.save()
         else:
             Profile.objects.create(user=instance)
+
+# Los vínculos se crean en LinkRequestUpdateSerializer.update y LinkCreateSerializer.create
+# y se eliminan en UnlinkUserView (o en cascada al borrar usuarios); todos pasan por aquí.
+@receiver(post_save, sender=OperatorUserLink)
+@receiver(post_delete, sender=OperatorUserLink)
+def invalidate_links_cache(sender, instance, **kwargs):
+    operator_id, user_id = instance.operator_id, instance.user_id
+    transaction.on_commit(lambda: invalidate_linked_user_ids(operator_id, user_id))
+
+# Cualquier cambio de usuario o perfil (rol, is_active, nombres) invalida la identidad cacheada de los sockets.
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_identity(sender, instance, **kwargs):
+    user_id = instance.id
+    transaction.on_commit(lambda: invalidate_identity(user_id))
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile_identity(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_identity(user_id))
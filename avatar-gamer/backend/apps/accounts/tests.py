@@ -1,3 +1,68 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import Client, TestCase, override_settings
+from django.urls import resolve
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.metrics.queries import QueryBudgetExceeded
+
+from .benchmark import endpoints, pick_actors
+from .dataset import DatasetSeeder, DatasetSize
+from .models import OperatorUserLink
+
+STRICT_PROFILER = {**settings.QUERY_PROFILER, "ENABLED": True, "STRICT": True}
+
+
+@override_settings(QUERY_PROFILER=STRICT_PROFILER)
+class QueryBudgetTests(TestCase):
+    """Los endpoints con @query_budget, con el perfilador en modo estricto (como en CI)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Dataset chico pero con varios vínculos por operador, para que un N+1 se note.
+        size = DatasetSize(users=40, operator_ratio=0.1, admins=2, auth_events=50, messages=100)
+        DatasetSeeder(size, prefix="test", batch_size=100).run()
+        cls.actors = pick_actors("test")
+
+    def setUp(self):
+        # Cliente nuevo por test: el stack de middlewares se arma con la configuración activa.
+        self.client = Client()
+
+    def _request(self, endpoint):
+        headers = {}
+        if endpoint.actor:
+            headers["HTTP_AUTHORIZATION"] = f"Bearer {AccessToken.for_user(self.actors[endpoint.actor])}"
+        call = getattr(self.client, endpoint.method)
+        if endpoint.method == "get":
+            return call(endpoint.path, **headers)
+        return call(endpoint.path, data=json.dumps(endpoint.body or {}), content_type="application/json", **headers)
+
+    def test_endpoints_stay_within_their_budget(self):
+        budgeted = 0
+        for endpoint in endpoints(self.actors):
+            view = resolve(endpoint.path.split("?")[0]).func
+            budget = getattr(getattr(view, "view_class", view), "query_budget", None)
+            if budget is None:
+                continue
+            budgeted += 1
+            with self.subTest(endpoint=endpoint.name):
+                response = self._request(endpoint)
+                self.assertLess(response.status_code, 400)
+                self.assertEqual(response["X-DB-Query-Budget"], str(budget))
+                self.assertLessEqual(int(response["X-DB-Query-Count"]), budget)
+        self.assertGreater(budgeted, 0)
+
+    def test_linked_users_do_not_add_queries(self):
+        endpoint = next(endpoint for endpoint in endpoints(self.actors) if endpoint.name == "users/linked")
+        before = int(self._request(endpoint)["X-DB-Query-Count"])
+
+        OperatorUserLink.objects.create(operator=self.actors["operator"], user=self.actors["unlinked_user"])
+        self.assertEqual(int(self._request(endpoint)["X-DB-Query-Count"]), before)
+
+    def test_strict_mode_fails_over_budget(self):
+        endpoint = next(endpoint for endpoint in endpoints(self.actors) if endpoint.name == "admin/users")
+        with mock.patch.object(resolve(endpoint.path).func.view_class, "query_budget", 0):
+            with self.assertRaises(QueryBudgetExceeded), self.assertLogs("apps.metrics.queries", "WARNING"):
+                self._request(endpoint)
@@ -29,15 +29,17 @@ from .models import (
 )
 from django.contrib.auth.models import User
 from apps.chat.models import ChatMessage
+from apps.metrics.queries import query_budget
 from .ai_service import send_message_to_ai, AIServiceError
 
 # Vista para probar la api de login
+@query_budget(7)
 class LoginView(APIView):
     authentication_classes = []              # sin JWT aún
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
-        s = LoginSerializer(data=request.data)
+        s = LoginSerializer(data=request.data, context={"request": request})
         s.is_valid(raise_exception=True)
         user = s.validated_data['user']
         return Response({
@@ -51,6 +53,7 @@ class LoginView(APIView):
             }
         }, status=status.HTTP_200_OK)
 
+@query_budget(2)
 class MeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -122,6 +125,7 @@ class SafeTokenObtainPairSerializer(TokenObtainPairSerializer):
             
             raise e
 
+@query_budget(7)
 class SafeTokenObtainPairView(TokenObtainPairView):
     serializer_class = SafeTokenObtainPairSerializer
 
@@ -135,6 +139,7 @@ class OperatorPing(APIView):
     def get(self, request):
         return Response({"ok": True, "who": "operator"})
     
+@query_budget(3)
 class LinkedUsersView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsOperator]
     def get (self, request):
@@ -162,6 +167,7 @@ class UnlinkUserView(APIView):
 
 # Vistas para la gestión de solicitudes de vinculación
 
+@query_budget(7)
 class LinkRequestCreateView(APIView):
     """Vista para crear solicitudes de vinculación entre operadores y usuarios"""
     permission_classes = [permissions.IsAuthenticated, IsOperator]
@@ -177,13 +183,14 @@ class LinkRequestCreateView(APIView):
             "status": link_request.status
         }, status=status.HTTP_201_CREATED)
 
+@query_budget(3)
 class LinkRequestOperatorListView(APIView):
     """Vista para que los operadores vean las solicitudes de vinculación que han enviado"""
     permission_classes = [permissions.IsAuthenticated, IsOperator]
     
     def get(self, request):
         # Filtrar solicitudes enviadas por este operador
-        link_requests = LinkRequest.objects.filter(operator=request.user)
+        link_requests = LinkRequest.objects.filter(operator=request.user).select_related('operator', 'user')
         
         # Filtrar por estado si se especifica
         request_status = request.query_params.get('status')
@@ -199,13 +206,14 @@ class LinkRequestOperatorListView(APIView):
             "results": serializer.data
         })
 
+@query_budget(3)
 class LinkRequestUserListView(APIView):
     """Vista para que los usuarios vean las solicitudes de vinculación recibidas"""
     permission_classes = [permissions.IsAuthenticated, IsEndUser]
     
     def get(self, request):
         # Filtrar solicitudes recibidas por este usuario
-        link_requests = LinkRequest.objects.filter(user=request.user)
+        link_requests = LinkRequest.objects.filter(user=request.user).select_related('operator', 'user')
         
         # Filtrar por estado si se especifica
         request_status = request.query_params.get('status')
@@ -221,15 +229,16 @@ class LinkRequestUserListView(APIView):
             "results": serializer.data
         })
 
+@query_budget(3)
 class LinkRequestDetailView(APIView):
     """Vista para obtener, actualizar o eliminar una solicitud de vinculación específica"""
     permission_classes = [permissions.IsAuthenticated]
     
     def get_object(self, pk):
         # Solo permitir acceso a solicitudes donde el usuario es parte (operador o usuario)
-        obj = get_object_or_404(LinkRequest, pk=pk)
+        obj = get_object_or_404(LinkRequest.objects.select_related('operator', 'user'), pk=pk)
         
-        if obj.operator != self.request.user and obj.user != self.request.user:
+        if obj.operator_id != self.request.user.id and obj.user_id != self.request.user.id:
             self.permission_denied(self.request)
             
         return obj
@@ -265,6 +274,7 @@ class LinkRequestResponseView(APIView):
         
         return Response(response_data)
 
+@query_budget(3)
 class LinkedOperatorsView(APIView):
     """Vista para que los usuarios obtengan la lista de operadores vinculados a ellos"""
     permission_classes = [permissions.IsAuthenticated, IsEndUser]
@@ -330,6 +340,7 @@ class OperatorDetailView(APIView):
             )
 
 
+@query_budget(4)
 class AdminUserListCreateView(APIView):
     """Listado y creación de usuarios para administradores."""
     permission_classes = [permissions.IsAuthenticated, IsAdmin]
@@ -374,6 +385,7 @@ class AdminUserListCreateView(APIView):
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
 
+@query_budget(8)
 class AdminMetricsView(APIView):
     """Panel de métricas para administradores."""
     permission_classes = [permissions.IsAuthenticated, IsAdmin]
@@ -384,81 +396,70 @@ class AdminMetricsView(APIView):
         last_7d = now - timedelta(days=7)
         last_30d = now - timedelta(days=30)
 
-        # Obtener todos los usuarios y sus perfiles
-        total_users = User.objects.count()
-        # Un usuario está activo si tanto su cuenta de User como su Profile están activos
-        active_users = User.objects.filter(
-            is_active=True,
-            profile__is_active=True
-        ).count()
-        # Un usuario está inactivo si su cuenta de User o su Profile están inactivos
-        inactive_users = User.objects.filter(
-            models.Q(is_active=False) | 
-            models.Q(profile__is_active=False)
-        ).count()
-        dau = (
-            AuthEvent.objects.filter(
-                success=True,
-                created_at__gte=last_24h,
-                user__isnull=False,
-            )
-            .values("user_id")
-            .distinct()
-            .count()
+        # Un aggregate por tabla con COUNT(...) FILTER (WHERE ...) en vez de un COUNT por métrica.
+        users = User.objects.aggregate(
+            total=models.Count("id"),
+            # Un usuario está activo si tanto su cuenta de User como su Profile están activos
+            active=models.Count("id", filter=models.Q(is_active=True, profile__is_active=True)),
+            # Un usuario está inactivo si su cuenta de User o su Profile están inactivos
+            inactive=models.Count("id", filter=models.Q(is_active=False) | models.Q(profile__is_active=False)),
+            new_last_7=models.Count("id", filter=models.Q(date_joined__gte=last_7d)),
         )
-        wau = (
-            AuthEvent.objects.filter(
-                success=True,
-                created_at__gte=last_7d,
-                user__isnull=False,
-            )
-            .values("user_id")
-            .distinct()
-            .count()
+        total_users = users["total"]
+        active_users = users["active"]
+        inactive_users = users["inactive"]
+        new_users_last_7_days = users["new_last_7"]
+
+        # Una sola lectura de los últimos 30 días cubre DAU/WAU/MAU y las métricas de 7 días.
+        successful = models.Q(success=True, user__isnull=False)
+        auth = AuthEvent.objects.filter(created_at__gte=last_30d).aggregate(
+            dau=models.Count("user_id", distinct=True, filter=successful & models.Q(created_at__gte=last_24h)),
+            wau=models.Count("user_id", distinct=True, filter=successful & models.Q(created_at__gte=last_7d)),
+            mau=models.Count("user_id", distinct=True, filter=successful),
+            total_last_7=models.Count("id", filter=models.Q(created_at__gte=last_7d)),
+            failed_last_7=models.Count("id", filter=models.Q(created_at__gte=last_7d, success=False)),
+            success_last_7=models.Count("id", filter=models.Q(created_at__gte=last_7d, success=True)),
+            distinct_users_last_7=models.Count(
+                "user_id", distinct=True, filter=models.Q(created_at__gte=last_7d, user__isnull=False)
+            ),
         )
-        mau = (
-            AuthEvent.objects.filter(
-                success=True,
-                created_at__gte=last_30d,
-                user__isnull=False,
-            )
-            .values("user_id")
-            .distinct()
-            .count()
+        dau = auth["dau"]
+        wau = auth["wau"]
+        mau = auth["mau"]
+        # Sesiones = inicios de sesión exitosos (mismo criterio que success_last_7).
+        total_sessions_last_7_days = auth["success_last_7"]
+        total_auth_events = auth["total_last_7"]
+        failed_auth_events = auth["failed_last_7"]
+        success_auth_events = auth["success_last_7"]
+        distinct_users_last_7 = auth["distinct_users_last_7"]
+
+        link_requests = LinkRequest.objects.filter(
+            models.Q(created_at__gte=last_30d) | models.Q(status=LinkRequestStatus.PENDING)
+        ).aggregate(
+            total_last_30=models.Count("id", filter=models.Q(created_at__gte=last_30d)),
+            approved_last_30=models.Count(
+                "id", filter=models.Q(created_at__gte=last_30d, status=LinkRequestStatus.APPROVED)
+            ),
+            pending=models.Count("id", filter=models.Q(status=LinkRequestStatus.PENDING)),
         )
-        new_users_last_7_days = User.objects.filter(date_joined__gte=last_7d).count()
-        total_sessions_last_7_days = AuthEvent.objects.filter(
-            success=True, created_at__gte=last_7d
-        ).count()
-
-        link_requests_last_30 = LinkRequest.objects.filter(created_at__gte=last_30d)
-        total_link_requests_last_30 = link_requests_last_30.count()
-        approved_link_requests_last_30 = link_requests_last_30.filter(
-            status=LinkRequestStatus.APPROVED
-        ).count()
-        pending_link_requests = LinkRequest.objects.filter(
-            status=LinkRequestStatus.PENDING
-        ).count()
-        active_links_total = OperatorUserLink.objects.count()
-        new_links_last_30 = OperatorUserLink.objects.filter(
-            created_at__gte=last_30d
-        ).count()
-        messages_last_7 = ChatMessage.objects.filter(created_at__gte=last_7d)
-        messages_last_7_days = messages_last_7.count()
-        conversations_last_7_days = (
-            messages_last_7.values("conversation_id").distinct().count()
+        total_link_requests_last_30 = link_requests["total_last_30"]
+        approved_link_requests_last_30 = link_requests["approved_last_30"]
+        pending_link_requests = link_requests["pending"]
+
+        links = OperatorUserLink.objects.aggregate(
+            total=models.Count("id"),
+            new_last_30=models.Count("id", filter=models.Q(created_at__gte=last_30d)),
         )
+        active_links_total = links["total"]
+        new_links_last_30 = links["new_last_30"]
 
-        auth_events_last_7 = AuthEvent.objects.filter(created_at__gte=last_7d)
-        total_auth_events = auth_events_last_7.count()
-        failed_auth_events = auth_events_last_7.filter(success=False).count()
-        success_auth_events = auth_events_last_7.filter(success=True).count()
-        distinct_users_last_7 = (
-            auth_events_last_7.filter(user__isnull=False)
-            .values("user_id")
-            .distinct()
-            .count()
+        messages = ChatMessage.objects.filter(created_at__gte=last_7d).aggregate(
+            total=models.Count("id"),
+            conversations=models.Count("conversation_id", distinct=True),
         )
+        messages_last_7_days = messages["total"]
+        conversations_last_7_days = messages["conversations"]
+
         failure_rate = (
             round(failed_auth_events / total_auth_events, 4)
             if total_auth_events
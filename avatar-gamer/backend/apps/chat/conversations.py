@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+
+from .instrumentation import observe_conversation_cache
+from .models import Conversation, ConversationParticipant
+
+VALID_ROLES = frozenset({'admin', 'operator', 'user'})
+
+
+def parse_conversation_id(conversation_id: str) -> Optional[List[Tuple[str, int]]]:
+    """
+    Split ``conversation:<role>-<id>:<role>-<id>`` into its two participants.
+
+    Returns ``None`` for anything that was not produced by
+    ``sockets._build_conversation_id``.
+    """
+    if not isinstance(conversation_id, str):
+        return None
+
+    parts = conversation_id.split(':')
+    if len(parts) != 3 or parts[0] != 'conversation':
+        return None
+
+    participants: List[Tuple[str, int]] = []
+    for part in parts[1:]:
+        role, _, identifier = part.partition('-')
+        if role not in VALID_ROLES or not identifier.isdigit():
+            return None
+        participants.append((role, int(identifier)))
+    return participants
+
+
+class ConversationCache:
+    """
+    In-process LRU mapping conversation keys to ``Conversation`` ids.
+
+    A key never changes its id, so entries need no TTL. Only hits that exist
+    in the database are stored: a key another worker has just created is
+    found on the next lookup.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[int]:
+        """Lookup without I/O: safe to call from the event loop."""
+        with self._lock:
+            pk = self._entries.get(key)
+            if pk is not None:
+                self._entries.move_to_end(key)
+        observe_conversation_cache(pk is not None)
+        return pk
+
+    def set(self, key: str, pk: int) -> None:
+        with self._lock:
+            self._entries[key] = pk
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+conversation_cache = ConversationCache(max_size=settings.CHAT_CONFIG["CONVERSATION_CACHE_SIZE"])
+
+
+def _create(key: str) -> Conversation:
+    """Create the conversation and its participants; another writer may win the race."""
+    try:
+        with transaction.atomic():
+            conversation = Conversation.objects.create(key=key)
+            participants = {user_id: role for role, user_id in parse_conversation_id(key) or []}
+            existing = set(
+                get_user_model().objects.filter(id__in=list(participants)).values_list('id', flat=True)
+            )
+            ConversationParticipant.objects.bulk_create([
+                ConversationParticipant(
+                    conversation=conversation,
+                    user_id=user_id,
+                    role=role,
+                    last_message_at=conversation.created_at,
+                )
+                for user_id, role in participants.items()
+                if user_id in existing
+            ])
+            return conversation
+    except IntegrityError:
+        return Conversation.objects.get(key=key)
+
+
+def resolve_conversation(key: str, *, create: bool = False) -> Optional[int]:
+    """
+    Id of the conversation with external ``key``.
+
+    Served from ``conversation_cache`` when possible. With ``create`` a
+    missing conversation is created (with its participants, so it shows up in
+    their inboxes); otherwise ``None`` means it has no messages yet.
+    """
+    pk = conversation_cache.get(key)
+    return pk if pk is not None else load_conversation(key, create=create)
+
+
+def load_conversation(key: str, *, create: bool = False) -> Optional[int]:
+    """Database side of ``resolve_conversation``; fills the cache."""
+    pk = Conversation.objects.filter(key=key).values_list('id', flat=True).first()
+    if pk is None and create:
+        pk = _create(key).id
+    if pk is not None:
+        conversation_cache.set(key, pk)
+    return pk
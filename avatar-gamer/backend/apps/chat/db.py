@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .instrumentation import observe_db_call
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+def _discard_broken_connections() -> None:
+    # Same health check Django runs between requests, minus the CONN_MAX_AGE
+    # expiry: pool threads keep their connection for as long as it works.
+    for connection in connections.all(initialized_only=True):
+        if connection.errors_occurred:
+            if connection.is_usable():
+                connection.errors_occurred = False
+            else:
+                connection.close()
+
+
+class DatabaseExecutor:
+    """
+    Bounded thread pool for ORM calls made from Socket.IO handlers.
+
+    ``sync_to_async`` defaults to ``thread_sensitive=True``, which funnels
+    every socket's database work through one shared thread. This pool runs up
+    to ``max_workers`` calls in parallel, each thread holding its own Django
+    connection, so ``max_workers`` should match the per-process share of the
+    Postgres connection budget. Calls beyond that wait in the pool's queue;
+    queue depth and wait time are exported as metrics (see ``instrumentation``).
+    """
+
+    def __init__(self, *, max_workers: int, slow_wait_ms: int) -> None:
+        self.max_workers = max_workers
+        self.slow_wait = slow_wait_ms / 1000
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chat-db')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        submitted = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+
+        def _job() -> T:
+            waited = time.perf_counter() - submitted
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            if waited > self.slow_wait:
+                logger.warning(
+                    'Socket DB call %s waited %.1f ms for a pool thread.',
+                    getattr(func, '__qualname__', func), waited * 1000,
+                )
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _discard_broken_connections()
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                observe_db_call(waited, time.perf_counter() - started)
+
+        return await sync_to_async(_job, thread_sensitive=False, executor=self._pool)()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            completed = self._completed
+            return {
+                'maxWorkers': self.max_workers,
+                'queueDepth': self._queued,
+                'running': self._running,
+                'completed': completed,
+                'waitAvgMs': round(self._wait_total / completed * 1000, 3) if completed else 0.0,
+                'waitMaxMs': round(self._wait_max * 1000, 3),
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+_executor: Optional[DatabaseExecutor] = None
+
+
+def get_executor() -> DatabaseExecutor:
+    global _executor
+    if _executor is None:
+        _executor = DatabaseExecutor(
+            max_workers=settings.CHAT_CONFIG["DB_EXECUTOR_WORKERS"],
+            slow_wait_ms=settings.CHAT_CONFIG["DB_EXECUTOR_SLOW_WAIT_MS"],
+        )
+    return _executor
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking ORM callable on the socket DB executor."""
+    return await get_executor().run(func, *args, **kwargs)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+
+def _key(sender_id: int, client_message_id: str) -> str:
+    return f'chat:dedupe:{sender_id}:{client_message_id}'
+
+
+async def claim(sender_id: int, client_message_id: str, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Reserve ``(sender, clientMessageId)`` for ``message``.
+
+    Returns ``None`` when the reservation succeeded, or the message that
+    already owns the key when this is a retry. Redis failures are treated as a
+    successful reservation; the database constraint is the backstop.
+    """
+    key = _key(sender_id, client_message_id)
+    try:
+        redis = get_redis()
+        if await redis.set(key, json.dumps(message), nx=True, ex=settings.CHAT_CONFIG["DEDUPE_TTL"]):
+            return None
+        existing = await redis.get(key)
+    except RedisError as exc:
+        logger.warning('Dedupe check failed for %s: %s', key, exc)
+        return None
+    return json.loads(existing) if existing else None
+
+
+async def remember(sender_id: int, client_message_id: str, message: Dict[str, Any]) -> None:
+    """Point the key at the numbered message, or at the stored row after a database duplicate."""
+    try:
+        await get_redis().set(
+            _key(sender_id, client_message_id),
+            json.dumps(message),
+            ex=settings.CHAT_CONFIG["DEDUPE_TTL"],
+        )
+    except RedisError as exc:
+        logger.warning('Dedupe update failed for %s/%s: %s', sender_id, client_message_id, exc)
+
+
+async def release(sender_id: int, client_message_id: str) -> None:
+    """Drop a reservation whose message could not be stored so a retry can succeed."""
+    try:
+        await get_redis().delete(_key(sender_id, client_message_id))
+    except RedisError as exc:
+        logger.warning('Dedupe release failed for %s/%s: %s', sender_id, client_message_id, exc)
+
+
+def forget_sync(senders_and_ids: Iterable[Tuple[int, str]]) -> None:
+    """Drop reservations that point at rewritten messages; blocking."""
+    keys = [_key(sender_id, client_message_id) for sender_id, client_message_id in senders_and_ids]
+    try:
+        for start in range(0, len(keys), 1000):
+            get_sync_redis().delete(*keys[start:start + 1000])
+    except RedisError as exc:
+        logger.warning('Dedupe cleanup failed for %s keys: %s', len(keys), exc)
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = 'chat:history:'
+
+
+def _key(conversation_id: str) -> str:
+    return f'{_KEY_PREFIX}{conversation_id}'
+
+
+def _capacity() -> int:
+    return settings.CHAT_CONFIG["HISTORY_CACHE_SIZE"]
+
+
+# Merges a database snapshot (ARGV[3..]) into whatever the buffer already
+# holds, by seq, and keeps only the newest run of consecutive seqs (at most
+# ARGV[1] items): a message neither side has seen must not leave a hole.
+_FILL_SCRIPT = """
+local by_seq = {}
+local seqs = {}
+local function add(item)
+    local seq = tonumber(cjson.decode(item)['seq'])
+    if seq and not by_seq[seq] then
+        by_seq[seq] = item
+        table.insert(seqs, seq)
+    end
+end
+for _, item in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do
+    add(item)
+end
+for i = 3, #ARGV do
+    add(ARGV[i])
+end
+redis.call('DEL', KEYS[1])
+if #seqs == 0 then
+    return 0
+end
+table.sort(seqs)
+local first = #seqs
+while first > 1 and seqs[first - 1] == seqs[first] - 1 and #seqs - first + 1 < tonumber(ARGV[1]) do
+    first = first - 1
+end
+for i = first, #seqs do
+    redis.call('RPUSH', KEYS[1], by_seq[seqs[i]])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return #seqs - first + 1
+"""
+
+# Pushes ARGV[1] (seq ARGV[2]) only when it directly follows the newest cached
+# message. Anything else would leave a hole, so the buffer is dropped and
+# seeded again from the database on the next read.
+_APPEND_SCRIPT = """
+local last = redis.call('LINDEX', KEYS[1], -1)
+if not last then
+    return 0
+end
+local seq = tonumber(ARGV[2])
+local newest = tonumber(cjson.decode(last)['seq'])
+if newest and seq == newest + 1 then
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+    redis.call('LTRIM', KEYS[1], -tonumber(ARGV[3]), -1)
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return 1
+end
+if newest and seq <= newest then
+    for _, item in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do
+        if tonumber(cjson.decode(item)['seq']) == seq then
+            return 0
+        end
+    end
+end
+redis.call('DEL', KEYS[1])
+return -1
+"""
+
+
+async def get_recent(conversation_id: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Return the cached tail of a conversation in chronological order.
+
+    ``None`` means a miss (or Redis being unavailable) and the caller should
+    fall back to the database.
+    """
+    try:
+        raw = await get_redis().lrange(_key(conversation_id), 0, -1)
+    except RedisError as exc:
+        logger.warning('History cache read failed for %s: %s', conversation_id, exc)
+        return None
+
+    if not raw:
+        return None
+    return [json.loads(item) for item in raw]
+
+
+async def fill(conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+    """
+    Seed the buffer after a database read.
+
+    The snapshot is merged by ``seq`` with what other workers appended since
+    the read, and only the newest run of consecutive seqs is kept, so the
+    buffer never has holes: a message that is in neither (e.g. still in a
+    write-behind buffer) just makes the buffer start after it.
+    """
+    if not messages:
+        return
+
+    try:
+        await get_redis().eval(
+            _FILL_SCRIPT,
+            1,
+            _key(conversation_id),
+            _capacity(),
+            settings.CHAT_CONFIG["HISTORY_CACHE_TTL"],
+            *(json.dumps(message) for message in messages[-_capacity():]),
+        )
+    except RedisError as exc:
+        logger.warning('History cache fill failed for %s: %s', conversation_id, exc)
+
+
+async def append(conversation_id: str, message: Dict[str, Any]) -> None:
+    """
+    Write a freshly stored message through to the buffer if it is cached.
+
+    A message that does not follow the newest cached ``seq`` drops the buffer
+    instead of leaving a hole in it.
+    """
+    try:
+        await get_redis().eval(
+            _APPEND_SCRIPT,
+            1,
+            _key(conversation_id),
+            json.dumps(message),
+            message['seq'],
+            _capacity(),
+            settings.CHAT_CONFIG["HISTORY_CACHE_TTL"],
+        )
+    except RedisError as exc:
+        logger.warning('History cache append failed for %s: %s', conversation_id, exc)
+
+
+def invalidate_sync(conversation_ids: Iterable[str]) -> None:
+    """Drop cached tails (e.g. after stored messages were rewritten); blocking."""
+    keys = [_key(conversation_id) for conversation_id in conversation_ids]
+    try:
+        for start in range(0, len(keys), 1000):
+            get_sync_redis().delete(*keys[start:start + 1000])
+    except RedisError as exc:
+        logger.warning('History cache invalidation failed for %s conversations: %s', len(keys), exc)
@@ -0,0 +1,136 @@
+"""
+Metrics for the chat Socket.IO server (exposed by ``apps.metrics``).
+
+Every ``@sio.on`` handler is timed in one place, ``_trigger_event``, so new
+handlers are covered without decorating them. Socket and room counts and
+the DB executor pool state are read at scrape time by a collector instead
+of being tracked on every connect.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+
+from socketio.exceptions import ConnectionRefusedError
+
+from apps.metrics.registry import SIZE_BUCKETS, Sample, enabled, get_registry
+
+ENABLED = enabled()
+
+_registry = get_registry()
+EVENT_DURATION = _registry.histogram(
+    'socketio_event_duration_seconds',
+    'Time spent in Socket.IO event handlers.',
+    ('namespace', 'event'),
+)
+EVENTS = _registry.counter(
+    'socketio_events_total',
+    'Socket.IO events handled, by outcome (ok, error, refused).',
+    ('namespace', 'event', 'outcome'),
+)
+EMIT_BYTES = _registry.histogram(
+    'socketio_emit_bytes',
+    'Encoded size of emitted packets (measured once per emit and wire format).',
+    ('event', 'format'),
+    buckets=SIZE_BUCKETS,
+)
+EMIT_DELIVERIES = _registry.counter(
+    'socketio_emit_deliveries_total',
+    'Packets handed to sockets connected to this process.',
+    ('event',),
+)
+DB_WAIT = _registry.histogram(
+    'chat_db_executor_wait_seconds',
+    'Time ORM calls from socket handlers waited for a pool thread.',
+)
+DB_CALL = _registry.histogram(
+    'chat_db_call_duration_seconds',
+    'Time spent running ORM calls on the socket DB executor.',
+)
+CONVERSATION_CACHE = _registry.counter(
+    'chat_conversation_cache_total',
+    'Conversation key lookups served from the in-process cache (hit) or not (miss).',
+    ('result',),
+)
+WRITE_BEHIND_ROWS = _registry.counter(
+    'chat_write_behind_rows_total',
+    'Write-behind rows by outcome (inserted, duplicate, renumbered, rejected).',
+    ('outcome',),
+)
+
+
+def observe_emit(event: str, wire_format: str, size: int, deliveries: int) -> None:
+    if ENABLED:
+        EMIT_BYTES.labels(event, wire_format).observe(size)
+        EMIT_DELIVERIES.labels(event).inc(deliveries)
+
+
+def observe_db_call(waited: float, duration: float) -> None:
+    if ENABLED:
+        DB_WAIT.observe(waited)
+        DB_CALL.observe(duration)
+
+
+def observe_conversation_cache(hit: bool) -> None:
+    if ENABLED:
+        CONVERSATION_CACHE.labels('hit' if hit else 'miss').inc()
+
+
+def observe_write_behind(outcome: str, count: int) -> None:
+    if ENABLED and count:
+        WRITE_BEHIND_ROWS.labels(outcome).inc(count)
+
+
+class InstrumentedServerMixin:
+    """Times every event handler; events without a handler share one label."""
+
+    async def _trigger_event(self, event, namespace, *args):
+        if not ENABLED:
+            return await super()._trigger_event(event, namespace, *args)
+
+        namespace = namespace or '/'
+        label = event if event in self.handlers.get(namespace, {}) else 'unhandled'
+        outcome = 'ok'
+        started = time.perf_counter()
+        try:
+            return await super()._trigger_event(event, namespace, *args)
+        except ConnectionRefusedError:
+            outcome = 'refused'
+            raise
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            EVENT_DURATION.labels(namespace, label).observe(time.perf_counter() - started)
+            EVENTS.labels(namespace, label, outcome).inc()
+
+
+def register_server_collector(server, executor_stats) -> None:
+    """Expose socket, room and DB pool gauges for ``server`` on every scrape."""
+
+    def collect() -> Iterable[Tuple[str, str, str, List[Sample]]]:
+        sockets: List[Sample] = []
+        rooms: List[Sample] = []
+        for namespace, namespace_rooms in list(server.manager.rooms.items()):
+            connected = len(namespace_rooms.get(None) or ())
+            labels = (('namespace', namespace),)
+            sockets.append(('', labels, connected))
+            # Each socket also has a private room named after its sid.
+            rooms.append(('', labels, max(0, len(namespace_rooms) - 1 - connected)))
+        yield ('socketio_connected_sockets', 'gauge', 'Sockets connected to this process.', sockets)
+        yield ('socketio_rooms', 'gauge', 'Named rooms with members on this process.', rooms)
+        yield (
+            'socketio_msgpack_clients', 'gauge', 'Engine.IO clients using the msgpack wire format.',
+            [('', (), len(getattr(server, '_msgpack_eio_sids', ())))],
+        )
+
+        stats: Dict[str, Any] = executor_stats()
+        for name, key, documentation in (
+            ('chat_db_executor_max_workers', 'maxWorkers', 'Threads in the socket DB executor.'),
+            ('chat_db_executor_running', 'running', 'ORM calls running on the socket DB executor.'),
+            ('chat_db_executor_queue_depth', 'queueDepth', 'ORM calls waiting for a socket DB executor thread.'),
+        ):
+            yield (name, 'gauge', documentation, [('', (), stats[key])])
+
+    if ENABLED:
+        get_registry().register_collector(collect)
@@ -0,0 +1,306 @@
+"""
+Load generator for the chat Socket.IO server (used by ``manage.py chat_loadtest``).
+
+Every simulated pair is an operator and a linked user talking in their own
+conversation. When more than one server is available the two sockets of a
+pair are connected to different nodes, so every delivery crosses the Redis
+manager.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.error import URLError
+from urllib.request import urlopen
+
+import socketio
+
+from apps.metrics.latency import summarize
+
+
+@dataclass
+class Participant:
+    user_id: int
+    role: str
+    token: str
+
+
+def conversation_for(first: Participant, second: Participant) -> str:
+    """Same id ``sockets._build_conversation_id`` derives for the pair."""
+    keys = sorted(f'{participant.role}-{participant.user_id}' for participant in (first, second))
+    return f'conversation:{keys[0]}:{keys[1]}'
+
+
+@dataclass
+class Scenario:
+    urls: List[str]
+    pairs: List[Tuple[Participant, Participant]]
+    duration: float
+    rate: float
+    mix: Dict[str, float]
+    ramp_up: float = 5.0
+    serializer: Optional[str] = None
+
+
+@dataclass
+class Results:
+    connect: List[float] = field(default_factory=list)
+    reconnect: List[float] = field(default_factory=list)
+    join: List[float] = field(default_factory=list)
+    ack: List[float] = field(default_factory=list)
+    fanout: List[float] = field(default_factory=list)
+    cross_node_fanout: List[float] = field(default_factory=list)
+    counters: Counter = field(default_factory=Counter)
+    started: float = 0.0
+    finished: float = 0.0
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = max(self.finished - self.started, 1e-9)
+        return {
+            'elapsedSeconds': round(elapsed, 2),
+            'connectMs': summarize(self.connect),
+            'reconnectMs': summarize(self.reconnect),
+            'joinMs': summarize(self.join),
+            'ackMs': summarize(self.ack),
+            'fanoutMs': summarize(self.fanout),
+            'crossNodeFanoutMs': summarize(self.cross_node_fanout),
+            'throughput': {
+                'sentPerSecond': round(self.counters['sent'] / elapsed, 1),
+                'deliveredPerSecond': round(self.counters['delivered'] / elapsed, 1),
+            },
+            'counters': dict(self.counters),
+        }
+
+
+class _Client:
+    """One simulated socket."""
+
+    def __init__(self, runner: 'LoadTest', me: Participant, url: str, conversation_id: str) -> None:
+        self.runner = runner
+        self.me = me
+        self.url = url
+        self.conversation_id = conversation_id
+        self.last_seq = 0
+        self.sio = self._build()
+        self._history = asyncio.Event()
+
+    def _build(self) -> socketio.AsyncClient:
+        kwargs = {'reconnection': False}
+        if self.runner.scenario.serializer:
+            kwargs['serializer'] = self.runner.scenario.serializer
+        client = socketio.AsyncClient(**kwargs)
+        client.on('chat:message', self._on_message)
+        client.on('chat:history', self._on_history)
+        client.on('chat:sync', self._on_history)
+        client.on('chat:throttled', self._on_throttled)
+        return client
+
+    def _connect_url(self) -> str:
+        if self.runner.scenario.serializer:
+            return f'{self.url}?serializer={self.runner.scenario.serializer}'
+        return self.url
+
+    async def connect(self) -> float:
+        started = time.perf_counter()
+        await self.sio.connect(
+            self._connect_url(),
+            auth={'token': self.me.token},
+            transports=['websocket'],
+            wait_timeout=30,
+        )
+        return time.perf_counter() - started
+
+    async def join(self, event: str = 'chat:join') -> None:
+        self._history.clear()
+        payload: Dict[str, Any] = {'conversationId': self.conversation_id}
+        if event == 'chat:sync':
+            payload['lastSeq'] = self.last_seq
+        started = time.perf_counter()
+        await self.sio.emit(event, payload)
+        try:
+            await asyncio.wait_for(self._history.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            self.runner.results.counters['join_timeouts'] += 1
+            return
+        self.runner.results.join.append(time.perf_counter() - started)
+
+    async def send(self) -> None:
+        client_message_id = f'lt-{uuid.uuid4().hex}'
+        sent = time.perf_counter()
+        self.runner.in_flight[client_message_id] = (sent, self.url)
+        self.runner.results.counters['sent'] += 1
+        try:
+            ack = await self.sio.call(
+                'chat:message',
+                {'conversationId': self.conversation_id, 'text': 'load test', 'clientMessageId': client_message_id},
+                timeout=10,
+            )
+        except socketio.exceptions.TimeoutError:
+            self.runner.results.counters['ack_timeouts'] += 1
+            return
+        if ack and ack.get('ok'):
+            self.runner.results.ack.append(time.perf_counter() - sent)
+        else:
+            self.runner.in_flight.pop(client_message_id, None)
+            self.runner.results.counters[f"rejected_{(ack or {}).get('error', 'unknown')}"] += 1
+
+    async def reconnect(self) -> None:
+        await self.sio.disconnect()
+        self.sio = self._build()
+        started = time.perf_counter()
+        await self.connect()
+        await self.join('chat:sync')
+        self.runner.results.reconnect.append(time.perf_counter() - started)
+        self.runner.results.counters['reconnects'] += 1
+
+    async def _on_message(self, message: Dict[str, Any]) -> None:
+        self.last_seq = max(self.last_seq, message.get('seq') or 0)
+        if message.get('senderId') == self.me.user_id:
+            return
+        entry = self.runner.in_flight.pop(message.get('clientMessageId'), None)
+        if entry is None:
+            return
+        sent, origin = entry
+        latency = time.perf_counter() - sent
+        self.runner.results.fanout.append(latency)
+        if origin != self.url:
+            self.runner.results.cross_node_fanout.append(latency)
+        self.runner.results.counters['delivered'] += 1
+
+    async def _on_history(self, payload: Any) -> None:
+        messages = payload if isinstance(payload, list) else (payload or {}).get('messages', [])
+        for message in messages:
+            self.last_seq = max(self.last_seq, message.get('seq') or 0)
+        self._history.set()
+
+    async def _on_throttled(self, payload: Dict[str, Any]) -> None:
+        self.runner.results.counters['throttled'] += 1
+
+
+class LoadTest:
+    def __init__(self, scenario: Scenario) -> None:
+        self.scenario = scenario
+        self.results = Results()
+        self.in_flight: Dict[str, Tuple[float, str]] = {}
+        actions, weights = zip(*scenario.mix.items())
+        self._actions: Tuple[str, ...] = actions
+        self._weights: Tuple[float, ...] = weights
+
+    def _clients(self) -> List[_Client]:
+        urls = self.scenario.urls
+        clients = []
+        for index, (operator, user) in enumerate(self.scenario.pairs):
+            conversation_id = conversation_for(operator, user)
+            clients.append(_Client(self, operator, urls[index % len(urls)], conversation_id))
+            clients.append(_Client(self, user, urls[(index + 1) % len(urls)], conversation_id))
+        return clients
+
+    async def _drive(self, client: _Client, deadline: float) -> None:
+        interval = 1 / self.scenario.rate
+        await asyncio.sleep(random.uniform(0, interval))
+        while time.perf_counter() < deadline:
+            action = random.choices(self._actions, self._weights)[0]
+            try:
+                if action == 'message':
+                    await client.send()
+                elif action == 'join':
+                    await client.join()
+                elif action == 'reconnect':
+                    await client.reconnect()
+            except Exception as exc:  # keep the remaining clients running
+                self.results.counters[f'errors_{action}'] += 1
+                self.results.counters[f'error:{type(exc).__name__}'] += 1
+            await asyncio.sleep(interval)
+
+    async def run(self) -> Dict[str, Any]:
+        clients = self._clients()
+        delay = self.scenario.ramp_up / max(len(clients), 1)
+
+        async def _open(client: _Client, index: int) -> Optional[_Client]:
+            await asyncio.sleep(index * delay)
+            try:
+                self.results.connect.append(await client.connect())
+                await client.join()
+                return client
+            except Exception as exc:
+                self.results.counters['connect_errors'] += 1
+                self.results.counters[f'error:{type(exc).__name__}'] += 1
+                return None
+
+        connected = [
+            client
+            for client in await asyncio.gather(*(_open(client, index) for index, client in enumerate(clients)))
+            if client is not None
+        ]
+
+        self.results.started = time.perf_counter()
+        deadline = self.results.started + self.scenario.duration
+        await asyncio.gather(*(self._drive(client, deadline) for client in connected))
+        await asyncio.sleep(1)  # let the last deliveries arrive
+        self.results.finished = time.perf_counter()
+        self.results.counters['lost_or_pending'] = len(self.in_flight)
+
+        await asyncio.gather(*(client.sio.disconnect() for client in connected), return_exceptions=True)
+        return self.results.report()
+
+
+# ---------------------------------------------------------------------------
+# Local server processes
+# ---------------------------------------------------------------------------
+
+class ServerPool:
+    """Starts ``count`` uvicorn processes of this project on consecutive ports."""
+
+    def __init__(self, count: int, base_port: int, cwd: str, env: Optional[Dict[str, str]] = None) -> None:
+        self.count = count
+        self.base_port = base_port
+        self.cwd = cwd
+        self.env = {**os.environ, **(env or {})}
+        self.processes: List[subprocess.Popen] = []
+
+    @property
+    def urls(self) -> List[str]:
+        return [f'http://127.0.0.1:{self.base_port + index}' for index in range(self.count)]
+
+    def start(self, timeout: float = 30) -> None:
+        for index in range(self.count):
+            self.processes.append(subprocess.Popen(
+                [
+                    sys.executable, '-m', 'uvicorn', 'config.asgi:application',
+                    '--host', '127.0.0.1', '--port', str(self.base_port + index),
+                    '--log-level', 'warning',
+                ],
+                cwd=self.cwd,
+                env=self.env,
+            ))
+        deadline = time.monotonic() + timeout
+        for url in self.urls:
+            while True:
+                try:
+                    with urlopen(f'{url}/socket.io/?EIO=4&transport=polling', timeout=2):
+                        break
+                except (URLError, ConnectionError, OSError):
+                    if time.monotonic() > deadline:
+                        self.stop()
+                        raise RuntimeError(f'Server at {url} did not start in {timeout}s.')
+                    time.sleep(0.2)
+
+    def stop(self) -> None:
+        for process in self.processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process in self.processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes = []
@@ -0,0 +1,146 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.accounts.models import OperatorUserLink, Profile, Role
+from apps.chat.loadtest import LoadTest, Participant, Scenario, ServerPool
+
+ACTIONS = ('message', 'join', 'reconnect')
+
+
+def _parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        action, _, weight = item.partition('=')
+        action = action.strip()
+        if action not in ACTIONS:
+            raise CommandError(f'Unknown action "{action}" in --mix (expected {", ".join(ACTIONS)}).')
+        try:
+            mix[action] = float(weight)
+        except ValueError:
+            raise CommandError(f'Invalid weight for "{action}" in --mix.')
+    if not any(weight > 0 for weight in mix.values()):
+        raise CommandError('--mix needs at least one positive weight.')
+    return mix
+
+
+def _ensure_user(username, role):
+    user, created = get_user_model().objects.get_or_create(username=username)
+    if created:
+        user.set_unusable_password()
+        user.save(update_fields=['password'])
+    Profile.objects.update_or_create(user=user, defaults={'role': role, 'is_active': True})
+    return user
+
+
+def _seed_pairs(count):
+    """Create (or reuse) ``count`` linked operator/user pairs and mint their tokens."""
+    pairs = []
+    for index in range(count):
+        operator = _ensure_user(f'loadtest-op-{index}', Role.OPERATOR)
+        user = _ensure_user(f'loadtest-user-{index}', Role.USER)
+        OperatorUserLink.objects.get_or_create(operator=operator, user=user)
+        pairs.append((
+            Participant(operator.id, Role.OPERATOR.value, str(AccessToken.for_user(operator))),
+            Participant(user.id, Role.USER.value, str(AccessToken.for_user(user))),
+        ))
+    return pairs
+
+
+class Command(BaseCommand):
+    help = (
+        'Socket.IO load test: seeds linked operator/user pairs, opens their sockets against '
+        'one or more servers and reports connect, ack and fan-out latency percentiles. '
+        'Use --spawn 2 (or more) to measure cross-node delivery through Redis.'
+    )
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group()
+        target.add_argument('--url', action='append', dest='urls',
+                            help='Server base URL (repeat for several nodes). Default: http://127.0.0.1:8000')
+        target.add_argument('--spawn', type=int, default=0,
+                            help='Start this many local uvicorn processes sharing Redis and the database.')
+        parser.add_argument('--base-port', type=int, default=8100, help='First port for --spawn.')
+        parser.add_argument('--pairs', type=int, default=50, help='Operator/user pairs (two sockets each).')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds of traffic after ramp-up.')
+        parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which sockets connect.')
+        parser.add_argument('--rate', type=float, default=0.5, help='Actions per second per socket.')
+        parser.add_argument('--mix', default='message=90,join=5,reconnect=5',
+                            help='Weighted action mix, e.g. "message=80,join=10,reconnect=10".')
+        parser.add_argument('--msgpack', action='store_true', help='Use the msgpack wire format.')
+        parser.add_argument('--no-rate-limits', action='store_true',
+                            help='Disable socket rate limits on spawned servers.')
+        parser.add_argument('--json', dest='json_path', help='Also write the report to this file.')
+
+    def handle(self, *args, **options):
+        if options['pairs'] < 1 or options['rate'] <= 0 or options['duration'] <= 0:
+            raise CommandError('--pairs, --rate and --duration must be positive.')
+        mix = _parse_mix(options['mix'])
+        pairs = _seed_pairs(options['pairs'])
+        self.stdout.write(f'Seeded {len(pairs)} operator/user pairs.')
+
+        pool = None
+        urls = options['urls'] or ['http://127.0.0.1:8000']
+        if options['spawn']:
+            env = {'CHAT_RATE_LIMITS_ENABLED': '0'} if options['no_rate_limits'] else {}
+            pool = ServerPool(options['spawn'], options['base_port'], str(settings.BASE_DIR), env)
+            try:
+                pool.start()
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            urls = pool.urls
+            self.stdout.write(f'Started {len(urls)} servers: {", ".join(urls)}')
+
+        scenario = Scenario(
+            urls=urls,
+            pairs=pairs,
+            duration=options['duration'],
+            rate=options['rate'],
+            mix=mix,
+            ramp_up=options['ramp_up'],
+            serializer='msgpack' if options['msgpack'] else None,
+        )
+        try:
+            report = asyncio.run(LoadTest(scenario).run())
+        finally:
+            if pool is not None:
+                pool.stop()
+
+        report['scenario'] = {
+            'nodes': len(urls),
+            'sockets': len(pairs) * 2,
+            'durationSeconds': options['duration'],
+            'ratePerSocket': options['rate'],
+            'mix': mix,
+            'serializer': scenario.serializer or 'json',
+        }
+        self._print(report)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+
+    def _print(self, report):
+        self.stdout.write('')
+        self.stdout.write(f'{"metric":<22}{"count":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+        for label, key in (
+            ('connect', 'connectMs'),
+            ('join', 'joinMs'),
+            ('reconnect + sync', 'reconnectMs'),
+            ('message ack', 'ackMs'),
+            ('fan-out', 'fanoutMs'),
+            ('fan-out cross-node', 'crossNodeFanoutMs'),
+        ):
+            stats = report[key]
+            cells = ''.join(f'{"-" if stats[p] is None else stats[p]:>10}' for p in ('p50', 'p95', 'p99', 'max'))
+            self.stdout.write(f'{label:<22}{stats["count"]:>8}{cells}')
+        throughput = report['throughput']
+        self.stdout.write('')
+        self.stdout.write(
+            f'Throughput: {throughput["sentPerSecond"]} sent/s, '
+            f'{throughput["deliveredPerSecond"]} delivered/s over {report["elapsedSeconds"]}s'
+        )
+        self.stdout.write(f'Counters: {json.dumps(report["counters"], sort_keys=True)}')
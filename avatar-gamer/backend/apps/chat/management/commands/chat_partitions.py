@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from apps.chat import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Manage monthly partitions of chat messages: convert the table once, '
+        'create upcoming partitions and detach/drop the expired ones. '
+        'Schedule "ensure" and "prune" daily (cron, Kubernetes CronJob, ...).'
+    )
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+
+        convert = subcommands.add_parser('convert', help='Rebuild the table as a partitioned table (one-off, locks it).')
+        convert.add_argument('--months-ahead', type=int, default=settings.CHAT_CONFIG["PARTITION_MONTHS_AHEAD"])
+
+        ensure = subcommands.add_parser('ensure', help='Create partitions for the current and upcoming months.')
+        ensure.add_argument('--months-ahead', type=int, default=settings.CHAT_CONFIG["PARTITION_MONTHS_AHEAD"])
+
+        prune = subcommands.add_parser('prune', help='Detach partitions older than the retention window.')
+        prune.add_argument('--retention-months', type=int, default=settings.CHAT_CONFIG["RETENTION_MONTHS"])
+        prune.add_argument('--drop', action='store_true', help='Drop detached partitions instead of keeping them.')
+        prune.add_argument('--dry-run', action='store_true')
+
+        subcommands.add_parser('status', help='List the monthly partitions.')
+
+    def handle(self, *args, **options):
+        try:
+            partitions.ensure_postgres()
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+        action = options['action']
+        if action == 'convert':
+            if partitions.is_partitioned():
+                raise CommandError('Chat messages are already partitioned.')
+            created = partitions.convert(options['months_ahead'])
+            self.stdout.write(self.style.SUCCESS(f'Converted to a partitioned table with {len(created)} partitions.'))
+            return
+
+        if not partitions.is_partitioned():
+            raise CommandError('Chat messages are not partitioned yet; run "chat_partitions convert" first.')
+
+        if action == 'ensure':
+            try:
+                created = partitions.ensure_partitions(options['months_ahead'])
+            except DatabaseError as exc:
+                # Usually rows for that month already landed in the default partition.
+                raise CommandError(f'Unable to create partitions: {exc}')
+            for name in created:
+                self.stdout.write(f'Created {name}')
+            self.stdout.write(self.style.SUCCESS(f'{len(created)} partitions created.'))
+        elif action == 'prune':
+            retention = options['retention_months']
+            if retention <= 0:
+                self.stdout.write('Retention is disabled (RETENTION_MONTHS=0); nothing to prune.')
+                return
+            expired = partitions.expired_partitions(retention)
+            for partition in expired:
+                verb = 'Dropping' if options['drop'] else 'Detaching'
+                self.stdout.write(f'{verb} {partition.name} ({partition.start:%Y-%m})')
+                if not options['dry_run']:
+                    partitions.detach_partition(partition, drop=options['drop'])
+            self.stdout.write(self.style.SUCCESS(f'{len(expired)} partitions past retention.'))
+        else:
+            for partition in partitions.list_partitions():
+                self.stdout.write(f'{partition.name}\t{partition.start:%Y-%m-%d}\t{partition.end:%Y-%m-%d}')
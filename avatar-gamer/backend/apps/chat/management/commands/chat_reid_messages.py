@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.chat import dedupe, history_cache
+from apps.chat.ids import is_uuid7, uuid7
+from apps.chat.models import ChatMessage, Conversation
+
+
+class Command(BaseCommand):
+    help = (
+        'Rewrite chat message ids created before UUIDv7 (random uuid4) as UUIDv7 '
+        'built from their created_at, oldest first and in batches, so every row '
+        'can be paged with id-only cursors. Safe to interrupt and run again. '
+        'After each batch the cached history of the touched conversations and '
+        'the dedupe entries of recent messages are dropped, so servers reload '
+        'them with the new ids. A history read racing a batch can still cache '
+        'old ids until the next message; run with the socket servers stopped '
+        'to rule that out. Clients holding old ids (open pages) must reload.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would change.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        table = connection.ops.quote_name(ChatMessage._meta.db_table)
+        id_field = ChatMessage._meta.pk
+        created_field = ChatMessage._meta.get_field('created_at')
+        update_sql = f'UPDATE {table} SET id = %s WHERE id = %s AND created_at = %s'
+
+        # Older dedupe entries have already expired.
+        dedupe_since = timezone.now() - timedelta(seconds=settings.CHAT_CONFIG["DEDUPE_TTL"])
+
+        scanned = rewritten = 0
+        touched = set()
+        position = None
+        while True:
+            qs = ChatMessage.objects.order_by('created_at', 'id')
+            if position is not None:
+                created_at, message_id = position
+                qs = qs.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=message_id))
+            rows = list(
+                qs.values_list('id', 'created_at', 'conversation_id', 'sender_id', 'client_message_id')[:batch_size]
+            )
+            if not rows:
+                break
+            scanned += len(rows)
+            legacy = [row for row in rows if not is_uuid7(row[0])]
+            # Keyed on the old id: a rewritten row may show up again, but as UUIDv7.
+            position = (rows[-1][1], rows[-1][0])
+
+            if legacy and not options['dry_run']:
+                mapping = {old: uuid7(created_at) for old, created_at, *_ in legacy}
+                # created_at in the WHERE lets Postgres prune partitions.
+                params = [
+                    (
+                        id_field.get_db_prep_value(mapping[old], connection),
+                        id_field.get_db_prep_value(old, connection),
+                        created_field.get_db_prep_value(created_at, connection),
+                    )
+                    for old, created_at, *_ in legacy
+                ]
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.executemany(update_sql, params)
+                    conversations = list(Conversation.objects.filter(last_message_id__in=list(mapping)))
+                    for conversation in conversations:
+                        conversation.last_message_id = mapping[conversation.last_message_id]
+                    Conversation.objects.bulk_update(conversations, ['last_message_id'])
+                batch_conversations = {row[2] for row in legacy}
+                touched.update(batch_conversations)
+                keys = Conversation.objects.filter(id__in=batch_conversations).values_list('key', flat=True)
+                history_cache.invalidate_sync(keys)
+                dedupe.forget_sync(
+                    (sender_id, client_message_id)
+                    for _, created_at, _, sender_id, client_message_id in legacy
+                    if client_message_id and created_at >= dedupe_since
+                )
+
+            rewritten += len(legacy)
+            self.stdout.write(f'{scanned} scanned, {rewritten} legacy ids', ending='\r')
+
+        self.stdout.write('')
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{rewritten} of {scanned} messages would get a new id.'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rewrote {rewritten} of {scanned} message ids in {len(touched)} conversations.'
+        ))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_rename_apps_chat_c_convers_d111d3_idx_chat_chatme_convers_c2caf0_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
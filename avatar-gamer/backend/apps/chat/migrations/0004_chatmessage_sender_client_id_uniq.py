@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def clear_duplicate_client_ids(apps, schema_editor):
+    """Keep clientMessageId only on the oldest copy of each duplicated send."""
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    duplicated = (
+        ChatMessage.objects.filter(client_message_id__isnull=False)
+        .values('sender_id', 'client_message_id')
+        .annotate(total=models.Count('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicated.iterator():
+        copies = ChatMessage.objects.filter(
+            sender_id=row['sender_id'],
+            client_message_id=row['client_message_id'],
+        ).order_by('created_at', 'id')
+        first = copies.values_list('id', flat=True)[:1]
+        copies.exclude(id__in=list(first)).update(client_message_id=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_chatmessage_created_at_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_duplicate_client_ids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='chatmessage',
+            constraint=models.UniqueConstraint(condition=models.Q(('client_message_id__isnull', False)), fields=('sender', 'client_message_id'), name='chat_msg_sender_client_id_uniq'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+
+def number_existing_messages(apps, schema_editor):
+    """Number stored messages 1..n per conversation in chronological order."""
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    rows = (
+        ChatMessage.objects.order_by('conversation_id', 'created_at', 'id')
+        .only('id', 'conversation_id')
+        .iterator(chunk_size=2000)
+    )
+    current = None
+    seq = 0
+    batch = []
+    for message in rows:
+        if message.conversation_id != current:
+            current = message.conversation_id
+            seq = 0
+        seq += 1
+        message.seq = seq
+        batch.append(message)
+        if len(batch) >= 1000:
+            ChatMessage.objects.bulk_update(batch, ['seq'])
+            batch = []
+    if batch:
+        ChatMessage.objects.bulk_update(batch, ['seq'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_chatmessage_sender_client_id_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='seq',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(number_existing_messages, migrations.RunPython.noop),
+    ]
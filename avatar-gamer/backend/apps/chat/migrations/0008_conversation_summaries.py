@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from apps.chat.conversations import parse_conversation_id
+
+
+def build_summaries(apps, schema_editor):
+    """Create one summary (and its participants) per existing conversation."""
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    ConversationSummary = apps.get_model('chat', 'ConversationSummary')
+    ConversationParticipant = apps.get_model('chat', 'ConversationParticipant')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    user_ids = set(User.objects.values_list('id', flat=True))
+    preview_length = 140
+
+    totals = ChatMessage.objects.values('conversation_id').annotate(
+        total=models.Count('id'),
+        last_seq=models.Max('seq'),
+    )
+    for row in totals.iterator():
+        latest = ChatMessage.objects.get(conversation_id=row['conversation_id'], seq=row['last_seq'])
+        text = latest.text
+        if len(text) > preview_length:
+            text = text[:preview_length - 1] + '…'
+        summary = ConversationSummary.objects.create(
+            conversation_id=row['conversation_id'],
+            message_count=row['total'],
+            last_message_id=latest.id,
+            last_message_text=text,
+            last_message_sender_id=latest.sender_id,
+            last_message_seq=latest.seq,
+            last_message_at=latest.created_at,
+        )
+        participants = {user_id: role for role, user_id in parse_conversation_id(row['conversation_id']) or []}
+        ConversationParticipant.objects.bulk_create([
+            ConversationParticipant(
+                summary=summary,
+                user_id=user_id,
+                role=role,
+                last_message_at=latest.created_at,
+            )
+            for user_id, role in participants.items()
+            if user_id in user_ids
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_conversationreadstate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation_id', models.CharField(max_length=255, unique=True)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('last_message_id', models.UUIDField(blank=True, null=True)),
+                ('last_message_text', models.CharField(blank=True, max_length=140)),
+                ('last_message_seq', models.BigIntegerField(default=0)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_message_sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ConversationParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('admin', 'Admin'), ('operator', 'Operador'), ('user', 'Usuario')], max_length=16)),
+                ('last_message_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_conversations', to=settings.AUTH_USER_MODEL)),
+                ('summary', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='chat.conversationsummary')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_message_at', '-id'], name='chat_participant_inbox_idx')],
+                'constraints': [models.UniqueConstraint(fields=('summary', 'user'), name='chat_participant_summary_user_uniq')],
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
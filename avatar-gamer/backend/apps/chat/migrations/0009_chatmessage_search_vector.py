@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:21
+
+import django.contrib.postgres.indexes
+import apps.chat.models
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_conversation_summaries'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='search_vector',
+            field=apps.chat.models.SearchVectorColumn(db_persist=True, expression=django.contrib.postgres.search.SearchVector('text', config='spanish'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='chat_msg_search_gin'),
+        ),
+    ]
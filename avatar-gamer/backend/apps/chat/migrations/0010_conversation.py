@@ -0,0 +1,71 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_missing_conversations(apps, schema_editor):
+    """Conversation rows for messages stored without a summary (none expected since 0008)."""
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    Conversation = apps.get_model('chat', 'Conversation')
+    known = Conversation.objects.filter(key=models.OuterRef('conversation_key'))
+    totals = (
+        ChatMessage.objects.filter(~models.Exists(known))
+        .values('conversation_key')
+        .annotate(total=models.Count('id'), last_seq=models.Max('seq'), last_at=models.Max('created_at'))
+    )
+    Conversation.objects.bulk_create([
+        Conversation(
+            key=row['conversation_key'],
+            message_count=row['total'],
+            last_message_seq=row['last_seq'],
+            last_message_at=row['last_at'],
+        )
+        for row in totals
+    ])
+
+
+def link_messages(apps, schema_editor):
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    Conversation = apps.get_model('chat', 'Conversation')
+    ChatMessage.objects.update(
+        conversation=models.Subquery(
+            Conversation.objects.filter(key=models.OuterRef('conversation_key')).values('id')[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_chatmessage_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # ConversationSummary becomes the conversation entity.
+        migrations.RenameModel('ConversationSummary', 'Conversation'),
+        migrations.RenameField('conversation', 'conversation_id', 'key'),
+        migrations.RemoveConstraint('conversationparticipant', 'chat_participant_summary_user_uniq'),
+        migrations.RenameField('conversationparticipant', 'summary', 'conversation'),
+        migrations.AddConstraint(
+            model_name='conversationparticipant',
+            constraint=models.UniqueConstraint(fields=('conversation', 'user'), name='chat_participant_conv_user_uniq'),
+        ),
+        # Messages: drop what indexed the string, then move it aside.
+        migrations.RemoveIndex('chatmessage', 'chat_chatme_convers_c2caf0_idx'),
+        migrations.RemoveConstraint('chatmessage', 'chat_msg_conversation_seq_uniq'),
+        migrations.RenameField('chatmessage', 'conversation_id', 'conversation_key'),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='conversation',
+            field=models.ForeignKey(
+                null=True,
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='messages',
+                to='chat.conversation',
+            ),
+        ),
+        migrations.RunPython(create_missing_conversations, migrations.RunPython.noop),
+        migrations.RunPython(link_messages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _is_partitioned(schema_editor, table):
+    if schema_editor.connection.vendor != 'postgresql':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [table])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def add_seq_constraint(apps, schema_editor):
+    """
+    Unique ``(conversation, seq)``; a partitioned table (``chat_partitions
+    convert``) requires the partition key in it as well.
+    """
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    table = ChatMessage._meta.db_table
+    if not _is_partitioned(schema_editor, table):
+        constraint = models.UniqueConstraint(fields=['conversation', 'seq'], name='chat_msg_conversation_seq_uniq')
+        schema_editor.execute(constraint.create_sql(ChatMessage, schema_editor))
+        return
+    quote = schema_editor.quote_name
+    schema_editor.execute(
+        f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote("chat_msg_conversation_seq_uniq")} '
+        f'UNIQUE ({quote("conversation_id")}, {quote("seq")}, {quote("created_at")})'
+    )
+
+
+def drop_seq_constraint(apps, schema_editor):
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    quote = schema_editor.quote_name
+    schema_editor.execute(
+        f'ALTER TABLE {quote(ChatMessage._meta.db_table)} DROP CONSTRAINT {quote("chat_msg_conversation_seq_uniq")}'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_conversation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='conversation',
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='messages',
+                to='chat.conversation',
+            ),
+        ),
+        migrations.RemoveField('chatmessage', 'conversation_key'),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['conversation', 'created_at'], name='chat_msg_conv_created_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='chatmessage',
+                    constraint=models.UniqueConstraint(
+                        fields=('conversation', 'seq'),
+                        name='chat_msg_conversation_seq_uniq',
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(add_seq_constraint, drop_seq_constraint),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:45
+
+import apps.chat.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_chatmessage_conversation_required'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='id',
+            field=models.UUIDField(default=apps.chat.ids.new_message_id, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,39 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def link_read_states(apps, schema_editor):
+    ConversationReadState = apps.get_model('chat', 'ConversationReadState')
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationReadState.objects.update(
+        conversation=models.Subquery(
+            Conversation.objects.filter(key=models.OuterRef('conversation_key')).values('id')[:1]
+        ),
+    )
+    # Conversations without messages have nothing to be unread.
+    ConversationReadState.objects.filter(conversation__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0012_chatmessage_uuid7_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint('conversationreadstate', 'chat_read_state_user_conv_uniq'),
+        migrations.RenameField('conversationreadstate', 'conversation_id', 'conversation_key'),
+        migrations.AddField(
+            model_name='conversationreadstate',
+            name='conversation',
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='read_states',
+                to='chat.conversation',
+            ),
+        ),
+        migrations.RunPython(link_read_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0013_conversationreadstate_conversation_fk'),
+    ]
+
+    operations = [
+        migrations.RemoveField('conversationreadstate', 'conversation_key'),
+        migrations.AlterField(
+            model_name='conversationreadstate',
+            name='conversation',
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='read_states',
+                to='chat.conversation',
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name='conversationreadstate',
+            constraint=models.UniqueConstraint(fields=('user', 'conversation'), name='chat_read_state_user_conv_uniq'),
+        ),
+    ]
@@ -1,11 +1,61 @@
 from __future__ import annotations
 
-import uuid
-
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.utils import timezone
 
 from apps.accounts.models import Role
+from .ids import new_message_id
+
+# Text search configuration for message bodies (LANGUAGE_CODE is es-cl).
+SEARCH_CONFIG = 'spanish'
+
+
+class SearchVectorColumn(models.GeneratedField):
+    # Postgres fills the column itself; do not send every tsvector back through
+    # INSERT ... RETURNING on the message write path.
+    db_returning = False
+
+
+class ChatMessageManager(models.Manager):
+    def get_queryset(self):
+        # The tsvector is only needed inside search queries; do not ship it to
+        # Python on every history read.
+        return super().get_queryset().defer('search_vector')
+
+
+class Conversation(models.Model):
+    """
+    A conversation between two participants.
+
+    ``key`` is the id clients use (``conversation:<role>-<id>:<role>-<id>``);
+    messages reference the bigint primary key instead of repeating the key in
+    every row. The row also carries what an inbox needs, the latest message
+    and how many messages there are, maintained in the same transaction that
+    stores the messages (see ``summaries.record_messages``).
+    """
+
+    PREVIEW_LENGTH = 140
+
+    key = models.CharField(max_length=255, unique=True)
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_id = models.UUIDField(null=True, blank=True)
+    last_message_text = models.CharField(max_length=PREVIEW_LENGTH, blank=True)
+    last_message_sender = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='+',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    last_message_seq = models.BigIntegerField(default=0)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f'{self.key} ({self.message_count})'
 
 
 class ChatMessage(models.Model):
@@ -14,8 +64,15 @@ class ChatMessage(models.Model):
     history can be restored when new sockets join the room.
     """
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    conversation_id = models.CharField(max_length=255, db_index=True)
+    # UUIDv7 built from created_at (see ``ids``): time-ordered, usable as a cursor.
+    id = models.UUIDField(primary_key=True, default=new_message_id, editable=False)
+    # No index of its own: the (conversation, created_at) index covers it.
+    conversation = models.ForeignKey(
+        Conversation,
+        related_name='messages',
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
     sender = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         related_name='outgoing_chat_messages',
@@ -31,13 +88,108 @@ class ChatMessage(models.Model):
     )
     text = models.TextField()
     client_message_id = models.CharField(max_length=128, null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Position inside the conversation; lets reconnecting clients ask only for
+    # what they missed (see ``chat:sync``).
+    seq = models.BigIntegerField(editable=False)
+    # Assigned when the instance is built (not at INSERT time) so write-behind
+    # batches keep the timestamp that was already broadcast to clients.
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    search_vector = SearchVectorColumn(
+        expression=SearchVector('text', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = ChatMessageManager()
 
     class Meta:
         ordering = ['created_at']
         indexes = [
-            models.Index(fields=['conversation_id', 'created_at']),
+            models.Index(fields=['conversation', 'created_at'], name='chat_msg_conv_created_idx'),
+            GinIndex(fields=['search_vector'], name='chat_msg_search_gin'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['conversation', 'seq'],
+                name='chat_msg_conversation_seq_uniq',
+            ),
+            # A client retry must never create a second row for the same send.
+            models.UniqueConstraint(
+                fields=['sender', 'client_message_id'],
+                condition=models.Q(client_message_id__isnull=False),
+                name='chat_msg_sender_client_id_uniq',
+            ),
         ]
 
     def __str__(self) -> str:
         return f'{self.conversation_id} :: {self.sender_id} -> {self.recipient_id}'
+
+
+class ConversationReadState(models.Model):
+    """
+    Last message (by ``seq``) a user has read in a conversation.
+
+    Redis holds the live watermark, keyed by the conversation's external key;
+    rows here are written in batches and are used to rebuild the unread
+    counters when Redis starts empty.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='chat_read_states',
+        on_delete=models.CASCADE,
+    )
+    conversation = models.ForeignKey(
+        Conversation,
+        related_name='read_states',
+        on_delete=models.CASCADE,
+    )
+    last_read_seq = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'conversation'],
+                name='chat_read_state_user_conv_uniq',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user_id} @ {self.conversation_id} :: {self.last_read_seq}'
+
+
+class ConversationParticipant(models.Model):
+    """
+    Membership of a user in a conversation.
+
+    ``last_message_at`` is copied from the conversation so a user's inbox is
+    a single range scan over ``(user, last_message_at)``.
+    """
+
+    conversation = models.ForeignKey(
+        Conversation,
+        related_name='participants',
+        on_delete=models.CASCADE,
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='chat_conversations',
+        on_delete=models.CASCADE,
+    )
+    role = models.CharField(max_length=16, choices=Role.choices)
+    last_message_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['conversation', 'user'],
+                name='chat_participant_conv_user_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_message_at', '-id'], name='chat_participant_inbox_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user_id} in {self.conversation_id}'
@@ -0,0 +1,303 @@
+"""
+Monthly range partitioning of ``chat_chatmessage`` on ``created_at`` (Postgres).
+
+The table is converted once with ``manage.py chat_partitions convert``; from
+then on ``ensure`` keeps partitions created ahead of time and ``prune``
+detaches (or drops) the months that fell out of the retention window, which
+replaces bulk ``DELETE`` + ``VACUUM`` with a catalog operation.
+
+Postgres requires every primary key and unique index of a partitioned table
+to include the partition key, so after the conversion the primary key is
+``(id, created_at)`` and the unique constraints on ``(sender,
+client_message_id)`` and ``(conversation_id, seq)`` also carry ``created_at``.
+Those alone would accept a duplicate that arrives with a different timestamp,
+so ``convert`` also creates ``chat_chatmessage_key``: a plain table with one
+row per message (id, timestamp and the unique columns) that a trigger keeps in
+sync. Its unique indexes reject the duplicate with the same
+``IntegrityError`` the original constraints raised. ``prune`` removes the
+rows of the partitions it detaches; schema changes to those columns must be
+applied to this table too.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timezone as dt_timezone
+from typing import Any, List, Optional
+
+from django.db import connection, transaction
+
+from .models import ChatMessage
+
+PARTITION_KEY = 'created_at'
+# Columns mirrored in the key table; the unique ones are enforced there.
+KEY_COLUMNS = ('id', 'created_at', 'conversation_id', 'seq', 'sender_id', 'client_message_id')
+_NAME_RE = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+@dataclass
+class Partition:
+    name: str
+    start: date
+    end: date
+
+
+def table_name() -> str:
+    return ChatMessage._meta.db_table
+
+
+def key_table_name() -> str:
+    return f'{table_name()}_key'
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{table_name()}_p{month:%Y%m}'
+
+
+def _bound(month: date) -> str:
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc).isoformat()
+
+
+def _quote(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def ensure_postgres() -> None:
+    if connection.vendor != 'postgresql':
+        raise RuntimeError('Chat message partitioning requires PostgreSQL.')
+
+
+def is_partitioned() -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [table_name()])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def list_partitions() -> List[Partition]:
+    """Monthly partitions attached to the table, oldest first (default excluded)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.oid = to_regclass(%s)
+            """,
+            [table_name()],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = _NAME_RE.search(name)
+        if match:
+            start = date(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append(Partition(name=name, start=start, end=add_months(start, 1)))
+    return sorted(partitions, key=lambda partition: partition.start)
+
+
+def create_partition(month: date) -> Optional[str]:
+    """Create the partition for ``month``; return its name, or ``None`` if it exists."""
+    name = partition_name(month)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0] is not None:
+            return None
+        # DDL cannot take bind parameters; the bounds are generated above.
+        cursor.execute(
+            f'CREATE TABLE {_quote(name)} PARTITION OF {_quote(table_name())} '
+            f"FOR VALUES FROM ('{_bound(month)}') TO ('{_bound(add_months(month, 1))}')"
+        )
+    return name
+
+
+def ensure_partitions(months_ahead: int, today: Optional[date] = None) -> List[str]:
+    """Create partitions from the current month up to ``months_ahead`` months later."""
+    current = month_start(today or datetime.now(dt_timezone.utc).date())
+    created = []
+    for offset in range(months_ahead + 1):
+        name = create_partition(add_months(current, offset))
+        if name:
+            created.append(name)
+    return created
+
+
+def expired_partitions(retention_months: int, today: Optional[date] = None) -> List[Partition]:
+    """Partitions whose whole range is older than ``retention_months`` full months."""
+    cutoff = add_months(month_start(today or datetime.now(dt_timezone.utc).date()), -retention_months)
+    return [partition for partition in list_partitions() if partition.end <= cutoff]
+
+
+def detach_partition(partition: Partition, drop: bool = False) -> None:
+    # Detaching fires no row triggers: the key rows of the range go explicitly.
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {_quote(table_name())} DETACH PARTITION {_quote(partition.name)}')
+        cursor.execute(
+            f'DELETE FROM {_quote(key_table_name())} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s',
+            [_bound(partition.start), _bound(partition.end)],
+        )
+        if drop:
+            cursor.execute(f'DROP TABLE {_quote(partition.name)}')
+
+
+# ---------------------------------------------------------------------------
+# One-time conversion
+# ---------------------------------------------------------------------------
+
+def _with_partition_key(definition: str) -> str:
+    """Append ``created_at`` to the column list of a PRIMARY KEY/UNIQUE definition."""
+    def _append(match: re.Match) -> str:
+        columns = [column.strip() for column in match.group(1).split(',')]
+        if PARTITION_KEY not in columns:
+            columns.append(PARTITION_KEY)
+        return '(' + ', '.join(columns) + ')'
+
+    return re.sub(r'\(([^()]*)\)', _append, definition, count=1)
+
+
+def _index_definition(definition: str, legacy: str, table: str, unique: bool) -> str:
+    """Point a ``pg_get_indexdef`` of the old table at ``table``; unique ones get the partition key."""
+    definition = re.sub(rf' ON (ONLY )?(\S+\.)?"?{legacy}"? ', f' ON {_quote(table)} ', definition, count=1)
+    if unique:
+        definition = re.sub(
+            r'USING (\w+) \(([^()]*)\)',
+            lambda match: f'USING {match.group(1)} ' + _with_partition_key(f'({match.group(2)})'),
+            definition,
+            count=1,
+        )
+    return definition
+
+
+def _create_key_table(cursor: Any, table: str) -> None:
+    """Create and fill the key table of ``table`` and the trigger that maintains it."""
+    key_table = key_table_name()
+    columns = ', '.join(_quote(column) for column in KEY_COLUMNS)
+    values = ', '.join(f'NEW.{_quote(column)}' for column in KEY_COLUMNS)
+    function = _quote(f'{key_table}_sync')
+
+    cursor.execute(f'CREATE TABLE {_quote(key_table)} AS SELECT {columns} FROM {_quote(table)}')
+    cursor.execute(f'ALTER TABLE {_quote(key_table)} ADD PRIMARY KEY ("id")')
+    cursor.execute(
+        f'CREATE UNIQUE INDEX {_quote(key_table + "_conversation_seq_uniq")} '
+        f'ON {_quote(key_table)} ("conversation_id", "seq")'
+    )
+    cursor.execute(
+        f'CREATE UNIQUE INDEX {_quote(key_table + "_sender_client_id_uniq")} '
+        f'ON {_quote(key_table)} ("sender_id", "client_message_id") WHERE "client_message_id" IS NOT NULL'
+    )
+    cursor.execute(f'CREATE INDEX {_quote(key_table + "_created_at")} ON {_quote(key_table)} ("created_at")')
+    # An UPDATE is a DELETE + INSERT of the key row, which also covers rows
+    # that move to another partition.
+    cursor.execute(
+        f"""
+        CREATE FUNCTION {function}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM {_quote(key_table)} WHERE "id" = OLD."id";
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {_quote(key_table)} ({columns}) VALUES ({values});
+            END IF;
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    cursor.execute(
+        f'CREATE TRIGGER {_quote(key_table + "_sync")} '
+        f'AFTER INSERT OR DELETE OR UPDATE OF {columns} ON {_quote(table)} '
+        f'FOR EACH ROW EXECUTE FUNCTION {function}()'
+    )
+
+
+def convert(months_ahead: int) -> List[str]:
+    """
+    Rebuild ``chat_chatmessage`` as a partitioned table and copy every row.
+
+    Runs in one transaction holding an exclusive lock on the table, so run it
+    in a maintenance window. Returns the partitions that were created.
+
+    Also creates the key table that enforces the uniqueness the partitioned
+    indexes cannot (see the module docstring).
+    """
+    table = table_name()
+    legacy = f'{table}_unpartitioned'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {_quote(table)} IN ACCESS EXCLUSIVE MODE')
+        # Deferred foreign key checks still queued on the old table would block its DROP.
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        cursor.execute(
+            """
+            SELECT conname, contype, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u', 'f')
+            ORDER BY contype DESC
+            """,
+            [table],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT index_class.relname, pg_get_indexdef(pg_index.indexrelid), pg_index.indisunique
+            FROM pg_index
+            JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+            WHERE pg_index.indrelid = to_regclass(%s)
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = pg_index.indexrelid)
+            """,
+            [table],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(f'SELECT min({PARTITION_KEY}) FROM {_quote(table)}')
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute(f'ALTER TABLE {_quote(table)} RENAME TO {_quote(legacy)}')
+        cursor.execute(
+            f'CREATE TABLE {_quote(table)} (LIKE {_quote(legacy)} '
+            f'INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING STORAGE INCLUDING COMMENTS) '
+            f'PARTITION BY RANGE ({PARTITION_KEY})'
+        )
+
+        today = month_start(datetime.now(dt_timezone.utc).date())
+        month = month_start(oldest.astimezone(dt_timezone.utc).date()) if oldest else today
+        created = []
+        while month <= add_months(today, months_ahead):
+            created.append(create_partition(month))
+            month = add_months(month, 1)
+        cursor.execute(f'CREATE TABLE {_quote(table + "_default")} PARTITION OF {_quote(table)} DEFAULT')
+
+        # Generated columns are recomputed by the new table, not copied.
+        cursor.execute(
+            """
+            SELECT attname FROM pg_attribute
+            WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+            ORDER BY attnum
+            """,
+            [legacy],
+        )
+        columns = ', '.join(_quote(row[0]) for row in cursor.fetchall())
+        cursor.execute(f'INSERT INTO {_quote(table)} ({columns}) SELECT {columns} FROM {_quote(legacy)}')
+        cursor.execute(f'DROP TABLE {_quote(legacy)}')
+
+        # Recreate keys and indexes under their original names (they were
+        # freed by the DROP above), adding the partition key where required.
+        for name, kind, definition in constraints:
+            if kind in ('p', 'u'):
+                definition = _with_partition_key(definition)
+            cursor.execute(f'ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(name)} {definition}')
+        for name, definition, unique in indexes:
+            cursor.execute(_index_definition(definition, legacy, table, unique))
+        _create_key_table(cursor, table)
+
+    return created
@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from django.db import DatabaseError, IntegrityError, InterfaceError, OperationalError, transaction
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+
+from . import sequences
+from .conversations import resolve_conversation
+from .db import run_db
+from .instrumentation import observe_write_behind
+from .models import ChatMessage, Conversation
+from .summaries import record_messages
+
+logger = logging.getLogger(__name__)
+
+_SPOOL_PREFIX = 'chat-writebehind-'
+# Rows the database refused; the spool replay does not pick these up.
+_REJECTED_PREFIX = 'chat-rejected-'
+# Errors that mean the database is unreachable, not that a row is bad: only
+# these send a batch to the spool to be retried later.
+_OUTAGE_ERRORS = (OperationalError, InterfaceError)
+
+
+def _to_row(message: ChatMessage) -> Dict[str, Any]:
+    return {
+        'id': str(message.id),
+        'conversation_id': message.conversation_id,
+        'sender_id': message.sender_id,
+        'sender_role': message.sender_role,
+        'recipient_id': message.recipient_id,
+        'text': message.text,
+        'client_message_id': message.client_message_id,
+        'seq': message.seq,
+        'created_at': message.created_at.isoformat(),
+    }
+
+
+def _from_row(row: Dict[str, Any]) -> ChatMessage:
+    data = dict(row)
+    data['created_at'] = parse_datetime(data['created_at'])
+    if isinstance(data['conversation_id'], str):
+        # Spooled before conversations had integer ids.
+        data['conversation_id'] = resolve_conversation(data['conversation_id'], create=True)
+    return ChatMessage(**data)
+
+
+def _stored_duplicates(batch: List[ChatMessage]) -> Tuple[Set[uuid.UUID], Set[Tuple[int, str]]]:
+    """Ids and ``(sender, client_message_id)`` pairs of ``batch`` already in the table."""
+    ids = [message.id for message in batch]
+    client_ids = {message.client_message_id for message in batch if message.client_message_id}
+    condition = Q(id__in=ids)
+    if client_ids:
+        condition |= Q(client_message_id__in=client_ids)
+    stored_ids: Set[uuid.UUID] = set()
+    stored_keys: Set[Tuple[int, str]] = set()
+    for message_id, sender_id, client_message_id in ChatMessage.objects.filter(condition).values_list(
+        'id', 'sender_id', 'client_message_id',
+    ):
+        stored_ids.add(message_id)
+        if client_message_id:
+            stored_keys.add((sender_id, client_message_id))
+    return stored_ids, stored_keys
+
+
+def _without_duplicates(batch: List[ChatMessage]) -> List[ChatMessage]:
+    """
+    Drop rows that are already stored: the same id (a spool replayed twice) or
+    the same ``(sender, client_message_id)`` (a retry that reached the
+    database twice, the first copy wins). Anything else must be inserted.
+    """
+    stored_ids, stored_keys = _stored_duplicates(batch)
+    fresh: List[ChatMessage] = []
+    for message in batch:
+        key = (message.sender_id, message.client_message_id)
+        if message.id in stored_ids or (message.client_message_id and key in stored_keys):
+            continue
+        if message.client_message_id:
+            stored_keys.add(key)
+        fresh.append(message)
+    return fresh
+
+
+def _renumber(message: ChatMessage) -> None:
+    """
+    Give ``message`` the next free ``seq`` of its conversation.
+
+    Only for messages whose ``seq`` is already taken by another row (Redis
+    fell back to the database floor, or the counter was reset). The
+    conversation row is locked first so concurrent renumbers do not collide,
+    and the Redis counter is moved past the new value.
+    """
+    conversation = Conversation.objects.select_for_update().get(pk=message.conversation_id)
+    stored = ChatMessage.objects.filter(conversation_id=conversation.pk).aggregate(value=Max('seq'))['value'] or 0
+    previous, message.seq = message.seq, stored + 1
+    sequences.advance(conversation.key, message.seq)
+    logger.error(
+        'Chat message %s collided on seq %s in %s; stored as seq %s.',
+        message.id, previous, conversation.key, message.seq,
+    )
+
+
+def _insert_row(message: ChatMessage) -> str:
+    """Insert one write-behind row; returns the outcome recorded in the metrics."""
+    if not _without_duplicates([message]):
+        return 'duplicate'
+    outcome = 'inserted'
+    if ChatMessage.objects.filter(conversation_id=message.conversation_id, seq=message.seq).exists():
+        _renumber(message)
+        outcome = 'renumbered'
+    message.save(force_insert=True)
+    record_messages([message])
+    return outcome
+
+
+def _insert(batch: List[ChatMessage]) -> List[ChatMessage]:
+    """
+    Insert a write-behind batch with one statement, degrading to row-by-row
+    inserts so a single bad row (e.g. a deleted sender) does not sink the
+    whole batch. Conversation summaries are updated in the same transaction.
+
+    These messages were already acknowledged and broadcast, so no row is
+    dropped silently: rows already stored are skipped, a row whose ``seq`` is
+    taken is renumbered, and rows that still cannot be stored are returned
+    for the caller to set aside. Every outcome is counted in the metrics.
+
+    Connectivity errors propagate so the caller can spool the batch; any
+    other database error (constraint, value too long, ...) is blamed on rows.
+    """
+    try:
+        with transaction.atomic():
+            fresh = _without_duplicates(batch)
+            ChatMessage.objects.bulk_create(fresh)
+            record_messages(fresh)
+        observe_write_behind('inserted', len(fresh))
+        observe_write_behind('duplicate', len(batch) - len(fresh))
+        return []
+    except _OUTAGE_ERRORS:
+        raise
+    except DatabaseError:
+        logger.warning('Bulk insert of %s chat messages failed; retrying row by row.', len(batch))
+
+    rejected: List[ChatMessage] = []
+    for message in batch:
+        try:
+            with transaction.atomic():
+                outcome = _insert_row(message)
+        except _OUTAGE_ERRORS:
+            raise
+        except DatabaseError as exc:
+            logger.error('Chat message %s cannot be stored, setting it aside: %s', message.id, exc)
+            rejected.append(message)
+            outcome = 'rejected'
+        observe_write_behind(outcome, 1)
+    return rejected
+
+
+def insert_message(message: ChatMessage) -> Tuple[ChatMessage, bool]:
+    """
+    Insert a single message and return ``(stored, created)``.
+
+    When the ``(sender, client_message_id)`` constraint rejects a retry, the
+    row stored by the first attempt is returned with ``created=False``.
+    """
+    try:
+        with transaction.atomic():
+            message.save(force_insert=True)
+            record_messages([message])
+        return message, True
+    except IntegrityError:
+        if not message.client_message_id:
+            raise
+        existing = ChatMessage.objects.filter(
+            sender_id=message.sender_id,
+            client_message_id=message.client_message_id,
+        ).first()
+        if existing is None:
+            raise
+        return existing, False
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # alive, but owned by another user
+        pass
+    return True
+
+
+class MessageWriteBuffer:
+    """
+    Bounded write-behind queue for chat messages.
+
+    Messages are accepted with their id and timestamp already assigned, then
+    persisted with ``bulk_create`` every ``flush_interval`` seconds or as soon
+    as ``batch_size`` rows are waiting. When the database is unreachable the
+    batch is appended to a JSON-lines spool file and replayed after the next
+    successful flush or on startup. Rows the database refuses are written to a
+    separate ``chat-rejected-*`` file instead of being dropped, since clients
+    have already seen them. When ``max_pending`` rows are waiting the
+    producer flushes inline, which pushes back on the sending socket instead of
+    growing memory without bound.
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_size: int,
+        flush_interval: float,
+        max_pending: int,
+        spool_dir: Path,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spool_dir = Path(spool_dir)
+        self._pending: List[ChatMessage] = []
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._spooled = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def max_seq(self, conversation_id: int) -> int:
+        """Highest sequence waiting to be written for ``conversation_id``."""
+        return max(
+            (message.seq for message in self._pending if message.conversation_id == conversation_id),
+            default=0,
+        )
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._spooled = True  # replay whatever a previous process left behind
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def enqueue(self, message: ChatMessage) -> None:
+        self._pending.append(message)
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+        elif len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                try:
+                    rejected = await run_db(_insert, batch)
+                except _OUTAGE_ERRORS as exc:
+                    logger.error('Chat write-behind flush failed, spooling %s rows: %s', len(batch), exc)
+                    await run_db(self._spool, batch)
+                    return
+                if rejected:
+                    await run_db(self._set_aside, rejected)
+
+            if self._spooled:
+                await run_db(self._replay_spool)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:  # pragma: no cover - keep the flusher alive
+                logger.exception('Unexpected error in chat write-behind flusher.')
+
+    # -- spool -------------------------------------------------------------
+
+    def _spool_path(self) -> Path:
+        return self.spool_dir / f'{_SPOOL_PREFIX}{os.getpid()}.jsonl'
+
+    def _spool(self, batch: List[ChatMessage]) -> None:
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        with open(self._spool_path(), 'a', encoding='utf-8') as handle:
+            for message in batch:
+                handle.write(json.dumps(_to_row(message)) + '\n')
+            handle.flush()
+            os.fsync(handle.fileno())
+        self._spooled = True
+
+    def _set_aside(self, rejected: List[ChatMessage]) -> None:
+        """
+        Keep rows the database refused in a file that is never replayed
+        automatically; they were already delivered, so they are recovered by
+        hand once the cause (e.g. a deleted sender) is understood.
+        """
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spool_dir / f'{_REJECTED_PREFIX}{os.getpid()}.jsonl'
+        with open(path, 'a', encoding='utf-8') as handle:
+            for message in rejected:
+                handle.write(json.dumps(_to_row(message)) + '\n')
+            handle.flush()
+            os.fsync(handle.fileno())
+        logger.error('Set aside %s chat messages the database rejected in %s', len(rejected), path.name)
+
+    def _recovered_path(self) -> Path:
+        return self.spool_dir / f'{_SPOOL_PREFIX}recovered-{uuid.uuid4().hex}.jsonl'
+
+    def _reclaim_abandoned(self) -> None:
+        """
+        Put back spool files claimed by a replay that never finished.
+
+        A ``.replay-<pid>`` file whose process is gone (or is this one: in a
+        container a restarted worker often gets the same pid) holds rows that
+        were acknowledged but maybe never stored. It is renamed to a fresh
+        spool name so the replay below picks it up.
+        """
+        for path in self.spool_dir.glob(f'{_SPOOL_PREFIX}*.replay-*'):
+            try:
+                pid = int(path.suffix[len('.replay-'):])
+            except ValueError:
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            try:
+                path.rename(self._recovered_path())
+            except FileNotFoundError:
+                continue
+            logger.warning('Recovered chat spool %s left by process %s', path.name, pid)
+
+    def _replay_spool(self) -> None:
+        if not self.spool_dir.exists():
+            self._spooled = False
+            return
+
+        self._reclaim_abandoned()
+        for path in sorted(self.spool_dir.glob(f'{_SPOOL_PREFIX}*.jsonl')):
+            # Renaming claims the file so concurrent workers never replay it twice.
+            claimed = path.with_suffix(f'.replay-{os.getpid()}')
+            try:
+                path.rename(claimed)
+            except FileNotFoundError:
+                continue
+
+            with open(claimed, encoding='utf-8') as handle:
+                rows = [_from_row(json.loads(line)) for line in handle if line.strip()]
+
+            rejected: List[ChatMessage] = []
+            try:
+                for start in range(0, len(rows), self.batch_size):
+                    # Rows stored by a previous attempt are skipped by id, so
+                    # the replay is idempotent.
+                    rejected += _insert(rows[start:start + self.batch_size])
+            except _OUTAGE_ERRORS as exc:
+                logger.error('Replaying chat spool %s failed: %s', claimed, exc)
+                # Not back to ``path``: its writer may have started a new file there.
+                claimed.rename(self._recovered_path())
+                return
+
+            if rejected:
+                self._set_aside(rejected)
+            claimed.unlink()
+            logger.info('Replayed %s spooled chat messages from %s', len(rows), path.name)
+
+        self._spooled = False
@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from apps.accounts.models import Profile
+from .db import run_db
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+_ONLINE_KEY = 'presence:online'
+_SWEEP_LOCK_KEY = 'presence:sweeper'
+
+
+def _leases_key(user_id: int) -> str:
+    return f'presence:leases:{user_id}'
+
+
+def _info_key(user_id: int) -> str:
+    return f'presence:info:{user_id}'
+
+
+# Returns how many live leases the user had before this one was added.
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+local before = redis.call('ZCARD', KEYS[1])
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('SET', KEYS[3], ARGV[6], 'EX', ARGV[5])
+redis.call('SADD', KEYS[2], ARGV[4])
+return before
+"""
+
+# Returns 1 when the user has no live lease left and was still marked online.
+_RELEASE_SCRIPT = """
+if ARGV[1] ~= '' then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+if redis.call('ZCARD', KEYS[1]) > 0 then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+return redis.call('SREM', KEYS[2], ARGV[3])
+"""
+
+# Extends a lease, creating it again if the sweeper already reaped it. Returns
+# 1 when the user had to be put back in the online set.
+_HEARTBEAT_SCRIPT = """
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+if redis.call('EXPIRE', KEYS[3], ARGV[4]) == 0 then
+    redis.call('SET', KEYS[3], ARGV[5], 'EX', ARGV[4])
+end
+return redis.call('SADD', KEYS[2], ARGV[3])
+"""
+
+PresenceCallback = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+
+class PresenceTracker:
+    """
+    Cluster-wide presence based on TTL leases stored in Redis.
+
+    Every socket owns a lease (a member of ``presence:leases:<user_id>`` scored
+    with its expiry). The process that holds the socket refreshes its leases on
+    a heartbeat, so leases of a crashed worker simply expire; a sweeper guarded
+    by a Redis lock reaps them and reports the users that went offline. A
+    heartbeat that finds its lease reaped (the process stalled, or Redis was
+    away for longer than ``lease_ttl``) creates it again and reports the user
+    back online.
+
+    ``Profile.is_online`` is not written per socket event: transitions are
+    collected and written in bulk every ``sync_interval`` seconds, and the
+    sweeper reconciles the table against the set of online users.
+    """
+
+    def __init__(
+        self,
+        *,
+        lease_ttl: int,
+        heartbeat_interval: int,
+        sweep_interval: int,
+        sync_interval: int,
+        on_expired: Optional[PresenceCallback] = None,
+        on_restored: Optional[PresenceCallback] = None,
+    ) -> None:
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.sweep_interval = sweep_interval
+        self.sync_interval = sync_interval
+        self.on_expired = on_expired
+        self.on_restored = on_restored
+        self._local: Dict[str, int] = {}
+        self._info: Dict[str, Dict[str, Any]] = {}
+        self._dirty: Dict[int, bool] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks = [
+            loop.create_task(self._every(self.heartbeat_interval, self.heartbeat)),
+            loop.create_task(self._every(self.sweep_interval, self.sweep)),
+            loop.create_task(self._every(self.sync_interval, self.sync_profiles)),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+        # Hand our sockets back explicitly instead of waiting for the leases
+        # to expire, so a rolling deploy does not leave users online.
+        released: List[Dict[str, Any]] = []
+        for sid, user_id in list(self._local.items()):
+            if await self.release(sid, user_id):
+                released.append(await self.get_info(user_id))
+        if released and self.on_expired:
+            await self.on_expired(released)
+        await self.sync_profiles()
+
+    async def _every(self, interval: int, job: Callable[[], Awaitable[Any]]) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await job()
+            except RedisError as exc:
+                logger.warning('Presence job %s failed: %s', job.__name__, exc)
+            except Exception:  # pragma: no cover - keep the loop alive
+                logger.exception('Unexpected error in presence job %s', job.__name__)
+
+    # -- leases ------------------------------------------------------------
+
+    async def acquire(self, sid: str, user_id: int, info: Dict[str, Any]) -> bool:
+        """Register a socket; return ``True`` when the user just came online."""
+        self._local[sid] = user_id
+        self._info[sid] = info
+        now = time.time()
+        try:
+            before = await get_redis().eval(
+                _ACQUIRE_SCRIPT,
+                3,
+                _leases_key(user_id),
+                _ONLINE_KEY,
+                _info_key(user_id),
+                sid,
+                now,
+                now + self.lease_ttl,
+                user_id,
+                self.lease_ttl * 2,
+                json.dumps(info),
+            )
+        except RedisError as exc:
+            logger.warning('Unable to acquire presence lease for user %s: %s', user_id, exc)
+            return False
+
+        if int(before) == 0:
+            self._dirty[user_id] = True
+            return True
+        return False
+
+    async def release(self, sid: str, user_id: int) -> bool:
+        """Drop a socket lease; return ``True`` when the user just went offline."""
+        self._local.pop(sid, None)
+        self._info.pop(sid, None)
+        try:
+            went_offline = await get_redis().eval(
+                _RELEASE_SCRIPT,
+                2,
+                _leases_key(user_id),
+                _ONLINE_KEY,
+                sid,
+                time.time(),
+                user_id,
+            )
+        except RedisError as exc:
+            logger.warning('Unable to release presence lease for user %s: %s', user_id, exc)
+            return False
+
+        if int(went_offline):
+            self._dirty[user_id] = False
+            return True
+        return False
+
+    async def get_info(self, user_id: int) -> Dict[str, Any]:
+        """Return the identity stored with the lease (at least the user id)."""
+        try:
+            raw = await get_redis().get(_info_key(user_id))
+        except RedisError:
+            raw = None
+        return json.loads(raw) if raw else {'user_id': user_id}
+
+    # -- background jobs ---------------------------------------------------
+
+    async def heartbeat(self) -> None:
+        """Extend the leases of every socket held by this process."""
+        if not self._local:
+            return
+        held = list(self._local.items())
+        expires = time.time() + self.lease_ttl
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for sid, user_id in held:
+                pipe.eval(
+                    _HEARTBEAT_SCRIPT,
+                    3,
+                    _leases_key(user_id),
+                    _ONLINE_KEY,
+                    _info_key(user_id),
+                    sid,
+                    expires,
+                    user_id,
+                    self.lease_ttl * 2,
+                    json.dumps(self._info.get(sid) or {'user_id': user_id}),
+                )
+            results = await pipe.execute()
+
+        restored: Dict[int, Dict[str, Any]] = {}
+        gone: List[Dict[str, Any]] = []
+        for (sid, user_id), added in zip(held, results):
+            if sid not in self._local:
+                # Disconnected while the pipeline ran: do not leave its lease behind.
+                if await self.release(sid, user_id):
+                    gone.append(await self.get_info(user_id))
+            elif int(added):
+                self._dirty[user_id] = True
+                restored[user_id] = self._info.get(sid) or {'user_id': user_id}
+
+        if restored:
+            logger.warning('Presence heartbeat restored %s reaped users.', len(restored))
+            if self.on_restored:
+                await self.on_restored(list(restored.values()))
+        if gone and self.on_expired:
+            await self.on_expired(gone)
+
+    async def sweep(self) -> None:
+        """Reap leases left behind by dead workers (one sweeper per cluster)."""
+        redis = get_redis()
+        acquired = await redis.set(_SWEEP_LOCK_KEY, os.getpid(), nx=True, ex=self.sweep_interval)
+        if not acquired:
+            return
+
+        now = time.time()
+        online_ids = [int(value) for value in await redis.smembers(_ONLINE_KEY)]
+        expired: List[Dict[str, Any]] = []
+        for user_id in online_ids:
+            went_offline = await redis.eval(
+                _RELEASE_SCRIPT, 2, _leases_key(user_id), _ONLINE_KEY, '', now, user_id,
+            )
+            if int(went_offline):
+                self._dirty[user_id] = False
+                expired.append(await self.get_info(user_id))
+
+        if expired:
+            logger.info('Presence sweeper expired %s stale users.', len(expired))
+            if self.on_expired:
+                await self.on_expired(expired)
+
+        still_online = set(online_ids) - {item['user_id'] for item in expired}
+        await run_db(self._reconcile_profiles, still_online)
+
+    async def sync_profiles(self) -> None:
+        """Write pending ``is_online`` transitions to Postgres in two statements."""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        try:
+            await run_db(self._write_profiles, dirty)
+        except Exception as exc:
+            logger.warning('Unable to sync %s presence changes: %s', len(dirty), exc)
+            # Keep newer transitions that happened while we were writing.
+            self._dirty = {**dirty, **self._dirty}
+
+    @staticmethod
+    def _write_profiles(dirty: Dict[int, bool]) -> None:
+        online = [user_id for user_id, value in dirty.items() if value]
+        offline = [user_id for user_id, value in dirty.items() if not value]
+        if online:
+            Profile.objects.filter(user_id__in=online, is_online=False).update(is_online=True)
+        if offline:
+            Profile.objects.filter(user_id__in=offline, is_online=True).update(is_online=False)
+
+    @staticmethod
+    def _reconcile_profiles(online_ids: set) -> None:
+        Profile.objects.filter(is_online=True).exclude(user_id__in=online_ids).update(is_online=False)
+        if online_ids:
+            Profile.objects.filter(user_id__in=online_ids, is_online=False).update(is_online=True)
+
+
+BatchEmitter = Callable[[List[Tuple[Dict[str, Any], bool]]], Awaitable[None]]
+
+
+class PresenceBatcher:
+    """
+    Coalesce presence transitions over a short window.
+
+    Only the net change per user is kept: a user that disconnects and
+    reconnects inside the same window produces no event at all. The emitter
+    receives the surviving ``(identity, is_online)`` pairs once per window.
+    """
+
+    def __init__(self, *, window: float, emit: BatchEmitter) -> None:
+        self.window = window
+        self.emit = emit
+        self._latest: Dict[int, Tuple[Dict[str, Any], bool]] = {}
+        self._initial: Dict[int, bool] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, identity: Dict[str, Any], is_online: bool) -> None:
+        user_id = identity['user_id']
+        # The state before the first transition in this window is the
+        # opposite of that transition.
+        self._initial.setdefault(user_id, not is_online)
+        self._latest[user_id] = (identity, is_online)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        try:
+            await self.flush()
+        except Exception:  # nobody awaits this task, so log instead of losing the error
+            logger.exception('Unable to emit a batch of presence changes.')
+
+    async def flush(self) -> None:
+        latest, initial = self._latest, self._initial
+        self._latest, self._initial = {}, {}
+        changes = [
+            (identity, is_online)
+            for user_id, (identity, is_online) in latest.items()
+            if is_online != initial[user_id]
+        ]
+        if changes:
+            await self.emit(changes)
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self.flush()
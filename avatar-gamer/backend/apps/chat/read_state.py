@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from redis.exceptions import RedisError
+
+from .conversations import conversation_cache
+from .db import run_db
+from .models import ChatMessage, Conversation, ConversationReadState
+from .redis_client import get_redis, get_sync_redis
+from .sequences import counter_key, stored_max_seq
+
+logger = logging.getLogger(__name__)
+
+_DIRTY_KEY = 'chat:read:dirty'
+_UNREAD_PREFIX = 'chat:unread:'
+
+# Rows fetched when rebuilding the counters of a user whose Redis state is gone.
+_REBUILD_LIMIT = 20000
+
+
+def _ready_key(user_id: int) -> str:
+    return f'chat:unread:ready:{user_id}'
+
+
+def _index_key(user_id: int) -> str:
+    return f'{_UNREAD_PREFIX}{user_id}'
+
+
+def _unread_key(user_id: int, conversation_id: str) -> str:
+    return f'{_UNREAD_PREFIX}{user_id}:{conversation_id}'
+
+
+def _watermarks_key(user_id: int) -> str:
+    return f'chat:read:{user_id}'
+
+
+def _dirty_member(user_id: int, conversation_id: str) -> str:
+    return f'{user_id}|{conversation_id}'
+
+
+# Counters are only touched once the user's state has been loaded; until then
+# the rebuild reads the message from the database. Returns the new count.
+_MARK_UNREAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+redis.call('ZADD', KEYS[2], ARGV[1], ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[2]) - 1)
+redis.call('SADD', KEYS[3], ARGV[3])
+return redis.call('ZCARD', KEYS[2])
+"""
+
+# Advances the watermark (never backwards, never past the last allocated seq)
+# and returns {watermark, unread}. ARGV[4] is the ceiling to use when the
+# sequence counter is not in Redis; {-1, -1} asks the caller to provide it.
+_READ_SCRIPT = """
+local latest = redis.call('GET', KEYS[4]) or ARGV[4]
+if latest == '' then
+    return {-1, -1}
+end
+local seq = math.min(tonumber(ARGV[2]), tonumber(latest))
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+if seq > current then
+    redis.call('HSET', KEYS[1], ARGV[1], seq)
+    redis.call('SADD', KEYS[5], ARGV[3])
+    current = seq
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', current)
+local left = redis.call('ZCARD', KEYS[2])
+if left == 0 then
+    redis.call('SREM', KEYS[3], ARGV[1])
+end
+return {current, left}
+"""
+
+# Returns a flat [conversation_id, count, ...] list for every unread conversation.
+_COUNTS_SCRIPT = """
+local out = {}
+for _, conversation_id in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    local count = redis.call('ZCARD', ARGV[1] .. conversation_id)
+    if count > 0 then
+        table.insert(out, conversation_id)
+        table.insert(out, count)
+    else
+        redis.call('SREM', KEYS[1], conversation_id)
+    end
+end
+return out
+"""
+
+
+def _cap() -> int:
+    return settings.CHAT_CONFIG["UNREAD_CAP"]
+
+
+def _counts_from_reply(reply: List[Any]) -> Dict[str, int]:
+    return {reply[i]: int(reply[i + 1]) for i in range(0, len(reply), 2)}
+
+
+# ---------------------------------------------------------------------------
+# Rebuild from Postgres
+# ---------------------------------------------------------------------------
+
+def _snapshot(user_id: int) -> Tuple[Dict[str, int], Dict[str, List[int]]]:
+    """Return ``(watermarks, unread seqs per conversation)`` from the database."""
+    watermarks = dict(
+        ConversationReadState.objects.filter(user_id=user_id).values_list('conversation__key', 'last_read_seq')
+    )
+    last_read = ConversationReadState.objects.filter(
+        user_id=user_id,
+        conversation_id=OuterRef('conversation_id'),
+    ).values('last_read_seq')[:1]
+    rows = (
+        ChatMessage.objects.filter(recipient_id=user_id)
+        .annotate(last_read=Coalesce(Subquery(last_read), Value(0)))
+        .filter(seq__gt=F('last_read'))
+        .order_by('-created_at')
+        .values_list('conversation__key', 'seq')[:_REBUILD_LIMIT]
+    )
+    unread: Dict[str, List[int]] = {}
+    for conversation_id, seq in rows:
+        unread.setdefault(conversation_id, []).append(seq)
+    return watermarks, unread
+
+
+def _queue_load(pipe: Any, user_id: int, watermarks: Dict[str, int], unread: Dict[str, List[int]]) -> None:
+    cap = _cap()
+    for conversation_id, seq in watermarks.items():
+        # HSETNX: a chat:read that raced with the rebuild already wrote a newer value.
+        pipe.hsetnx(_watermarks_key(user_id), conversation_id, seq)
+    for conversation_id, seqs in unread.items():
+        key = _unread_key(user_id, conversation_id)
+        pipe.delete(key)
+        pipe.zadd(key, {str(seq): seq for seq in seqs[:cap]})
+        pipe.sadd(_index_key(user_id), conversation_id)
+    pipe.set(_ready_key(user_id), 1)
+
+
+async def _ensure_loaded(user_id: int) -> None:
+    redis = get_redis()
+    if await redis.exists(_ready_key(user_id)):
+        return
+    watermarks, unread = await run_db(_snapshot, user_id)
+    async with redis.pipeline(transaction=True) as pipe:
+        _queue_load(pipe, user_id, watermarks, unread)
+        await pipe.execute()
+
+
+def _ensure_loaded_sync(user_id: int) -> None:
+    redis = get_sync_redis()
+    if redis.exists(_ready_key(user_id)):
+        return
+    watermarks, unread = _snapshot(user_id)
+    with redis.pipeline(transaction=True) as pipe:
+        _queue_load(pipe, user_id, watermarks, unread)
+        pipe.execute()
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+async def mark_unread(user_id: int, conversation_id: str, seq: int) -> Optional[int]:
+    """
+    Count a newly stored message for its recipient.
+
+    Returns the recipient's new unread count for the conversation, or ``None``
+    when their counters are not loaded (they are rebuilt on first use).
+    """
+    try:
+        count = await get_redis().eval(
+            _MARK_UNREAD_SCRIPT,
+            3,
+            _ready_key(user_id),
+            _unread_key(user_id, conversation_id),
+            _index_key(user_id),
+            seq,
+            _cap(),
+            conversation_id,
+        )
+    except RedisError as exc:
+        logger.warning('Unread counter update failed for %s/%s: %s', user_id, conversation_id, exc)
+        return None
+    count = int(count)
+    return count if count >= 0 else None
+
+
+async def mark_read(user_id: int, conversation_id: str, seq: int) -> Tuple[int, int]:
+    """Advance the user's watermark; return ``(last_read_seq, unread)``."""
+    await _ensure_loaded(user_id)
+    ceiling = ''
+    while True:
+        watermark, unread = await get_redis().eval(
+            _READ_SCRIPT,
+            5,
+            _watermarks_key(user_id),
+            _unread_key(user_id, conversation_id),
+            _index_key(user_id),
+            counter_key(conversation_id),
+            _DIRTY_KEY,
+            conversation_id,
+            seq,
+            _dirty_member(user_id, conversation_id),
+            ceiling,
+        )
+        if int(watermark) >= 0 or ceiling != '':
+            return int(watermark), int(unread)
+        ceiling = await run_db(stored_max_seq, conversation_id)
+
+
+async def unread_counts(user_id: int) -> Dict[str, int]:
+    """Unread messages per conversation, only for conversations that have any."""
+    await _ensure_loaded(user_id)
+    reply = await get_redis().eval(_COUNTS_SCRIPT, 1, _index_key(user_id), f'{_UNREAD_PREFIX}{user_id}:')
+    return _counts_from_reply(reply)
+
+
+def unread_counts_sync(user_id: int) -> Dict[str, int]:
+    """Blocking variant of :func:`unread_counts` for the REST API."""
+    _ensure_loaded_sync(user_id)
+    reply = get_sync_redis().eval(_COUNTS_SCRIPT, 1, _index_key(user_id), f'{_UNREAD_PREFIX}{user_id}:')
+    return _counts_from_reply(reply)
+
+
+def as_payload(counts: Dict[str, int]) -> Dict[str, Any]:
+    """Shape shared by ``GET /api/v1/chat/unread`` and the ``chat:unread`` event."""
+    return {
+        'conversations': [
+            {'conversationId': conversation_id, 'unread': count}
+            for conversation_id, count in sorted(counts.items())
+        ],
+        'total': sum(counts.values()),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Batched persistence
+# ---------------------------------------------------------------------------
+
+def _store(watermarks: List[Tuple[int, str, int]]) -> None:
+    """Upsert ``(user_id, conversation key, last_read_seq)`` watermarks."""
+    pks: Dict[str, int] = {}
+    missing = []
+    for key in {key for _, key, _ in watermarks}:
+        pk = conversation_cache.get(key)
+        if pk is None:
+            missing.append(key)
+        else:
+            pks[key] = pk
+    if missing:
+        for key, pk in Conversation.objects.filter(key__in=missing).values_list('key', 'id'):
+            conversation_cache.set(key, pk)
+            pks[key] = pk
+    # A conversation without messages has no row, and nothing to be unread.
+    rows = [
+        ConversationReadState(user_id=user_id, conversation_id=pks[key], last_read_seq=seq)
+        for user_id, key, seq in watermarks
+        if key in pks
+    ]
+    if rows:
+        _upsert(rows)
+
+
+def _upsert(rows: List[ConversationReadState]) -> None:
+    fields = {
+        'update_conflicts': True,
+        'unique_fields': ['user', 'conversation'],
+        'update_fields': ['last_read_seq', 'updated_at'],
+    }
+    try:
+        with transaction.atomic():
+            ConversationReadState.objects.bulk_create(rows, **fields)
+        return
+    except IntegrityError:
+        logger.warning('Bulk upsert of %s read states failed; retrying row by row.', len(rows))
+
+    for row in rows:
+        try:
+            with transaction.atomic():
+                ConversationReadState.objects.bulk_create([row], **fields)
+        except IntegrityError as exc:
+            logger.error('Dropping read state %s that cannot be stored: %s', row, exc)
+
+
+class ReadStateFlusher:
+    """
+    Periodically copies changed watermarks from Redis to Postgres.
+
+    ``chat:read`` only marks ``user|conversation`` pairs dirty in a Redis set;
+    any worker can drain it (``SPOP`` hands each pair to exactly one of them)
+    and write up to ``batch_size`` rows per statement.
+    """
+
+    def __init__(self, *, interval: int, batch_size: int) -> None:
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except RedisError as exc:
+            logger.warning('Final read state flush failed: %s', exc)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except RedisError as exc:
+                logger.warning('Read state flush failed: %s', exc)
+            except Exception:  # pragma: no cover - keep the loop alive
+                logger.exception('Unexpected error in read state flusher.')
+
+    async def flush(self) -> None:
+        redis = get_redis()
+        while True:
+            members = await redis.spop(_DIRTY_KEY, self.batch_size)
+            if not members:
+                return
+
+            pairs = []
+            for member in members:
+                user_id, conversation_id = member.split('|', 1)
+                pairs.append((int(user_id), conversation_id))
+            async with redis.pipeline(transaction=False) as pipe:
+                for user_id, conversation_id in pairs:
+                    pipe.hget(_watermarks_key(user_id), conversation_id)
+                values = await pipe.execute()
+
+            watermarks = [
+                (user_id, conversation_id, int(value))
+                for (user_id, conversation_id), value in zip(pairs, values)
+                if value is not None
+            ]
+            try:
+                await run_db(_store, watermarks)
+            except DatabaseError as exc:
+                logger.error('Unable to store %s read states, retrying later: %s', len(watermarks), exc)
+                await redis.sadd(_DIRTY_KEY, *members)
+                return
+            if len(members) < self.batch_size:
+                return
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+_client: Optional[aioredis.Redis] = None
+_sync_client: Optional[redis.Redis] = None
+
+
+def get_redis() -> aioredis.Redis:
+    """
+    Return the shared asyncio Redis client for chat state.
+
+    It points at the same Redis instance used by the Socket.IO
+    ``AsyncRedisManager`` and is created lazily so importing this module never
+    opens a connection.
+    """
+    global _client
+    if _client is None:
+        _client = aioredis.Redis.from_url(
+            settings.SOCKETIO_CONFIG["REDIS_URL"],
+            decode_responses=True,
+        )
+    return _client
+
+
+def get_sync_redis() -> redis.Redis:
+    """Blocking counterpart of :func:`get_redis` for regular (WSGI style) views."""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(
+            settings.SOCKETIO_CONFIG["REDIS_URL"],
+            decode_responses=True,
+        )
+    return _sync_client
@@ -0,0 +1,96 @@
+"""
+Withdraw cached authorizations when an ``OperatorUserLink`` is deleted.
+
+Sockets remember what they were authorized for (``conversations`` in the chat
+session, linked robots in ``/robot``), so that hot events do not hit the link
+cache. Deleting a link publishes the pair on a Redis channel once the
+transaction commits; every process listens on it and lets its handlers drop
+the matching entries from its own sockets.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from redis.exceptions import RedisError
+
+from apps.accounts.links import invalidate_linked_user_ids
+from apps.accounts.models import OperatorUserLink
+from .redis_client import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'chat:links:revoked'
+
+RevokeCallback = Callable[[int, int], Awaitable[None]]
+
+
+def publish(operator_id: int, user_id: int) -> None:
+    """Blocking: announce that ``operator_id`` and ``user_id`` are no longer linked."""
+    # The links cache must already be clean when listeners re-authorize.
+    invalidate_linked_user_ids(operator_id, user_id)
+    try:
+        get_sync_redis().publish(CHANNEL, json.dumps([operator_id, user_id]))
+    except RedisError as exc:
+        logger.warning('Could not announce unlink of %s/%s: %s', operator_id, user_id, exc)
+
+
+@receiver(post_delete, sender=OperatorUserLink)
+def _link_deleted(sender, instance, **kwargs) -> None:
+    operator_id, user_id = instance.operator_id, instance.user_id
+    transaction.on_commit(lambda: publish(operator_id, user_id))
+
+
+class RevocationListener:
+    """Runs the registered callbacks for every unlink announced on ``CHANNEL``."""
+
+    def __init__(self, *, retry_interval: float = 1.0) -> None:
+        self.retry_interval = retry_interval
+        self._callbacks: List[RevokeCallback] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, callback: RevokeCallback) -> None:
+        self._callbacks.append(callback)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def revoke(self, operator_id: int, user_id: int) -> None:
+        for callback in self._callbacks:
+            try:
+                await callback(operator_id, user_id)
+            except Exception:  # pragma: no cover - one handler must not starve the others
+                logger.exception('Revocation handler failed for %s/%s.', operator_id, user_id)
+
+    async def _run(self) -> None:
+        while True:
+            pubsub = get_redis().pubsub()
+            try:
+                await pubsub.subscribe(CHANNEL)
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        operator_id, user_id = json.loads(message['data'])
+                        await self.revoke(operator_id, user_id)
+            except RedisError as exc:
+                logger.warning('Unlink listener lost Redis, retrying: %s', exc)
+                await asyncio.sleep(self.retry_interval)
+            finally:
+                await pubsub.aclose()
+
+
+listener = RevocationListener()
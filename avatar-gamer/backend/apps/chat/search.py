@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+import uuid
+from typing import Any, List, Optional, Tuple
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+from django.utils.dateparse import parse_datetime
+
+from apps.accounts.links import linked_user_ids
+from apps.accounts.models import Role
+from .models import SEARCH_CONFIG, ChatMessage, ConversationParticipant
+
+
+def encode_cursor(message: ChatMessage) -> str:
+    raw = json.dumps({'r': message.rank, 't': message.created_at.isoformat(), 'id': str(message.id)})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(value: Optional[str]) -> Optional[Tuple[float, Any, uuid.UUID]]:
+    """Return ``(rank, created_at, id)`` or ``None`` for a missing/invalid cursor."""
+    if not value:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(value.encode()))
+        created_at = parse_datetime(data['t'])
+        if created_at is None:
+            return None
+        return float(data['r']), created_at, uuid.UUID(data['id'])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None
+
+
+def _searchable_conversations(user_id: int):
+    """
+    Conversations of ``user_id`` the socket layer would still authorize.
+
+    Participant rows outlive an ``OperatorUserLink``, so membership alone is
+    not enough: as in ``sockets._authorize_conversation``, an admin may search
+    any of their conversations, and everyone else only those whose other
+    participant is an admin or a currently linked account.
+    """
+    peers = (
+        ConversationParticipant.objects.filter(Q(role=Role.ADMIN) | Q(user_id__in=linked_user_ids(user_id)))
+        .exclude(user_id=user_id)
+        .values('conversation_id')
+    )
+    return (
+        ConversationParticipant.objects.filter(user_id=user_id)
+        .filter(Q(role=Role.ADMIN) | Q(conversation_id__in=peers))
+        .values('conversation_id')
+    )
+
+
+def search_messages(
+    user_id: int,
+    text: str,
+    *,
+    limit: int,
+    cursor: Optional[Tuple[float, Any, uuid.UUID]] = None,
+    conversation_id: Optional[str] = None,
+) -> Tuple[List[ChatMessage], bool]:
+    """
+    Full-text search over the caller's conversations, best match first.
+
+    The ``@@`` match is answered by the GIN index on ``search_vector``; only
+    matching rows in conversations the user may still open are ranked (see
+    ``_searchable_conversations``). Pages continue after
+    ``(rank, created_at, id)`` of the previous page's last hit; the rank is
+    cast from ``real`` to double precision so the float carried in the cursor
+    compares equal to the ranks it was read from.
+    """
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    conversations = _searchable_conversations(user_id)
+
+    qs = (
+        ChatMessage.objects.filter(search_vector=query, conversation_id__in=conversations)
+        .annotate(
+            conversation_key=F('conversation__key'),
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+            highlight=SearchHeadline(
+                'text',
+                query,
+                config=SEARCH_CONFIG,
+                start_sel='<mark>',
+                stop_sel='</mark>',
+                max_fragments=2,
+            ),
+        )
+    )
+    if conversation_id:
+        qs = qs.filter(conversation__key=conversation_id)
+    if cursor is not None:
+        rank, created_at, message_id = cursor
+        qs = qs.filter(
+            Q(rank__lt=rank)
+            | Q(rank=rank, created_at__lt=created_at)
+            | Q(rank=rank, created_at=created_at, id__lt=message_id)
+        )
+
+    rows = list(qs.order_by('-rank', '-created_at', '-id')[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
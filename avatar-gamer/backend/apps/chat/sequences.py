@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import logging
+from typing import Callable, Optional
+
+from django.db.models import Max
+from redis.exceptions import RedisError
+
+from .conversations import resolve_conversation
+from .db import run_db
+from .models import ChatMessage
+from .redis_client import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = 'chat:seq:'
+
+# Returns the next sequence, or nil when the counter has not been seeded yet.
+_NEXT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+return redis.call('INCR', KEYS[1])
+"""
+
+# Seeds the counter unless another node already did, then allocates.
+_SEED_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'NX')
+return redis.call('INCR', KEYS[1])
+"""
+
+# Moves the counter forward to ARGV[1] if it is behind (never backwards).
+_ADVANCE_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+"""
+
+# Hands ARGV[1] back if it is still the last number given out.
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DECR', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+def counter_key(conversation_id: str) -> str:
+    return f'{_KEY_PREFIX}{conversation_id}'
+
+
+def stored_max_seq(conversation_id: str) -> int:
+    pk = resolve_conversation(conversation_id)
+    if pk is None:
+        return 0
+    return ChatMessage.objects.filter(conversation_id=pk).aggregate(value=Max('seq'))['value'] or 0
+
+
+async def allocate(conversation_id: str, pending_max: Optional[Callable[[], int]] = None) -> int:
+    """
+    Return the next sequence number of a conversation.
+
+    Counters live in Redis (``INCR``) and are seeded lazily from the highest
+    stored ``seq`` the first time a conversation is seen, or after Redis lost
+    the key. ``pending_max`` lets the caller account for messages that were
+    already numbered but are still waiting in the write-behind buffer.
+
+    Callers allocate only for messages they are about to store (retries are
+    answered from the dedupe entry) and ``release`` the number when the store
+    fails, so numbers are normally consecutive. A gap is still possible when a
+    release loses the race against the next allocation or Redis is down, so
+    clients must treat them as an ordering, not a count.
+    """
+    key = counter_key(conversation_id)
+    redis = get_redis()
+    try:
+        seq = await redis.eval(_NEXT_SCRIPT, 1, key)
+        if seq is not None:
+            return int(seq)
+    except RedisError as exc:
+        logger.warning('Sequence allocation failed for %s: %s', conversation_id, exc)
+        return await _floor(conversation_id, pending_max) + 1
+
+    floor = await _floor(conversation_id, pending_max)
+    try:
+        return int(await redis.eval(_SEED_SCRIPT, 1, key, floor))
+    except RedisError as exc:
+        logger.warning('Sequence seeding failed for %s: %s', conversation_id, exc)
+        return floor + 1
+
+
+async def release(conversation_id: str, seq: int) -> None:
+    """Give back ``seq`` after its message was not stored, unless a later one was numbered."""
+    try:
+        await get_redis().eval(_RELEASE_SCRIPT, 1, counter_key(conversation_id), seq)
+    except RedisError as exc:
+        logger.warning('Sequence release failed for %s: %s', conversation_id, exc)
+
+
+async def _floor(conversation_id: str, pending_max: Optional[Callable[[], int]]) -> int:
+    floor = await run_db(stored_max_seq, conversation_id)
+    if pending_max is not None:
+        floor = max(floor, pending_max())
+    return floor
+
+
+def advance(conversation_id: str, seq: int) -> None:
+    """Blocking: make sure the counter never hands out ``seq`` or lower again."""
+    try:
+        get_sync_redis().eval(_ADVANCE_SCRIPT, 1, counter_key(conversation_id), seq)
+    except RedisError as exc:
+        logger.warning('Sequence advance failed for %s: %s', conversation_id, exc)
@@ -0,0 +1,59 @@
+from rest_framework import serializers
+
+from .models import ConversationParticipant
+
+
+class ConversationListItemSerializer(serializers.Serializer):
+    """
+    Inbox entry built from a ``ConversationParticipant`` row of the caller.
+
+    Expects ``conversation`` and ``conversation.participants`` (with
+    ``user``) to be loaded up front; ``unread`` comes from the
+    ``unread_counts`` context.
+    """
+
+    def to_representation(self, instance: ConversationParticipant):
+        conversation = instance.conversation
+        last_message = None
+        if conversation.last_message_id:
+            last_message = {
+                'id': str(conversation.last_message_id),
+                'text': conversation.last_message_text,
+                'senderId': conversation.last_message_sender_id,
+                'seq': conversation.last_message_seq,
+                'timestamp': conversation.last_message_at.isoformat(),
+            }
+        return {
+            'conversationId': conversation.key,
+            'participants': [
+                {
+                    'id': participant.user_id,
+                    'role': participant.role,
+                    'username': participant.user.username,
+                    'firstName': participant.user.first_name,
+                    'lastName': participant.user.last_name,
+                }
+                for participant in conversation.participants.all()
+            ],
+            'lastMessage': last_message,
+            'messageCount': conversation.message_count,
+            'unread': self.context.get('unread_counts', {}).get(conversation.key, 0),
+        }
+
+
+class MessageSearchResultSerializer(serializers.Serializer):
+    """Search hit with the same message fields the socket events use."""
+
+    def to_representation(self, instance):
+        return {
+            'id': str(instance.id),
+            'conversationId': instance.conversation_key,
+            'text': instance.text,
+            'highlight': instance.highlight,
+            'senderId': instance.sender_id,
+            'senderRole': instance.sender_role,
+            'recipientId': instance.recipient_id,
+            'seq': instance.seq,
+            'timestamp': instance.created_at.isoformat(),
+            'rank': instance.rank,
+        }
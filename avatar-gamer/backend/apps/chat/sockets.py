@@ -1,33 +1,73 @@
 from __future__ import annotations
 
 import logging
+import uuid
 from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 from urllib.parse import parse_qs
 
 import redis
-import socketio
-from asgiref.sync import sync_to_async
-from django.contrib.auth import get_user_model
 from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from redis.exceptions import RedisError
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
-
-from apps.accounts.models import Profile, Role
+from rest_framework_simplejwt.settings import api_settings as jwt_api_settings
+
+from apps.accounts.identity import get_identity, identity_cache
+from apps.accounts.links import linked_user_ids_many
+from apps.accounts.models import Role
+from . import dedupe, history_cache, ids, read_state, revocations, sequences
+from .conversations import conversation_cache, load_conversation, parse_conversation_id, resolve_conversation
+from .db import get_executor, run_db
+from .instrumentation import InstrumentedServerMixin, register_server_collector
 from .models import ChatMessage
+from .persistence import MessageWriteBuffer, insert_message
+from .presence import PresenceBatcher, PresenceTracker
+from .read_state import ReadStateFlusher
+from .sticky import engineio_server_class
+from .throttle import RateLimiter
+from .wire import MSGPACK, MsgPackCodec, NegotiatingAsyncServer, NegotiatingRedisManager
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
-User = get_user_model()
-redis_manager = socketio.AsyncRedisManager(settings.SOCKETIO_CONFIG["REDIS_URL"])
-sio = socketio.AsyncServer(
+redis_manager = NegotiatingRedisManager(
+    settings.SOCKETIO_CONFIG["REDIS_URL"],
+    codec=MsgPackCodec if settings.SOCKETIO_CONFIG["PUBSUB_SERIALIZER"] == MSGPACK else None,
+)
+
+
+class ChatServer(InstrumentedServerMixin, NegotiatingAsyncServer):
+    """Socket.IO server with per-client wire format and handler metrics."""
+
+    def _engineio_server_class(self):
+        # Under config.launcher each worker tags its sids for sticky routing.
+        return engineio_server_class(settings.SOCKETIO_CONFIG["WORKER_ID"])
+
+
+sio = ChatServer(
     async_mode='asgi',
     cors_allowed_origins=settings.SOCKETIO_CONFIG["CORS_ALLOWED_ORIGINS"],
-    client_manager=redis_manager
+    client_manager=redis_manager,
+    msgpack_enabled=settings.SOCKETIO_CONFIG["MSGPACK"],
 )
+register_server_collector(sio, lambda: get_executor().stats())
 jwt_auth = JWTAuthentication()
-_active_connections: Dict[int, int] = defaultdict(int)
+_CLIENT_MESSAGE_ID_MAX_LENGTH = ChatMessage._meta.get_field('client_message_id').max_length
+message_buffer: Optional[MessageWriteBuffer] = (
+    MessageWriteBuffer(
+        batch_size=settings.CHAT_CONFIG["WRITE_BEHIND_BATCH_SIZE"],
+        flush_interval=settings.CHAT_CONFIG["WRITE_BEHIND_FLUSH_MS"] / 1000,
+        max_pending=settings.CHAT_CONFIG["WRITE_BEHIND_MAX_PENDING"],
+        spool_dir=settings.CHAT_CONFIG["WRITE_BEHIND_SPOOL_DIR"],
+    )
+    if settings.CHAT_CONFIG["WRITE_BEHIND"]
+    else None
+)
 
 
 # ---------------------------------------------------------------------------
@@ -58,141 +98,405 @@ def _build_conversation_id(participants: Iterable[Dict[str, Any]]) -> Optional[s
     return f'conversation:{filtered[0]}:{filtered[1]}'
 
 
-def _serialize_message(message: ChatMessage) -> Dict[str, Any]:
+def _serialize_message(message: ChatMessage, conversation_id: str) -> Dict[str, Any]:
     return {
         'id': str(message.id),
         'clientMessageId': message.client_message_id or None,
-        'conversationId': message.conversation_id,
+        'conversationId': conversation_id,
         'text': message.text,
         'senderId': message.sender_id,
         'senderRole': message.sender_role,
         'recipientId': message.recipient_id,
+        'seq': message.seq,
         'timestamp': message.created_at.isoformat(),
     }
 
 
-async def _set_user_online(user_id: int, online: bool) -> Tuple[Optional[Dict[str, Any]], bool]:
-    def _update() -> Tuple[Optional[Dict[str, Any]], bool]:
-        try:
-            user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            return None, False
+def _presence_payload(identity: Dict[str, Any], is_online: bool) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        'userId': identity['user_id'],
+        'role': identity.get('role') or Role.USER,
+        'isOnline': is_online,
+    }
+    if identity.get('username'):
+        payload['username'] = identity['username']
+    if identity.get('first_name'):
+        payload['firstName'] = identity['first_name']
+    if identity.get('last_name'):
+        payload['lastName'] = identity['last_name']
+    return payload
+
+
+def _broadcast_presence(identity: Dict[str, Any], is_online: bool) -> None:
+    presence_batcher.add(identity, is_online)
+
+
+def _personal_room(user_id: int) -> str:
+    return f'user:{user_id}'
+
+
+def _presence_room(user_id: int, batched: bool) -> str:
+    return f'presence:{user_id}' if batched else f'presence-legacy:{user_id}'
+
+
+def _admin_presence_room(batched: bool) -> str:
+    return 'presence:admins' if batched else 'presence-legacy:admins'
+
+
+async def _emit_presence(updates: List[Dict[str, Any]], batched_rooms: List[str], legacy_rooms: List[str]) -> None:
+    await sio.emit('presence:batch', {'updates': updates}, room=batched_rooms)
+    # Clients that did not opt in to batches keep receiving one event per user.
+    for payload in updates:
+        await sio.emit('presence:update', payload, room=legacy_rooms)
 
-        profile, _ = Profile.objects.get_or_create(
-            user=user,
-            defaults={'role': Role.USER, 'bio': ''},
+
+async def _emit_presence_batch(changes: List[Tuple[Dict[str, Any], bool]]) -> None:
+    """
+    Deliver presence to the linked counterparts of each user, and all of it
+    to admins.
+
+    Recipients that should receive the same set of updates are addressed with
+    a single emit over a list of rooms, so the cost grows with links rather
+    than with connected sockets.
+    """
+    adjacency = await run_db(
+        linked_user_ids_many,
+        [identity['user_id'] for identity, _ in changes],
+    )
+
+    updates = [_presence_payload(identity, is_online) for identity, is_online in changes]
+    per_recipient: Dict[int, List[int]] = defaultdict(list)
+    for index, (identity, _) in enumerate(changes):
+        for recipient_id in adjacency.get(identity['user_id']) or ():
+            per_recipient[recipient_id].append(index)
+
+    groups: Dict[Tuple[int, ...], List[int]] = defaultdict(list)
+    for recipient_id, indexes in per_recipient.items():
+        groups[tuple(indexes)].append(recipient_id)
+
+    for indexes, recipients in groups.items():
+        await _emit_presence(
+            [updates[index] for index in indexes],
+            [_presence_room(recipient_id, True) for recipient_id in recipients],
+            [_presence_room(recipient_id, False) for recipient_id in recipients],
         )
+    # Admins are not linked to anyone and keep seeing every user.
+    await _emit_presence(updates, [_admin_presence_room(True)], [_admin_presence_room(False)])
 
-        changed = profile.is_online != online
-        if changed:
-            profile.is_online = online
-            profile.save(update_fields=['is_online'])
 
-        return {
-            'user_id': user.id,
-            'role': profile.role,
-            'username': user.username,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-        }, changed
+def _wants_presence_batch(auth_payload: Any, query_params: Dict[str, Any]) -> bool:
+    if isinstance(auth_payload, dict) and auth_payload.get('presenceBatch'):
+        return True
+    return query_params.get('presenceBatch') in {'1', 'true'}
 
-    try:
-        return await sync_to_async(_update)()
-    except Exception as exc:  # pragma: no cover - defensive guard
-        logger.warning('Unable to update online state for user %s: %s', user_id, exc)
-        return None, False
 
+async def _announce_expired(identities: List[Dict[str, Any]]) -> None:
+    for identity in identities:
+        _broadcast_presence(identity, False)
 
-async def _broadcast_presence(
-    *,
-    user_id: int,
-    role: str,
-    is_online: bool,
-    username: Optional[str] = None,
-    first_name: Optional[str] = None,
-    last_name: Optional[str] = None,
-) -> None:
-    payload: Dict[str, Any] = {
-        'userId': user_id,
-        'role': role,
-        'isOnline': is_online,
-    }
-    if username:
-        payload['username'] = username
-    if first_name:
-        payload['firstName'] = first_name
-    if last_name:
-        payload['lastName'] = last_name
 
-    await sio.emit('presence:update', payload)
+async def _announce_restored(identities: List[Dict[str, Any]]) -> None:
+    for identity in identities:
+        _broadcast_presence(identity, True)
 
 
-async def _fetch_user(user_id: int) -> Optional[User]:
-    try:
-        return await sync_to_async(User.objects.select_related('profile').get)(id=user_id)
-    except User.DoesNotExist:
+async def _authorize_conversation(
+    session: Dict[str, Any],
+    conversation_id: str,
+) -> Optional[Dict[str, Any]]:
+    """
+    Check that the session user is a participant of ``conversation_id`` and is
+    allowed to talk to the other participant.
+
+    Operators and users must be linked through ``OperatorUserLink``; admins may
+    talk to anyone whose role matches the id. Lookups go through the link and
+    identity caches, and the result is stored in the socket session so
+    ``chat:message`` can be authorized without touching the database.
+    """
+    authorized = session.setdefault('conversations', {})
+    if conversation_id in authorized:
+        return authorized[conversation_id]
+
+    participants = parse_conversation_id(conversation_id)
+    if participants is None:
         return None
 
+    user_id = session.get('user_id')
+    own = (session.get('user_role', Role.USER), user_id)
+    if own not in participants:
+        return None
+    others = [participant for participant in participants if participant != own]
+    if len(others) != 1:
+        return None
+    peer_role, peer_id = others[0]
 
-async def _ensure_recipient(user_id: Optional[int]) -> Optional[User]:
-    if user_id is None:
+    peer = await run_db(get_identity, peer_id)
+    if peer is None or peer['role'] != peer_role:
         return None
-    return await _fetch_user(user_id)
 
+    roles = {own[0], peer_role}
+    if roles == {Role.OPERATOR, Role.USER}:
+        linked = await run_db(linked_user_ids_many, [user_id])
+        if peer_id not in linked[user_id]:
+            return None
+    elif Role.ADMIN not in roles:
+        return None
 
-async def _ensure_profile(user: User) -> Optional[Profile]:
-    def _get() -> Profile:
-        profile, _ = Profile.objects.get_or_create(
-            user=user,
-            defaults={'role': Role.USER, 'bio': ''},
-        )
-        return profile
+    authorized[conversation_id] = {'peer_id': peer_id, 'peer_role': peer_role}
+    return authorized[conversation_id]
 
-    try:
-        return await sync_to_async(_get)()
-    except Exception as exc:  # pragma: no cover - defensive guard
-        logger.warning('Unable to ensure profile for user %s: %s', user.id, exc)
-        return None
+
+async def _revoke_conversations(operator_id: int, user_id: int) -> None:
+    """
+    Forget the conversations authorized between two users that were just
+    unlinked, on every socket of either of them connected to this process, and
+    take those sockets out of the conversation rooms.
+    """
+    for own_id, peer_id in ((operator_id, user_id), (user_id, operator_id)):
+        for sid, _ in list(sio.manager.get_participants('/', _personal_room(own_id))):
+            try:
+                session = await sio.get_session(sid)
+            except KeyError:
+                continue
+            authorized = session.get('conversations', {})
+            revoked = [key for key, entry in authorized.items() if entry['peer_id'] == peer_id]
+            for conversation_id in revoked:
+                del authorized[conversation_id]
+                await sio.leave_room(sid, conversation_id)
+            if revoked:
+                logger.info('Revoked %d conversation(s) of socket %s after unlink.', len(revoked), sid)
+
+
+revocations.listener.add(_revoke_conversations)
 
 
-async def _store_message(
+async def _conversation_pk(conversation_id: str, *, create: bool = False) -> Optional[int]:
+    """Integer id for a conversation key; cache hits stay on the event loop."""
+    pk = conversation_cache.get(conversation_id)
+    if pk is None:
+        pk = await run_db(load_conversation, conversation_id, create=create)
+    return pk
+
+
+def _build_message(
     *,
-    conversation_id: str,
+    conversation_id: int,
     sender_id: int,
     sender_role: str,
     recipient_id: Optional[int],
     text: str,
     client_message_id: Optional[str],
+    seq: Optional[int] = None,
 ) -> ChatMessage:
-    def _create() -> ChatMessage:
-        return ChatMessage.objects.create(
-            conversation_id=conversation_id,
-            sender_id=sender_id,
-            sender_role=sender_role,
-            recipient_id=recipient_id,
-            text=text,
-            client_message_id=client_message_id or None,
-        )
+    # Id and timestamp are assigned here so the message can be acknowledged
+    # and broadcast before it reaches the database when write-behind is on.
+    # Both come from the same instant so id order matches created_at order.
+    now = timezone.now()
+    return ChatMessage(
+        id=ids.uuid7(now),
+        created_at=now,
+        conversation_id=conversation_id,
+        sender_id=sender_id,
+        sender_role=sender_role,
+        recipient_id=recipient_id,
+        text=text,
+        client_message_id=client_message_id or None,
+        seq=seq,
+    )
+
+
+async def _allocate_seq(conversation_id: str, conversation_pk: int) -> int:
+    pending_max = partial(message_buffer.max_seq, conversation_pk) if message_buffer is not None else None
+    return await sequences.allocate(conversation_id, pending_max)
 
-    return await sync_to_async(_create)()
 
+async def _store_message(message: ChatMessage) -> Tuple[ChatMessage, bool]:
+    """Persist ``message``; return the canonical row and whether it is new."""
+    if message_buffer is not None:
+        await message_buffer.enqueue(message)
+        return message, True
+    return await run_db(insert_message, message)
 
-async def _load_history(conversation_id: str, limit: int = 200) -> List[Dict[str, Any]]:
-    def _query() -> List[Dict[str, Any]]:
-        qs: QuerySet[ChatMessage] = ChatMessage.objects.filter(
-            conversation_id=conversation_id
-        ).order_by('created_at')[:limit]
-        return [_serialize_message(message) for message in qs]
 
-    return await sync_to_async(_query)()
+def _ack(message: Dict[str, Any], duplicate: bool) -> Dict[str, Any]:
+    return {
+        'ok': True,
+        'id': message['id'],
+        'clientMessageId': message['clientMessageId'],
+        'seq': message.get('seq'),
+        'timestamp': message['timestamp'],
+        'duplicate': duplicate,
+    }
+
+
+def _ack_error(code: str, **extra: Any) -> Dict[str, Any]:
+    return {'ok': False, 'error': code, **extra}
+
+
+async def _throttle(sid: str, session: Dict[str, Any], action: str, event: str) -> Optional[float]:
+    """
+    Take a rate-limit token; return ``None`` when allowed.
 
+    When the bucket is empty the client gets ``chat:throttled`` with the
+    number of seconds to back off, and that value is returned so handlers
+    with acks can repeat it. Runs before any database work.
+    """
+    wait = await rate_limiter.check(sid, session['user_id'], session.get('user_role'), action)
+    if not wait:
+        return None
+    retry_after = round(wait, 3)
+    logger.info('Throttled %s from user %s (sid=%s) for %.3fs', event, session['user_id'], sid, retry_after)
+    await sio.emit('chat:throttled', {'event': event, 'retryAfter': retry_after}, to=sid)
+    return retry_after
+
+
+def _history_page_size(requested: Any = None) -> int:
+    default = settings.CHAT_CONFIG["HISTORY_PAGE_SIZE"]
+    try:
+        size = int(requested)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, default))
+
+
+def _parse_cursor(raw: Any) -> Optional[Tuple[Optional[datetime], uuid.UUID]]:
+    """
+    Turn a client supplied cursor into ``(created_at, id)``.
+
+    The cursor is ``{id}`` (or the bare id); the timestamp is read from
+    UUIDv7 ids. ``{timestamp, id}`` cursors from older clients are still
+    accepted. ``created_at`` is ``None`` for legacy ids that do not encode it.
+    """
+    if isinstance(raw, str):
+        raw = {'id': raw}
+    if not isinstance(raw, dict) or not raw.get('id'):
+        return None
 
-async def _resolve_user_from_token(token: str) -> Tuple[int, str]:
+    try:
+        message_id = uuid.UUID(str(raw['id']))
+    except ValueError:
+        return None
+
+    timestamp = raw.get('timestamp')
+    if timestamp is None:
+        return ids.created_at_of(message_id), message_id
+    if not isinstance(timestamp, str):
+        return None
+    created_at = parse_datetime(timestamp)
+    if created_at is None:
+        return None
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at, dt_timezone.utc)
+    return created_at, message_id
+
+
+def _cursor_for(message: Dict[str, Any]) -> Dict[str, Any]:
+    return {'id': message['id']}
+
+
+async def _load_history(
+    conversation_id: str,
+    limit: Optional[int] = None,
+    before: Optional[Tuple[Optional[datetime], uuid.UUID]] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Return the newest ``limit`` messages older than ``before`` in chronological
+    order, plus whether older messages remain.
+
+    The query walks the ``(conversation, created_at)`` index backwards and
+    stops after ``limit + 1`` rows, so the cost does not depend on how long the
+    conversation is or how deep the client has paged. It first looks only at
+    the last ``HISTORY_RECENT_WINDOW_DAYS`` so that, with the table partitioned
+    by month, active conversations only touch the newest partitions; older
+    partitions are read only when the window does not fill the page.
+    """
+    page_size = limit or _history_page_size()
+    window = timedelta(days=settings.CHAT_CONFIG["HISTORY_RECENT_WINDOW_DAYS"])
+
+    def _query() -> Tuple[List[Dict[str, Any]], bool]:
+        pk = resolve_conversation(conversation_id)
+        if pk is None:
+            return [], False
+        qs: QuerySet[ChatMessage] = ChatMessage.objects.filter(conversation_id=pk)
+        upper = timezone.now()
+        if before is not None:
+            created_at, message_id = before
+            if created_at is None:
+                # Ids from before UUIDv7 do not carry their timestamp.
+                created_at = qs.filter(id=message_id).values_list('created_at', flat=True).first()
+                if created_at is None:
+                    return [], False
+            upper = created_at
+            # Range condition on created_at keeps the index scan bounded; the
+            # exclude only resolves ties within the same timestamp.
+            qs = qs.filter(created_at__lte=created_at).exclude(
+                created_at=created_at,
+                id__gte=message_id,
+            )
+
+        ordering = ('-created_at', '-id')
+        rows = list(qs.filter(created_at__gte=upper - window).order_by(*ordering)[:page_size + 1])
+        if len(rows) <= page_size:
+            rows += qs.filter(created_at__lt=upper - window).order_by(*ordering)[:page_size + 1 - len(rows)]
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        rows.reverse()
+        return [_serialize_message(message, conversation_id) for message in rows], has_more
+
+    return await run_db(_query)
+
+
+async def _load_since(conversation_id: str, last_seq: int, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Return up to ``limit`` messages with ``seq > last_seq`` in order, plus
+    whether more remain.
+
+    Small gaps are answered from the Redis history buffer; the database is only
+    hit when the buffer does not reach back to ``last_seq`` or its seqs after
+    ``last_seq`` are not consecutive (a skipped seq could be a lost message).
+    """
+    cached = await history_cache.get_recent(conversation_id)
+    if cached and all('seq' in message for message in cached) and cached[0]['seq'] <= last_seq + 1:
+        missing = [message for message in cached if message['seq'] > last_seq]
+        if all(message['seq'] == last_seq + offset for offset, message in enumerate(missing, start=1)):
+            return missing[:limit], len(missing) > limit
+
+    def _query() -> Tuple[List[Dict[str, Any]], bool]:
+        pk = resolve_conversation(conversation_id)
+        if pk is None:
+            return [], False
+        rows = list(
+            ChatMessage.objects.filter(conversation_id=pk, seq__gt=last_seq)
+            .order_by('seq')[:limit + 1]
+        )
+        return [_serialize_message(message, conversation_id) for message in rows[:limit]], len(rows) > limit
+
+    return await run_db(_query)
+
+
+async def _resolve_user_from_token(token: str) -> Dict[str, Any]:
+    """
+    Validate the JWT and return the caller's identity.
+
+    Reconnecting clients are served from the in-process identity cache without
+    leaving the event loop; misses go to the shared cache and then the
+    database in a single query.
+    """
     validated = jwt_auth.get_validated_token(token)
-    user = await sync_to_async(jwt_auth.get_user)(validated)
-    profile = await _ensure_profile(user)
-    role = profile.role if profile else Role.USER
-    return user.id, role
+    try:
+        # Recent simplejwt versions store the claim as a string.
+        user_id = int(validated[jwt_api_settings.USER_ID_CLAIM])
+    except (KeyError, TypeError, ValueError) as exc:
+        raise InvalidToken('Token contained no recognizable user identification') from exc
+
+    identity = identity_cache.get_local(user_id)
+    if identity is None:
+        identity = await run_db(get_identity, user_id)
+    if identity is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    if jwt_api_settings.CHECK_USER_IS_ACTIVE and not identity['is_active']:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    return identity
 
 
 def _extract_token(auth_payload: Any, environ: Dict[str, Any]) -> Optional[str]:
@@ -218,6 +522,54 @@ def _extract_query_params(environ: Dict[str, Any]) -> Dict[str, Any]:
     return {key: values[0] if values else None for key, values in parsed.items()}
 
 
+presence = PresenceTracker(
+    lease_ttl=settings.CHAT_CONFIG["PRESENCE_LEASE_TTL"],
+    heartbeat_interval=settings.CHAT_CONFIG["PRESENCE_HEARTBEAT_INTERVAL"],
+    sweep_interval=settings.CHAT_CONFIG["PRESENCE_SWEEP_INTERVAL"],
+    sync_interval=settings.CHAT_CONFIG["PRESENCE_DB_SYNC_INTERVAL"],
+    on_expired=_announce_expired,
+    on_restored=_announce_restored,
+)
+presence_batcher = PresenceBatcher(
+    window=settings.CHAT_CONFIG["PRESENCE_BATCH_WINDOW_MS"] / 1000,
+    emit=_emit_presence_batch,
+)
+rate_limiter = RateLimiter(
+    limits=settings.CHAT_CONFIG["RATE_LIMITS"] if settings.CHAT_CONFIG["RATE_LIMITS_ENABLED"] else {},
+    user_factor=settings.CHAT_CONFIG["RATE_LIMIT_USER_FACTOR"],
+    default_role=Role.USER,
+)
+read_flusher = ReadStateFlusher(
+    interval=settings.CHAT_CONFIG["READ_FLUSH_INTERVAL"],
+    batch_size=settings.CHAT_CONFIG["READ_FLUSH_BATCH_SIZE"],
+)
+
+
+# ---------------------------------------------------------------------------
+# Application lifecycle
+# ---------------------------------------------------------------------------
+
+
+async def startup() -> None:
+    """Start background workers; wired to the ASGI lifespan startup event."""
+    presence.start()
+    read_flusher.start()
+    revocations.listener.start()
+    if message_buffer is not None:
+        message_buffer.start()
+
+
+async def shutdown() -> None:
+    """Drain background workers; wired to the ASGI lifespan shutdown event."""
+    await revocations.listener.stop()
+    await presence.stop()
+    await presence_batcher.stop()
+    await read_flusher.stop()
+    if message_buffer is not None:
+        await message_buffer.stop()
+    get_executor().shutdown()
+
+
 # ---------------------------------------------------------------------------
 # Socket.IO event handlers
 # ---------------------------------------------------------------------------
@@ -231,10 +583,12 @@ async def connect(sid: str, environ: Dict[str, Any], auth: Any) -> bool:
         return False
 
     try:
-        user_id, role = await _resolve_user_from_token(token)
+        identity = await _resolve_user_from_token(token)
     except (AuthenticationFailed, InvalidToken, TokenError) as exc:
         logger.warning('Socket connection rejected: invalid token. %s', exc)
         return False
+    user_id = identity['user_id']
+    role = identity['role']
 
     query_params = _extract_query_params(environ)
     requested_user_id = query_params.get('userId')
@@ -256,21 +610,14 @@ async def connect(sid: str, environ: Dict[str, Any], auth: Any) -> bool:
         )
 
     await sio.save_session(sid, {'user_id': user_id, 'user_role': role})
+    batched = _wants_presence_batch(auth, query_params)
+    await sio.enter_room(sid, _personal_room(user_id))
+    await sio.enter_room(sid, _presence_room(user_id, batched))
+    if role == Role.ADMIN:
+        await sio.enter_room(sid, _admin_presence_room(batched))
 
-    previous_count = _active_connections[user_id]
-    _active_connections[user_id] = previous_count + 1
-
-    if previous_count == 0:
-        presence, _ = await _set_user_online(user_id, True)
-        if presence:
-            await _broadcast_presence(
-                user_id=presence['user_id'],
-                role=presence.get('role') or role,
-                is_online=True,
-                username=presence.get('username'),
-                first_name=presence.get('first_name'),
-                last_name=presence.get('last_name'),
-            )
+    if await presence.acquire(sid, user_id, identity):
+        _broadcast_presence(identity, True)
 
     logger.debug('Socket connected: sid=%s user=%s role=%s', sid, user_id, role)
     return True
@@ -278,6 +625,7 @@ async def connect(sid: str, environ: Dict[str, Any], auth: Any) -> bool:
 
 @sio.event
 async def disconnect(sid: str) -> None:
+    rate_limiter.forget(sid)
     try:
         session = await sio.get_session(sid)
     except KeyError:
@@ -289,23 +637,12 @@ async def disconnect(sid: str) -> None:
         logger.debug('Socket disconnected: sid=%s without user', sid)
         return
 
-    current = max(_active_connections[user_id] - 1, 0)
-    if current == 0:
-        _active_connections.pop(user_id, None)
-        presence, _ = await _set_user_online(user_id, False)
-        if presence:
-            await _broadcast_presence(
-                user_id=presence['user_id'],
-                role=presence.get('role') or session.get('user_role', Role.USER),
-                is_online=False,
-                username=presence.get('username'),
-                first_name=presence.get('first_name'),
-                last_name=presence.get('last_name'),
-            )
-    else:
-        _active_connections[user_id] = current
+    if await presence.release(sid, user_id):
+        info = await presence.get_info(user_id)
+        info.setdefault('role', session.get('user_role', Role.USER))
+        _broadcast_presence(info, False)
 
-    logger.debug('Socket disconnected: sid=%s user=%s remaining=%s', sid, user_id, _active_connections.get(user_id, 0))
+    logger.debug('Socket disconnected: sid=%s user=%s', sid, user_id)
 
 
 @sio.on('chat:join')
@@ -315,6 +652,8 @@ async def chat_join(sid: str, payload: Dict[str, Any]) -> None:
     if not user_id:
         logger.warning('chat:join ignored because session has no user.')
         return
+    if await _throttle(sid, session, 'join', 'chat:join') is not None:
+        return
 
     conversation_id = payload.get('conversationId')
     if not conversation_id:
@@ -323,12 +662,160 @@ async def chat_join(sid: str, payload: Dict[str, Any]) -> None:
         logger.warning('chat:join ignored due to missing conversation id. payload=%s', payload)
         return
 
+    if await _authorize_conversation(session, conversation_id) is None:
+        logger.warning('chat:join rejected: user %s may not access %s.', user_id, conversation_id)
+        return
+    await sio.save_session(sid, session)
+
     await sio.enter_room(sid, conversation_id)
-    history = await _load_history(conversation_id)
+    history = await history_cache.get_recent(conversation_id)
+    if history is None:
+        history, _ = await _load_history(conversation_id)
+        await history_cache.fill(conversation_id, history)
+    else:
+        history = history[-_history_page_size():]
     await sio.emit('chat:history', history, to=sid)
     logger.debug('User %s joined conversation %s', user_id, conversation_id)
 
 
+@sio.on('chat:history:page')
+async def chat_history_page(sid: str, payload: Dict[str, Any]) -> None:
+    session = await sio.get_session(sid)
+    user_id = session.get('user_id')
+    if not user_id:
+        logger.warning('chat:history:page ignored because session has no user.')
+        return
+    if await _throttle(sid, session, 'history', 'chat:history:page') is not None:
+        return
+
+    conversation_id = payload.get('conversationId')
+    if not conversation_id or conversation_id not in sio.rooms(sid):
+        logger.warning('chat:history:page ignored: socket %s has not joined %s.', sid, conversation_id)
+        return
+
+    before = _parse_cursor(payload.get('before'))
+    if before is None:
+        logger.warning('chat:history:page ignored due to invalid cursor. payload=%s', payload)
+        return
+
+    messages, has_more = await _load_history(
+        conversation_id,
+        limit=_history_page_size(payload.get('limit')),
+        before=before,
+    )
+    page = {
+        'conversationId': conversation_id,
+        'messages': messages,
+        'hasMore': has_more,
+        'nextCursor': _cursor_for(messages[0]) if has_more and messages else None,
+    }
+    await sio.emit('chat:history:page', page, to=sid)
+
+
+@sio.on('chat:sync')
+async def chat_sync(sid: str, payload: Dict[str, Any]) -> None:
+    """
+    Rejoin a conversation and send only the messages after ``lastSeq``.
+
+    Reconnecting clients use this instead of ``chat:join`` so they do not
+    download the whole history again. When ``hasMore`` is true the client asks
+    again with the ``seq`` of the last message it received.
+    """
+    session = await sio.get_session(sid)
+    user_id = session.get('user_id')
+    if not user_id:
+        logger.warning('chat:sync ignored because session has no user.')
+        return
+    if await _throttle(sid, session, 'join', 'chat:sync') is not None:
+        return
+
+    conversation_id = payload.get('conversationId')
+    if not conversation_id:
+        logger.warning('chat:sync ignored due to missing conversation id. payload=%s', payload)
+        return
+
+    try:
+        last_seq = int(payload.get('lastSeq'))
+    except (TypeError, ValueError):
+        logger.warning('chat:sync ignored due to invalid lastSeq. payload=%s', payload)
+        return
+
+    if conversation_id not in session.get('conversations', {}):
+        if await _authorize_conversation(session, conversation_id) is None:
+            logger.warning('chat:sync rejected: user %s may not access %s.', user_id, conversation_id)
+            return
+        await sio.save_session(sid, session)
+
+    # Enter the room before reading so anything stored meanwhile arrives as a
+    # regular chat:message instead of falling between the two.
+    await sio.enter_room(sid, conversation_id)
+    messages, has_more = await _load_since(
+        conversation_id,
+        max(last_seq, 0),
+        _history_page_size(payload.get('limit')),
+    )
+    await sio.emit(
+        'chat:sync',
+        {'conversationId': conversation_id, 'messages': messages, 'hasMore': has_more},
+        to=sid,
+    )
+
+
+@sio.on('chat:read')
+async def chat_read(sid: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Move the caller's read watermark in a conversation up to ``seq``.
+
+    The new watermark and unread count are also pushed to the user's other
+    sockets so every device clears its badge.
+    """
+    session = await sio.get_session(sid)
+    user_id = session.get('user_id')
+    if not user_id:
+        logger.warning('chat:read ignored because session has no user.')
+        return _ack_error('unauthenticated')
+
+    conversation_id = payload.get('conversationId')
+    try:
+        seq = int(payload.get('seq'))
+    except (TypeError, ValueError):
+        return _ack_error('invalid_seq')
+    if not conversation_id:
+        return _ack_error('missing_conversation')
+
+    if conversation_id not in session.get('conversations', {}):
+        if await _authorize_conversation(session, conversation_id) is None:
+            logger.warning('chat:read rejected: user %s may not access %s.', user_id, conversation_id)
+            return _ack_error('forbidden')
+        await sio.save_session(sid, session)
+
+    try:
+        last_read_seq, unread = await read_state.mark_read(user_id, conversation_id, seq)
+    except RedisError as exc:
+        # The client keeps its local watermark and sends chat:read again later.
+        logger.warning('chat:read failed for user %s in %s: %s', user_id, conversation_id, exc)
+        return _ack_error('unavailable')
+    update = {'conversationId': conversation_id, 'lastReadSeq': last_read_seq, 'unread': unread}
+    await sio.emit('chat:unread:update', update, room=_personal_room(user_id), skip_sid=sid)
+    return {'ok': True, **update}
+
+
+@sio.on('chat:unread')
+async def chat_unread(sid: str, payload: Any = None) -> None:
+    session = await sio.get_session(sid)
+    user_id = session.get('user_id')
+    if not user_id:
+        logger.warning('chat:unread ignored because session has no user.')
+        return
+
+    try:
+        counts = await read_state.unread_counts(user_id)
+    except RedisError as exc:
+        logger.warning('chat:unread failed for user %s: %s', user_id, exc)
+        return
+    await sio.emit('chat:unread', read_state.as_payload(counts), to=sid)
+
+
 @sio.on('chat:leave')
 async def chat_leave(sid: str, payload: Dict[str, Any]) -> None:
     conversation_id = payload.get('conversationId')
@@ -338,19 +825,34 @@ async def chat_leave(sid: str, payload: Dict[str, Any]) -> None:
 
 
 @sio.on('chat:message')
-async def chat_message(sid: str, payload: Dict[str, Any]) -> None:
+async def chat_message(sid: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store and broadcast a message, acknowledging with its canonical id.
+
+    Retries carrying an already used ``clientMessageId`` are answered with the
+    original id and timestamp and are neither stored nor broadcast again.
+    """
     session = await sio.get_session(sid)
     user_id = session.get('user_id')
     sender_role = session.get('user_role', Role.USER)
 
     if not user_id:
         logger.warning('chat:message ignored because session has no user.')
-        return
+        return _ack_error('unauthenticated')
+    retry_after = await _throttle(sid, session, 'message', 'chat:message')
+    if retry_after is not None:
+        return _ack_error('rate_limited', retryAfter=retry_after)
 
     text = (payload.get('text') or '').strip()
     if not text:
         logger.debug('chat:message ignored because text is empty.')
-        return
+        return _ack_error('empty')
+
+    client_message_id = payload.get('clientMessageId') or None
+    if client_message_id is not None:
+        client_message_id = str(client_message_id)
+        if len(client_message_id) > _CLIENT_MESSAGE_ID_MAX_LENGTH:
+            return _ack_error('invalid_client_message_id')
 
     conversation_id = payload.get('conversationId')
     if not conversation_id:
@@ -358,23 +860,65 @@ async def chat_message(sid: str, payload: Dict[str, Any]) -> None:
         conversation_id = _build_conversation_id(participants)
     if not conversation_id:
         logger.warning('chat:message ignored: missing conversation id. payload=%s', payload)
-        return
-
-    recipient_id = payload.get('recipientId')
-    recipient = await _ensure_recipient(recipient_id)
-    if recipient_id and not recipient:
-        logger.warning('chat:message recipient %s not found; continuing without link.', recipient_id)
-        recipient_id = None
-
-    message = await _store_message(
-        conversation_id=conversation_id,
+        return _ack_error('missing_conversation')
+
+    conversation = session.get('conversations', {}).get(conversation_id)
+    if conversation is None:
+        # Clients normally join first; authorize once here otherwise.
+        conversation = await _authorize_conversation(session, conversation_id)
+        if conversation is None:
+            logger.warning('chat:message rejected: user %s may not post to %s.', user_id, conversation_id)
+            return _ack_error('forbidden')
+        await sio.save_session(sid, session)
+
+    conversation_pk = await _conversation_pk(conversation_id, create=True)
+    message = _build_message(
+        conversation_id=conversation_pk,
         sender_id=user_id,
         sender_role=sender_role,
-        recipient_id=recipient_id,
+        recipient_id=conversation['peer_id'],
         text=text,
-        client_message_id=payload.get('clientMessageId'),
+        client_message_id=client_message_id,
     )
 
-    serialized = _serialize_message(message)
+    if client_message_id:
+        # Claimed before numbering so retries do not burn sequence numbers.
+        # A retry racing the first attempt is acked without ``seq``.
+        existing = await dedupe.claim(user_id, client_message_id, _serialize_message(message, conversation_id))
+        if existing is not None:
+            logger.debug('Duplicate chat message %s from user %s', client_message_id, user_id)
+            return _ack(existing, duplicate=True)
+
+    # Any failure past the claim releases it, or retries would be acked as
+    # duplicates of a message that was never stored.
+    try:
+        message.seq = await _allocate_seq(conversation_id, conversation_pk)
+        serialized = _serialize_message(message, conversation_id)
+        if client_message_id:
+            await dedupe.remember(user_id, client_message_id, serialized)
+        stored, created = await _store_message(message)
+    except Exception:
+        if message.seq is not None:
+            await sequences.release(conversation_id, message.seq)
+        if client_message_id:
+            await dedupe.release(user_id, client_message_id)
+        raise
+
+    if not created:
+        await sequences.release(conversation_id, message.seq)
+        canonical = _serialize_message(stored, conversation_id)
+        await dedupe.remember(user_id, client_message_id, canonical)
+        return _ack(canonical, duplicate=True)
+
+    await history_cache.append(conversation_id, serialized)
     await sio.emit('chat:message', serialized, room=conversation_id)
+    if message.recipient_id:
+        unread = await read_state.mark_unread(message.recipient_id, conversation_id, message.seq)
+        if unread is not None:
+            await sio.emit(
+                'chat:unread:update',
+                {'conversationId': conversation_id, 'unread': unread},
+                room=_personal_room(message.recipient_id),
+            )
     logger.debug('Stored chat message %s in %s from user %s', message.id, conversation_id, user_id)
+    return _ack(serialized, duplicate=False)
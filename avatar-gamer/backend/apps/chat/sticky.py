@@ -0,0 +1,38 @@
+"""
+Engine.IO session ids that name the worker process owning the session.
+
+When the server runs as several processes behind ``config.launcher``, every
+worker prefixes the sids it issues with its index (``"3.Zm9v..."``). The
+launcher's proxy reads the ``sid`` query parameter of each long-polling
+request and sends it back to that worker, so no shared session store is
+needed. Cross-worker delivery still goes through the Redis manager.
+"""
+from __future__ import annotations
+
+from typing import Optional, Type
+
+import engineio
+
+SEPARATOR = '.'
+
+
+def worker_of(sid: str) -> Optional[int]:
+    """Worker index encoded in ``sid``, or ``None`` for unprefixed sids."""
+    prefix, separator, _ = sid.partition(SEPARATOR)
+    if not separator or not prefix.isdigit():
+        return None
+    return int(prefix)
+
+
+def engineio_server_class(worker_id: Optional[str]) -> Type[engineio.AsyncServer]:
+    """``engineio.AsyncServer`` whose generated sids carry ``worker_id``."""
+    if not worker_id:
+        return engineio.AsyncServer
+
+    prefix = f'{int(worker_id)}{SEPARATOR}'
+
+    class WorkerAsyncServer(engineio.AsyncServer):
+        def generate_id(self):
+            return prefix + super().generate_id()
+
+    return WorkerAsyncServer
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Tuple
+
+from .models import ChatMessage, Conversation, ConversationParticipant
+
+
+def _preview(text: str) -> str:
+    limit = Conversation.PREVIEW_LENGTH
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def _group(messages: Iterable[ChatMessage]) -> Dict[int, Tuple[ChatMessage, int]]:
+    grouped: Dict[int, Tuple[ChatMessage, int]] = {}
+    for message in messages:
+        latest, count = grouped.get(message.conversation_id, (message, 0))
+        if message.seq > latest.seq:
+            latest = message
+        grouped[message.conversation_id] = (latest, count + 1)
+    return grouped
+
+
+def record_messages(messages: List[ChatMessage]) -> None:
+    """
+    Fold freshly inserted messages into their conversation rows.
+
+    Must run inside the transaction that inserted ``messages``; the
+    conversations already exist (``conversations.resolve_conversation``).
+    Rows are locked per conversation, so concurrent writers serialize on the
+    conversation instead of losing increments.
+    """
+    for conversation_id, (latest, count) in _group(messages).items():
+        conversation = Conversation.objects.select_for_update().get(pk=conversation_id)
+
+        conversation.message_count += count
+        update_fields = ['message_count']
+        if latest.seq > conversation.last_message_seq:
+            conversation.last_message_id = latest.id
+            conversation.last_message_text = _preview(latest.text)
+            conversation.last_message_sender_id = latest.sender_id
+            conversation.last_message_seq = latest.seq
+            conversation.last_message_at = latest.created_at
+            update_fields += [
+                'last_message_id',
+                'last_message_text',
+                'last_message_sender',
+                'last_message_seq',
+                'last_message_at',
+            ]
+            ConversationParticipant.objects.filter(conversation=conversation).update(
+                last_message_at=latest.created_at,
+            )
+        conversation.save(update_fields=update_fields)
@@ -0,0 +1,1111 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import io
+import json
+import os
+import random
+import subprocess
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from typing import Any, Callable, Optional
+from unittest import mock
+
+import msgpack
+import redis
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from engineio import packet as eio_packet
+from rest_framework_simplejwt.tokens import AccessToken
+from socketio import packet
+from socketio.msgpack_packet import MsgPackPacket
+
+from apps.accounts.links import invalidate_linked_user_ids
+from apps.accounts.models import OperatorUserLink, Role
+from . import history_cache, ids, partitions, persistence, read_state, revocations, search, sockets
+from .conversations import conversation_cache, load_conversation
+from .models import ChatMessage, Conversation, ConversationReadState
+from .persistence import MessageWriteBuffer, _insert, insert_message
+from .presence import PresenceBatcher, PresenceTracker
+from .redis_client import get_sync_redis
+from .throttle import _TAKE_SCRIPT, RateLimiter, TokenBucket
+from .wire import (
+    MSGPACK,
+    MsgPackCodec,
+    NegotiatingAsyncServer,
+    NegotiatingRedisManager,
+    _NegotiatingManagerMixin,
+    requested_serializer,
+)
+
+
+def _conversation(operator: User, user: User) -> Conversation:
+    return Conversation.objects.create(key=f'conversation:operator-{operator.id}:user-{user.id}')
+
+
+def _message(
+    conversation: Conversation,
+    sender: User,
+    seq: int,
+    client_message_id: Optional[str] = None,
+    created_at: Optional[datetime] = None,
+) -> ChatMessage:
+    now = created_at or timezone.now()
+    return ChatMessage(
+        id=ids.uuid7(now),
+        created_at=now,
+        conversation=conversation,
+        sender=sender,
+        sender_role=Role.OPERATOR,
+        text=f'message {seq}',
+        client_message_id=client_message_id,
+        seq=seq,
+    )
+
+
+async def _db_in_test_thread(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    return await sync_to_async(func)(*args, **kwargs)
+
+
+class SocketTestCase(TestCase):
+    """
+    Runs socket coroutines with their ORM calls on the test thread, so they
+    see the rows of the test transaction instead of going through the
+    executor threads.
+    """
+
+    def setUp(self):
+        super().setUp()
+        conversation_cache.clear()
+        patcher = mock.patch('apps.chat.sockets.run_db', _db_in_test_thread)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_async(self, coroutine):
+        async def _await():
+            return await coroutine
+
+        return async_to_sync(_await)()
+
+
+class HistoryCursorTests(TestCase):
+    def test_bare_uuid7_id_carries_its_timestamp(self):
+        created_at = datetime(2026, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        message_id = ids.uuid7(created_at)
+        self.assertEqual(sockets._parse_cursor(str(message_id)), (created_at, message_id))
+        self.assertEqual(sockets._parse_cursor({'id': str(message_id)}), (created_at, message_id))
+
+    def test_legacy_cursor_with_timestamp(self):
+        message_id = uuid.uuid4()
+        cursor = sockets._parse_cursor({'timestamp': '2026-05-01T12:30:15', 'id': str(message_id)})
+        self.assertEqual(cursor, (datetime(2026, 5, 1, 12, 30, 15, tzinfo=dt_timezone.utc), message_id))
+
+    def test_uuid4_without_timestamp_is_looked_up_later(self):
+        message_id = uuid.uuid4()
+        self.assertEqual(sockets._parse_cursor(str(message_id)), (None, message_id))
+
+    def test_invalid_cursors(self):
+        for raw in (None, '', 'not-a-uuid', {}, {'id': 'x'}, {'id': str(uuid.uuid4()), 'timestamp': 5}, 42):
+            with self.subTest(raw=raw):
+                self.assertIsNone(sockets._parse_cursor(raw))
+
+    def test_cursor_for_is_id_only(self):
+        self.assertEqual(sockets._cursor_for({'id': 'abc', 'timestamp': 'x'}), {'id': 'abc'})
+
+
+class HistoryPagingTests(SocketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator')
+        cls.user = User.objects.create_user('user')
+        cls.conversation = _conversation(cls.operator, cls.user)
+        now = timezone.now()
+        # Two messages share a timestamp and one is outside the recent window.
+        stamps = [now - timedelta(days=400)] + [now - timedelta(minutes=minutes) for minutes in (9, 8, 7, 7, 5, 4)]
+        cls.messages = [
+            _message(cls.conversation, cls.operator, seq, created_at=created_at)
+            for seq, created_at in enumerate(stamps, start=1)
+        ]
+        ChatMessage.objects.bulk_create(cls.messages)
+        cls.expected = [
+            str(message.id) for message in sorted(cls.messages, key=lambda message: (message.created_at, message.id))
+        ]
+
+    def _walk(self, page_size):
+        key = self.conversation.key
+        page, has_more = self.run_async(sockets._load_history(key, limit=page_size))
+        seen = [message['id'] for message in page]
+        while has_more:
+            before = sockets._parse_cursor(sockets._cursor_for(page[0]))
+            page, has_more = self.run_async(sockets._load_history(key, limit=page_size, before=before))
+            seen = [message['id'] for message in page] + seen
+        return seen
+
+    def test_pages_cover_history_exactly_once(self):
+        for page_size in (1, 2, 3, 10):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self._walk(page_size), self.expected)
+
+    def test_legacy_id_cursor_is_resolved_from_the_row(self):
+        legacy = _message(self.conversation, self.user, 99, created_at=self.messages[3].created_at)
+        legacy.id = uuid.uuid4()
+        legacy.save(force_insert=True)
+
+        page, _ = self.run_async(sockets._load_history(self.conversation.key, limit=10, before=(None, legacy.id)))
+        self.assertTrue(all(message['timestamp'] <= legacy.created_at.isoformat() for message in page))
+        self.assertNotIn(str(legacy.id), [message['id'] for message in page])
+
+    def test_unknown_legacy_id_returns_an_empty_page(self):
+        page = self.run_async(sockets._load_history(self.conversation.key, before=(None, uuid.uuid4())))
+        self.assertEqual(page, ([], False))
+
+
+class SyncSinceTests(SocketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator')
+        cls.user = User.objects.create_user('user')
+        cls.conversation = _conversation(cls.operator, cls.user)
+        ChatMessage.objects.bulk_create([_message(cls.conversation, cls.operator, seq) for seq in range(1, 6)])
+
+    def _since(self, cached, last_seq=2):
+        with mock.patch('apps.chat.history_cache.get_recent', mock.AsyncMock(return_value=cached)):
+            page, has_more = self.run_async(sockets._load_since(self.conversation.key, last_seq, limit=10))
+        self.assertFalse(has_more)
+        return [message['text'] for message in page]
+
+    def test_consecutive_buffer_is_served_from_redis(self):
+        cached = [{'seq': seq, 'text': f'cached {seq}'} for seq in (2, 3, 4, 5)]
+        self.assertEqual(self._since(cached), ['cached 3', 'cached 4', 'cached 5'])
+
+    def test_hole_in_the_buffer_falls_back_to_the_database(self):
+        cached = [{'seq': seq, 'text': f'cached {seq}'} for seq in (2, 3, 5)]
+        self.assertEqual(self._since(cached), ['message 3', 'message 4', 'message 5'])
+
+    def test_buffer_starting_too_late_falls_back_to_the_database(self):
+        cached = [{'seq': seq, 'text': f'cached {seq}'} for seq in (4, 5)]
+        self.assertEqual(self._since(cached), ['message 3', 'message 4', 'message 5'])
+
+
+class WriteBehindInsertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator')
+        cls.user = User.objects.create_user('user')
+        cls.conversation = _conversation(cls.operator, cls.user)
+
+    def test_batch_is_inserted_and_counted(self):
+        batch = [_message(self.conversation, self.operator, seq) for seq in (1, 2, 3)]
+        self.assertEqual(_insert(batch), [])
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.message_count, 3)
+        self.assertEqual(self.conversation.last_message_seq, 3)
+
+    def test_retries_and_replays_are_skipped(self):
+        first = _message(self.conversation, self.operator, 1, client_message_id='c-1')
+        _insert([first])
+
+        retry = _message(self.conversation, self.operator, 2, client_message_id='c-1')
+        replay = copy.copy(first)
+        fresh = _message(self.conversation, self.operator, 3)
+        self.assertEqual(_insert([retry, replay, fresh]), [])
+
+        self.assertEqual(
+            sorted(ChatMessage.objects.filter(conversation=self.conversation).values_list('seq', flat=True)),
+            [1, 3],
+        )
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.message_count, 2)
+
+    def test_same_client_id_from_another_sender_is_stored(self):
+        _insert([_message(self.conversation, self.operator, 1, client_message_id='c-1')])
+        _insert([_message(self.conversation, self.user, 2, client_message_id='c-1')])
+        self.assertEqual(ChatMessage.objects.filter(conversation=self.conversation).count(), 2)
+
+    def test_seq_collision_is_renumbered_not_dropped(self):
+        _insert([_message(self.conversation, self.operator, 1)])
+        clash = _message(self.conversation, self.user, 1, client_message_id='c-2')
+
+        self.assertEqual(_insert([clash]), [])
+
+        stored = ChatMessage.objects.get(id=clash.id)
+        self.assertEqual(stored.seq, 2)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.message_count, 2)
+        self.assertEqual(self.conversation.last_message_seq, 2)
+
+
+class WriteBehindSpoolTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator')
+        cls.user = User.objects.create_user('user')
+        cls.conversation = _conversation(cls.operator, cls.user)
+
+    def setUp(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_dir = Path(spool_dir.name)
+        self.buffer = MessageWriteBuffer(batch_size=10, flush_interval=1, max_pending=100, spool_dir=self.spool_dir)
+        patcher = mock.patch('apps.chat.persistence.run_db', _db_in_test_thread)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _flush(self, *messages):
+        async def _run():
+            for message in messages:
+                await self.buffer.enqueue(message)
+            await self.buffer.flush()
+
+        async_to_sync(_run)()
+
+    def _files(self, pattern):
+        return sorted(path.name for path in self.spool_dir.glob(pattern))
+
+    def test_bad_row_is_set_aside_instead_of_spooling_the_batch(self):
+        good = _message(self.conversation, self.operator, 1)
+        bad = _message(self.conversation, self.operator, 2)
+        bad.sender_role = 'x' * 40  # longer than the column
+
+        with self.assertLogs('apps.chat.persistence', 'WARNING'):
+            self._flush(good, bad)
+
+        self.assertEqual(list(ChatMessage.objects.values_list('id', flat=True)), [good.id])
+        self.assertEqual(self._files('chat-writebehind-*'), [])
+        self.assertEqual(len(self._files('chat-rejected-*')), 1)
+
+    def test_outage_spools_the_batch(self):
+        with mock.patch('apps.chat.persistence._insert', side_effect=OperationalError), \
+                self.assertLogs('apps.chat.persistence', 'ERROR'):
+            self._flush(_message(self.conversation, self.operator, 1))
+
+        self.assertEqual(len(self._files('chat-writebehind-*.jsonl')), 1)
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_abandoned_replay_is_recovered(self):
+        finished = subprocess.Popen(['true'])
+        finished.wait()
+        pids = (finished.pid, os.getpid())
+        messages = [_message(self.conversation, self.operator, seq) for seq in (1, 2)]
+        for pid, message in zip(pids, messages):
+            path = self.spool_dir / f'chat-writebehind-{pid}.replay-{pid}'
+            path.write_text(json.dumps(persistence._to_row(message)) + '\n', encoding='utf-8')
+
+        with self.assertLogs('apps.chat.persistence', 'WARNING'):
+            self.buffer._replay_spool()
+
+        self.assertEqual(ChatMessage.objects.count(), 2)
+        self.assertEqual(self._files('chat-writebehind-*'), [])
+
+
+class ReadStateStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator')
+        cls.user = User.objects.create_user('user')
+        cls.conversation = _conversation(cls.operator, cls.user)
+
+    def setUp(self):
+        conversation_cache.clear()
+
+    def test_watermarks_reference_the_conversation_row(self):
+        key = self.conversation.key
+        read_state._store([(self.user.id, key, 2), (self.user.id, 'conversation:unknown', 5)])
+        read_state._store([(self.user.id, key, 4)])
+
+        stored = ConversationReadState.objects.get(user=self.user)
+        self.assertEqual((stored.conversation_id, stored.last_read_seq), (self.conversation.id, 4))
+
+    def test_snapshot_is_keyed_by_the_external_key(self):
+        _insert([_message(self.conversation, self.operator, seq) for seq in (1, 2, 3)])
+        ChatMessage.objects.update(recipient=self.user)
+        read_state._store([(self.user.id, self.conversation.key, 1)])
+
+        watermarks, unread = read_state._snapshot(self.user.id)
+
+        self.assertEqual(watermarks, {self.conversation.key: 1})
+        self.assertEqual(sorted(unread[self.conversation.key]), [2, 3])
+
+
+class ReadStateWithoutRedisTests(SocketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user')
+
+    def setUp(self):
+        super().setUp()
+        self.key = 'conversation:operator-1:user-2'
+        session = {'user_id': self.user.id, 'user_role': Role.USER, 'conversations': {self.key: {}}}
+        for target, value in (
+            ('sockets.sio.get_session', mock.AsyncMock(return_value=session)),
+            ('sockets.sio.emit', mock.AsyncMock()),
+            ('read_state.mark_read', mock.AsyncMock(side_effect=redis.exceptions.ConnectionError)),
+            ('read_state.unread_counts', mock.AsyncMock(side_effect=redis.exceptions.ConnectionError)),
+            ('read_state.unread_counts_sync', mock.Mock(side_effect=redis.exceptions.ConnectionError)),
+        ):
+            patcher = mock.patch(f'apps.chat.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_chat_read_acks_an_error(self):
+        with self.assertLogs('apps.chat.sockets', 'WARNING'):
+            ack = self.run_async(sockets.chat_read('sid', {'conversationId': self.key, 'seq': 3}))
+        self.assertEqual(ack, {'ok': False, 'error': 'unavailable'})
+        sockets.sio.emit.assert_not_called()
+
+    def test_chat_unread_sends_nothing(self):
+        with self.assertLogs('apps.chat.sockets', 'WARNING'):
+            self.run_async(sockets.chat_unread('sid'))
+        sockets.sio.emit.assert_not_called()
+
+    def test_unread_endpoint_answers_503(self):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        with self.assertLogs('apps.chat.views', 'WARNING'):
+            response = self.client.get('/api/v1/chat/unread', **headers)
+        self.assertEqual(response.status_code, 503)
+
+
+class PresenceHeartbeatTests(SimpleTestCase):
+    """Runs the lease scripts against the configured Redis."""
+
+    def setUp(self):
+        try:
+            get_sync_redis().ping()
+        except redis.exceptions.ConnectionError:
+            self.skipTest('Redis is not reachable.')
+        self.user_id = random.randint(10 ** 8, 10 ** 9)
+        self.restored = []
+        self.addCleanup(
+            get_sync_redis().delete, f'presence:leases:{self.user_id}', f'presence:info:{self.user_id}',
+        )
+        self.addCleanup(get_sync_redis().srem, 'presence:online', self.user_id)
+
+    async def _restore(self, identities):
+        self.restored.extend(identities)
+
+    def _run(self, scenario):
+        async def _with_client():
+            client = redis.asyncio.Redis.from_url(settings.SOCKETIO_CONFIG['REDIS_URL'], decode_responses=True)
+            tracker = PresenceTracker(
+                lease_ttl=30, heartbeat_interval=10, sweep_interval=10, sync_interval=10, on_restored=self._restore,
+            )
+            try:
+                with mock.patch('apps.chat.presence.get_redis', return_value=client):
+                    await scenario(tracker)
+            finally:
+                await client.aclose()
+
+        asyncio.run(_with_client())
+
+    def test_reaped_lease_is_recreated_and_announced(self):
+        identity = {'user_id': self.user_id, 'role': Role.USER}
+
+        async def scenario(tracker):
+            self.assertTrue(await tracker.acquire('sid-1', self.user_id, identity))
+            # What the sweeper does once the lease has expired.
+            get_sync_redis().delete(f'presence:leases:{self.user_id}')
+            get_sync_redis().srem('presence:online', self.user_id)
+
+            await tracker.heartbeat()
+
+        with self.assertLogs('apps.chat.presence', 'WARNING'):
+            self._run(scenario)
+
+        self.assertEqual(self.restored, [identity])
+        self.assertTrue(get_sync_redis().sismember('presence:online', self.user_id))
+        self.assertIsNotNone(get_sync_redis().zscore(f'presence:leases:{self.user_id}', 'sid-1'))
+
+    def test_live_lease_is_only_extended(self):
+        async def scenario(tracker):
+            await tracker.acquire('sid-1', self.user_id, {'user_id': self.user_id})
+            await tracker.heartbeat()
+            self.assertEqual(tracker._dirty, {self.user_id: True})
+
+        self._run(scenario)
+        self.assertEqual(self.restored, [])
+
+
+class PresenceBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.batches = []
+        self.identities = []
+
+    async def _emit(self, changes):
+        self.identities.extend(identity for identity, _ in changes)
+        self.batches.append([(identity['user_id'], is_online) for identity, is_online in changes])
+
+    def test_net_changes_are_emitted_once_per_window(self):
+        async def scenario():
+            batcher = PresenceBatcher(window=0.01, emit=self._emit)
+            batcher.add({'user_id': 1}, True)
+            batcher.add({'user_id': 2}, True)
+            batcher.add({'user_id': 2}, False)
+            batcher.add({'user_id': 2}, True)
+            batcher.add({'user_id': 3}, False)
+            await asyncio.sleep(0.05)
+            batcher.add({'user_id': 1}, False)
+            await asyncio.sleep(0.05)
+
+        asyncio.run(scenario())
+        self.assertEqual(self.batches, [[(1, True), (2, True), (3, False)], [(1, False)]])
+
+    def test_flapping_inside_a_window_emits_nothing(self):
+        async def scenario():
+            batcher = PresenceBatcher(window=0.01, emit=self._emit)
+            batcher.add({'user_id': 1}, False)
+            batcher.add({'user_id': 1}, True)
+            await asyncio.sleep(0.05)
+
+        asyncio.run(scenario())
+        self.assertEqual(self.batches, [])
+
+    def test_latest_identity_is_sent(self):
+        async def scenario():
+            batcher = PresenceBatcher(window=10, emit=self._emit)
+            batcher.add({'user_id': 1, 'username': 'old'}, True)
+            batcher.add({'user_id': 1, 'username': 'new'}, True)
+            await batcher.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(self.identities, [{'user_id': 1, 'username': 'new'}])
+
+    def test_stop_flushes_pending_changes(self):
+        async def scenario():
+            batcher = PresenceBatcher(window=10, emit=self._emit)
+            batcher.add({'user_id': 1}, True)
+            await batcher.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(self.batches, [[(1, True)]])
+
+    def test_failed_emit_is_logged_and_the_next_window_still_flushes(self):
+        emit = mock.AsyncMock(side_effect=[redis.exceptions.ConnectionError, None])
+
+        async def scenario():
+            batcher = PresenceBatcher(window=0.01, emit=emit)
+            batcher.add({'user_id': 1}, True)
+            await asyncio.sleep(0.05)
+            batcher.add({'user_id': 2}, True)
+            await asyncio.sleep(0.05)
+
+        with self.assertLogs('apps.chat.presence', 'ERROR'):
+            asyncio.run(scenario())
+        self.assertEqual(emit.await_count, 2)
+
+
+class PresenceFanOutTests(SimpleTestCase):
+    def _emitted(self, changes, adjacency):
+        emit = mock.AsyncMock()
+        with mock.patch('apps.chat.sockets.run_db', _db_in_test_thread), \
+                mock.patch('apps.chat.sockets.linked_user_ids_many', return_value=adjacency), \
+                mock.patch.object(sockets.sio, 'emit', emit):
+            async_to_sync(sockets._emit_presence_batch)(changes)
+        return [
+            (call.args[0], [update['userId'] for update in call.args[1]['updates']], sorted(call.kwargs['room']))
+            for call in emit.call_args_list
+            if call.args[0] == 'presence:batch'
+        ]
+
+    def test_linked_counterparts_and_admins_receive_presence(self):
+        changes = [({'user_id': 1, 'role': Role.OPERATOR}, True), ({'user_id': 2, 'role': Role.USER}, False)]
+        emitted = self._emitted(changes, {1: {2, 3}, 2: {1}})
+
+        self.assertCountEqual(emitted, [
+            # 2 and 3 get the same updates, so they share one emit.
+            ('presence:batch', [1], ['presence:2', 'presence:3']),
+            ('presence:batch', [2], ['presence:1']),
+            ('presence:batch', [1, 2], ['presence:admins']),
+        ])
+
+    def test_unlinked_user_still_reaches_admins(self):
+        emitted = self._emitted([({'user_id': 7, 'role': Role.USER}, True)], {7: set()})
+        self.assertEqual(emitted, [('presence:batch', [7], ['presence:admins'])])
+
+
+class RevocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator')
+        cls.user = User.objects.create_user('user')
+        cls.other = User.objects.create_user('other')
+
+    def test_unlink_is_published_after_commit(self):
+        link = OperatorUserLink.objects.create(operator=self.operator, user=self.user)
+        with mock.patch('apps.chat.revocations.get_sync_redis') as redis:
+            with self.captureOnCommitCallbacks(execute=True):
+                link.delete()
+                redis.return_value.publish.assert_not_called()
+        redis.return_value.publish.assert_called_once_with(
+            revocations.CHANNEL, f'[{self.operator.id}, {self.user.id}]'
+        )
+
+    def test_only_the_unlinked_pair_is_forgotten(self):
+        revoked = f'conversation:operator-{self.operator.id}:user-{self.user.id}'
+        kept = f'conversation:operator-{self.operator.id}:user-{self.other.id}'
+        sessions = {
+            'operator-sid': {'user_id': self.operator.id, 'conversations': {
+                revoked: {'peer_id': self.user.id, 'peer_role': Role.USER},
+                kept: {'peer_id': self.other.id, 'peer_role': Role.USER},
+            }},
+            'user-sid': {'user_id': self.user.id, 'conversations': {
+                revoked: {'peer_id': self.operator.id, 'peer_role': Role.OPERATOR},
+            }},
+        }
+        rooms = {
+            sockets._personal_room(self.operator.id): ['operator-sid'],
+            sockets._personal_room(self.user.id): ['user-sid'],
+        }
+
+        async def get_session(sid):
+            return sessions[sid]
+
+        leave_room = mock.AsyncMock()
+        with mock.patch.object(
+            sockets.sio.manager, 'get_participants',
+            side_effect=lambda namespace, room: [(sid, sid) for sid in rooms.get(room, [])],
+        ), mock.patch.object(sockets.sio, 'get_session', get_session), \
+                mock.patch.object(sockets.sio, 'leave_room', leave_room):
+            async_to_sync(sockets._revoke_conversations)(self.operator.id, self.user.id)
+
+        self.assertEqual(list(sessions['operator-sid']['conversations']), [kept])
+        self.assertEqual(sessions['user-sid']['conversations'], {})
+        self.assertCountEqual(
+            [call.args for call in leave_room.call_args_list],
+            [('operator-sid', revoked), ('user-sid', revoked)],
+        )
+
+
+class SearchPagingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator')
+        cls.user = User.objects.create_user('user')
+        cls.link = OperatorUserLink.objects.create(operator=cls.operator, user=cls.user)
+        invalidate_linked_user_ids(cls.operator.id, cls.user.id)
+        key = f'conversation:operator-{cls.operator.id}:user-{cls.user.id}'
+        conversation = Conversation.objects.get(pk=load_conversation(key, create=True))
+        # Ranks that are not exact in float4 plus ties on rank and timestamp.
+        now = timezone.now()
+        texts = ['robot', 'robot robot', 'robot rojo robot azul robot', 'el robot camina', 'robot', 'robot']
+        messages = []
+        for seq, text in enumerate(texts, start=1):
+            message = _message(conversation, cls.operator, seq, created_at=now - timedelta(minutes=seq // 2))
+            message.text = text
+            messages.append(message)
+        ChatMessage.objects.bulk_create(messages)
+        cls.expected = [
+            str(message.id)
+            for message in search.search_messages(cls.operator.id, 'robot', limit=100)[0]
+        ]
+
+    def setUp(self):
+        # The link cache outlives test transactions; start from the database.
+        invalidate_linked_user_ids(self.operator.id, self.user.id)
+
+    def test_pages_cover_results_exactly_once(self):
+        self.assertEqual(len(self.expected), 6)
+        for page_size in (1, 2, 4):
+            with self.subTest(page_size=page_size):
+                seen, cursor = [], None
+                while True:
+                    rows, has_more = search.search_messages(
+                        self.operator.id, 'robot', limit=page_size, cursor=cursor,
+                    )
+                    seen.extend(str(row.id) for row in rows)
+                    if not has_more:
+                        break
+                    cursor = search.decode_cursor(search.encode_cursor(rows[-1]))
+                self.assertEqual(seen, self.expected)
+
+    def test_unlinked_accounts_no_longer_find_the_conversation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.link.delete()
+        for user_id in (self.operator.id, self.user.id):
+            with self.subTest(user_id=user_id):
+                self.assertEqual(search.search_messages(user_id, 'robot', limit=100), ([], False))
+
+    def test_admin_conversations_do_not_need_a_link(self):
+        admin = User.objects.create_user('admin')
+        key = f'conversation:admin-{admin.id}:user-{self.user.id}'
+        conversation = Conversation.objects.get(pk=load_conversation(key, create=True))
+        message = _message(conversation, admin, 1)
+        message.text = 'robot'
+        ChatMessage.objects.bulk_create([message])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.link.delete()
+        for user_id in (admin.id, self.user.id):
+            with self.subTest(user_id=user_id):
+                rows, _ = search.search_messages(user_id, 'robot', limit=100)
+                self.assertEqual({row.conversation_key for row in rows}, {key})
+
+
+class ChatMessageSequenceTests(SocketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator')
+        cls.user = User.objects.create_user('user')
+        cls.key = f'conversation:operator-{cls.operator.id}:user-{cls.user.id}'
+
+    def setUp(self):
+        super().setUp()
+        self.session = {
+            'user_id': self.operator.id,
+            'user_role': Role.OPERATOR,
+            'conversations': {self.key: {'peer_id': self.user.id, 'peer_role': Role.USER}},
+        }
+        self.mocks = {}
+        for target, value in (
+            ('sockets.sio.get_session', mock.AsyncMock(return_value=self.session)),
+            ('sockets.sio.emit', mock.AsyncMock()),
+            ('sockets._throttle', mock.AsyncMock(return_value=None)),
+            ('sockets.message_buffer', None),
+            ('history_cache.append', mock.AsyncMock()),
+            ('read_state.mark_unread', mock.AsyncMock(return_value=None)),
+            ('dedupe.claim', mock.AsyncMock(return_value=None)),
+            ('dedupe.remember', mock.AsyncMock()),
+            ('dedupe.release', mock.AsyncMock()),
+            ('sequences.allocate', mock.AsyncMock(return_value=7)),
+            ('sequences.release', mock.AsyncMock()),
+        ):
+            patcher = mock.patch(f'apps.chat.{target}', value)
+            self.mocks[target] = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _send(self, client_message_id='c-1'):
+        payload = {'conversationId': self.key, 'text': 'hola', 'clientMessageId': client_message_id}
+        return self.run_async(sockets.chat_message('sid', payload))
+
+    def test_stored_message_is_numbered_and_remembered(self):
+        ack = self._send()
+
+        self.assertEqual((ack['ok'], ack['seq'], ack['duplicate']), (True, 7, False))
+        self.assertEqual(ChatMessage.objects.get(id=ack['id']).seq, 7)
+        remembered = self.mocks['dedupe.remember'].call_args.args
+        self.assertEqual((remembered[1], remembered[2]['seq']), ('c-1', 7))
+
+    def test_retry_reuses_the_stored_seq_without_allocating(self):
+        self.mocks['dedupe.claim'].return_value = {
+            'id': 'first', 'clientMessageId': 'c-1', 'seq': 3, 'timestamp': '2026-05-01T12:00:00+00:00',
+        }
+
+        ack = self._send()
+
+        self.assertEqual((ack['id'], ack['seq'], ack['duplicate']), ('first', 3, True))
+        self.mocks['sequences.allocate'].assert_not_called()
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_failed_store_gives_the_seq_back(self):
+        with mock.patch('apps.chat.sockets._store_message', mock.AsyncMock(side_effect=RuntimeError)):
+            with self.assertRaises(RuntimeError):
+                self._send()
+
+        self.mocks['sequences.release'].assert_awaited_once_with(self.key, 7)
+        self.mocks['dedupe.release'].assert_awaited_once_with(self.operator.id, 'c-1')
+
+    def test_failed_numbering_releases_the_claim(self):
+        self.mocks['sequences.allocate'].side_effect = RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            self._send()
+
+        self.mocks['dedupe.release'].assert_awaited_once_with(self.operator.id, 'c-1')
+        self.mocks['sequences.release'].assert_not_called()
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_database_duplicate_gives_the_seq_back(self):
+        first = self._send()
+        self.mocks['sequences.allocate'].return_value = 8
+
+        ack = self._send()
+
+        self.assertEqual((ack['id'], ack['seq'], ack['duplicate']), (first['id'], 7, True))
+        self.mocks['sequences.release'].assert_awaited_once_with(self.key, 8)
+
+
+class UUID7Tests(SimpleTestCase):
+    def test_version_variant_and_timestamp_layout(self):
+        created_at = datetime(2026, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        value = ids.uuid7(created_at)
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.variant, uuid.RFC_4122)
+        self.assertEqual(value.int >> 80, int(created_at.timestamp() * 1000))
+        self.assertTrue(ids.is_uuid7(value))
+
+    def test_created_at_round_trips_every_microsecond(self):
+        base = datetime(2026, 5, 1, 12, 30, 15, tzinfo=dt_timezone.utc)
+        for micros in range(0, 2000):
+            created_at = base + timedelta(microseconds=micros)
+            self.assertEqual(ids.created_at_of(ids.uuid7(created_at)), created_at)
+
+    def test_id_order_follows_created_at(self):
+        base = datetime(2026, 5, 1, tzinfo=dt_timezone.utc)
+        stamps = [base + timedelta(microseconds=step * 37) for step in range(500)]
+        generated = [ids.uuid7(created_at) for created_at in stamps]
+        self.assertEqual(sorted(generated), generated)
+
+    def test_rng_makes_ids_reproducible(self):
+        created_at = datetime(2026, 5, 1, tzinfo=dt_timezone.utc)
+        first = ids.uuid7(created_at, rng=random.Random(7))
+        self.assertEqual(ids.uuid7(created_at, rng=random.Random(7)), first)
+        self.assertNotEqual(ids.uuid7(created_at), first)
+
+    def test_other_versions(self):
+        legacy = uuid.uuid4()
+        self.assertFalse(ids.is_uuid7(legacy))
+        self.assertIsNone(ids.created_at_of(legacy))
+
+
+class ReidMessagesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator')
+        cls.user = User.objects.create_user('user')
+        cls.conversation = _conversation(cls.operator, cls.user)
+        now = timezone.now()
+        cls.old = _message(cls.conversation, cls.operator, 1, 'c-old', now - timedelta(days=1))
+        cls.recent = _message(cls.conversation, cls.user, 2, 'c-recent', now - timedelta(seconds=5))
+        cls.current = _message(cls.conversation, cls.operator, 3, 'c-current', now)
+        cls.old.id, cls.recent.id = uuid.uuid4(), uuid.uuid4()
+        ChatMessage.objects.bulk_create([cls.old, cls.recent, cls.current])
+        cls.conversation.last_message_id = cls.recent.id
+        cls.conversation.save(update_fields=['last_message_id'])
+
+    def test_legacy_ids_and_their_caches_are_rewritten(self):
+        with mock.patch('apps.chat.history_cache.invalidate_sync') as invalidate, \
+                mock.patch('apps.chat.dedupe.forget_sync') as forget:
+            call_command('chat_reid_messages', batch_size=2, stdout=io.StringIO())
+
+        rows = {row.client_message_id: row for row in ChatMessage.objects.all()}
+        self.assertEqual(rows['c-current'].id, self.current.id)
+        for name in ('c-old', 'c-recent'):
+            self.assertTrue(ids.is_uuid7(rows[name].id))
+            self.assertEqual(ids.created_at_of(rows[name].id), rows[name].created_at)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_id, rows['c-recent'].id)
+
+        self.assertEqual([list(call.args[0]) for call in invalidate.call_args_list], [[self.conversation.key]])
+        # Only the dedupe entry that has not expired yet points at an old id.
+        self.assertEqual(
+            [list(call.args[0]) for call in forget.call_args_list],
+            [[(self.user.id, 'c-recent')]],
+        )
+
+
+class PartitionDefinitionTests(SimpleTestCase):
+    def test_partition_key_is_appended_once(self):
+        self.assertEqual(partitions._with_partition_key('PRIMARY KEY (id)'), 'PRIMARY KEY (id, created_at)')
+        self.assertEqual(
+            partitions._with_partition_key('UNIQUE (conversation_id, seq)'),
+            'UNIQUE (conversation_id, seq, created_at)',
+        )
+        self.assertEqual(partitions._with_partition_key('UNIQUE (created_at, id)'), 'UNIQUE (created_at, id)')
+
+    def test_unique_index_is_moved_and_keeps_its_predicate(self):
+        definition = (
+            'CREATE UNIQUE INDEX chat_msg_sender_client_id_uniq ON public.chat_chatmessage_unpartitioned '
+            'USING btree (sender_id, client_message_id) WHERE (client_message_id IS NOT NULL)'
+        )
+        self.assertEqual(
+            partitions._index_definition(definition, 'chat_chatmessage_unpartitioned', 'chat_chatmessage', True),
+            'CREATE UNIQUE INDEX chat_msg_sender_client_id_uniq ON "chat_chatmessage" '
+            'USING btree (sender_id, client_message_id, created_at) WHERE (client_message_id IS NOT NULL)',
+        )
+
+    def test_plain_index_only_changes_table(self):
+        definition = (
+            'CREATE INDEX chat_msg_search_gin ON public.chat_chatmessage_unpartitioned USING gin (search_vector)'
+        )
+        self.assertEqual(
+            partitions._index_definition(definition, 'chat_chatmessage_unpartitioned', 'chat_chatmessage', False),
+            'CREATE INDEX chat_msg_search_gin ON "chat_chatmessage" USING gin (search_vector)',
+        )
+
+
+class PartitionedUniquenessTests(TestCase):
+    """``convert`` on the test database: uniqueness still holds across partitions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator')
+        cls.user = User.objects.create_user('user')
+        cls.conversation = _conversation(cls.operator, cls.user)
+        cls.last_month = timezone.now() - timedelta(days=40)
+        cls.first = _message(cls.conversation, cls.operator, 1, 'c-1', cls.last_month)
+        ChatMessage.objects.bulk_create([cls.first, _message(cls.conversation, cls.user, 2)])
+
+    def setUp(self):
+        partitions.convert(months_ahead=1)
+
+    def _keys(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {partitions.key_table_name()}')
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_existing_rows_are_copied_and_keyed(self):
+        self.assertTrue(partitions.is_partitioned())
+        self.assertEqual(self._keys(), set(ChatMessage.objects.values_list('id', flat=True)))
+
+    def test_client_retry_with_another_timestamp_returns_the_stored_row(self):
+        retry = _message(self.conversation, self.operator, 3, 'c-1')
+
+        stored, created = insert_message(retry)
+
+        self.assertFalse(created)
+        self.assertEqual(stored.id, self.first.id)
+        self.assertEqual(ChatMessage.objects.filter(client_message_id='c-1').count(), 1)
+
+    def test_seq_clash_with_another_timestamp_is_renumbered(self):
+        clash = _message(self.conversation, self.user, 1, 'c-2')
+
+        self.assertEqual(_insert([clash]), [])
+
+        self.assertEqual(ChatMessage.objects.get(id=clash.id).seq, 3)
+
+    def test_updates_and_deletes_follow_the_row(self):
+        message = ChatMessage.objects.get(seq=2)
+        # Moves the row to last month's partition.
+        ChatMessage.objects.filter(id=message.id).update(created_at=self.last_month)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ChatMessage.objects.filter(id=message.id).update(seq=1)
+
+        ChatMessage.objects.filter(id=self.first.id).delete()
+        ChatMessage.objects.filter(id=message.id).update(seq=1)
+        self.assertEqual(self._keys(), {message.id})
+
+    def test_detached_partition_releases_its_keys(self):
+        month = partitions.month_start(self.last_month.date())
+        partition = next(partition for partition in partitions.list_partitions() if partition.start == month)
+
+        partitions.detach_partition(partition, drop=True)
+
+        self.assertEqual(self._keys(), set(ChatMessage.objects.values_list('id', flat=True)))
+        _, created = insert_message(_message(self.conversation, self.operator, 3, 'c-1'))
+        self.assertTrue(created)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('apps.chat.throttle.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_wait_until_refilled(self):
+        bucket = TokenBucket(rate=2, burst=3)
+        self.assertEqual([bucket.take() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(bucket.take(), 0.5)
+
+        self.now += 0.5
+        self.assertEqual(bucket.take(), 0.0)
+        self.assertGreater(bucket.take(), 0)
+
+    def test_refill_is_capped_at_burst(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.now += 60
+        self.assertEqual([bucket.take() for _ in range(2)], [0.0, 0.0])
+        self.assertGreater(bucket.take(), 0)
+
+
+class RateLimiterTests(SimpleTestCase):
+    limits = {Role.USER: {'message': (1, 2)}, Role.OPERATOR: {'message': (3, 6)}}
+
+    def setUp(self):
+        self.redis = mock.Mock(eval=mock.AsyncMock(return_value='0'))
+        patcher = mock.patch('apps.chat.throttle.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = RateLimiter(limits=self.limits, user_factor=2, default_role=Role.USER)
+
+    def _check(self, sid='s1', role=Role.USER, action='message', user_id=1):
+        return async_to_sync(self.limiter.check)(sid, user_id, role, action)
+
+    def test_unlimited_actions_skip_the_buckets(self):
+        self.assertEqual(self._check(action='typing'), 0.0)
+        self.redis.eval.assert_not_called()
+
+    def test_socket_bucket_stops_a_client_without_redis(self):
+        self.assertEqual([self._check(), self._check()], [0.0, 0.0])
+        self.assertEqual(self.redis.eval.await_count, 2)
+
+        self.assertGreater(self._check(), 0)
+        self.assertEqual(self.redis.eval.await_count, 2)
+
+    def test_user_bucket_uses_the_scaled_limit(self):
+        self._check(role=Role.OPERATOR, user_id=9)
+        args = self.redis.eval.call_args.args
+        self.assertEqual(args[2:], ('chat:ratelimit:message:9', 6, 12))
+
+    def test_unknown_role_uses_the_default(self):
+        self._check(role='robot')
+        self.assertEqual(self.redis.eval.call_args.args[3:], (2, 4))
+
+    def test_redis_failure_falls_back_to_a_local_user_bucket(self):
+        self.redis.eval.side_effect = redis.exceptions.ConnectionError
+        with self.assertLogs('apps.chat.throttle', 'WARNING'):
+            waits = [self._check(sid=f's{index}') for index in range(5)]
+        # Four sockets fit in the user's burst of 4; the fifth has to wait.
+        self.assertEqual(waits[:4], [0.0] * 4)
+        self.assertGreater(waits[4], 0)
+
+    def test_forget_resets_the_socket(self):
+        self._check()
+        self._check()
+        self.limiter.forget('s1')
+        self.assertEqual(self._check(), 0.0)
+
+
+class SharedBucketScriptTests(SimpleTestCase):
+    """Runs the Lua bucket against the configured Redis."""
+
+    def setUp(self):
+        self.client = get_sync_redis()
+        self.key = f'chat:ratelimit:test:{uuid.uuid4()}'
+        try:
+            self.client.ping()
+        except redis.exceptions.ConnectionError:
+            self.skipTest('Redis is not reachable.')
+        self.addCleanup(self.client.delete, self.key)
+
+    def test_burst_is_shared_and_then_waits(self):
+        waits = [float(self.client.eval(_TAKE_SCRIPT, 1, self.key, 1, 3)) for _ in range(4)]
+        self.assertEqual(waits[:3], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(waits[3], 1.0, places=1)
+        self.assertGreater(self.client.ttl(self.key), 0)
+
+
+class HistoryBufferScriptTests(SimpleTestCase):
+    """Runs the history buffer scripts against the configured Redis."""
+
+    def setUp(self):
+        self.client = get_sync_redis()
+        self.key = f'chat:history:test:{uuid.uuid4()}'
+        try:
+            self.client.ping()
+        except redis.exceptions.ConnectionError:
+            self.skipTest('Redis is not reachable.')
+        self.addCleanup(self.client.delete, self.key)
+
+    def _fill(self, *seqs, capacity=10):
+        messages = [json.dumps({'seq': seq}) for seq in seqs]
+        self.client.eval(history_cache._FILL_SCRIPT, 1, self.key, capacity, 60, *messages)
+
+    def _append(self, seq):
+        return self.client.eval(history_cache._APPEND_SCRIPT, 1, self.key, json.dumps({'seq': seq}), seq, 10, 60)
+
+    def _seqs(self):
+        return [json.loads(item)['seq'] for item in self.client.lrange(self.key, 0, -1)]
+
+    def test_fill_keeps_what_was_appended_after_the_read(self):
+        self._fill(1, 2, 3)
+        self.assertEqual(self._append(4), 1)
+        # A snapshot read before message 4 was stored.
+        self._fill(1, 2, 3)
+        self.assertEqual(self._seqs(), [1, 2, 3, 4])
+        self.assertGreater(self.client.ttl(self.key), 0)
+
+    def test_fill_keeps_the_newest_consecutive_run(self):
+        self._fill(1, 2, 4, 5, 6)
+        self.assertEqual(self._seqs(), [4, 5, 6])
+        self._fill(3, 4, 5, 6, 7, capacity=3)
+        self.assertEqual(self._seqs(), [5, 6, 7])
+
+    def test_append_out_of_order_drops_the_buffer(self):
+        self.assertEqual(self._append(1), 0)
+        self.assertFalse(self.client.exists(self.key))
+
+        self._fill(1, 2)
+        self.assertEqual(self._append(2), 0)
+        self.assertEqual(self._seqs(), [1, 2])
+        self.assertEqual(self._append(4), -1)
+        self.assertFalse(self.client.exists(self.key))
+
+
+class WireNegotiationTests(SimpleTestCase):
+    def setUp(self):
+        self.server = NegotiatingAsyncServer(
+            client_manager=_NegotiatingManagerMixin(), async_mode='asgi', async_handlers=False,
+        )
+        # (eio_sid, engine.io packet) for everything the server writes.
+        self.sent = []
+
+        async def send(eio_sid, data):
+            self.sent.append((eio_sid, eio_packet.Packet(eio_packet.MESSAGE, data)))
+
+        async def send_packet(eio_sid, pkt):
+            self.sent.append((eio_sid, pkt))
+
+        self.server.eio.send = send
+        self.server.eio.send_packet = send_packet
+
+        @self.server.on('echo')
+        async def echo(sid, data):
+            return data
+
+    async def _connect(self, eio_sid, query=''):
+        await self.server._handle_eio_connect(eio_sid, {'QUERY_STRING': query})
+        packet_class = self.server.packet_class_for(eio_sid)
+        await self.server._handle_eio_message(eio_sid, packet_class(packet.CONNECT, namespace='/').encode())
+        self.sent.clear()
+
+    def _received(self, eio_sid):
+        return [pkt.data for sid, pkt in self.sent if sid == eio_sid]
+
+    def test_requested_serializer(self):
+        self.assertEqual(requested_serializer({'QUERY_STRING': 'EIO=4&serializer=MsgPack'}), MSGPACK)
+        self.assertIsNone(requested_serializer({'QUERY_STRING': 'EIO=4'}))
+        self.assertIsNone(requested_serializer({}))
+
+    def test_each_client_gets_its_format_encoded_once(self):
+        async def scenario():
+            await self._connect('json-1')
+            await self._connect('mp-1', 'serializer=msgpack')
+            await self._connect('mp-2', 'serializer=msgpack')
+            await self.server.emit('chat:message', {'text': 'hola', 'seq': 1})
+
+        asyncio.run(scenario())
+        self.assertEqual(self._received('json-1'), ['2["chat:message",{"text":"hola","seq":1}]'])
+        frames = self._received('mp-1')
+        self.assertEqual(len(frames), 1)
+        decoded = msgpack.unpackb(frames[0], raw=False)
+        self.assertEqual(decoded['type'], packet.EVENT)
+        self.assertEqual(decoded['data'], ['chat:message', {'text': 'hola', 'seq': 1}])
+        # Clients that share a format share the encoded frame.
+        self.assertIs(dict(self.sent)['mp-1'], dict(self.sent)['mp-2'])
+
+    def test_msgpack_events_are_acked_in_msgpack(self):
+        async def scenario():
+            await self._connect('mp-1', 'serializer=msgpack')
+            event = MsgPackPacket(packet.EVENT, namespace='/', data=['echo', {'raw': b'\x00\x01'}], id=5)
+            await self.server._handle_eio_message('mp-1', event.encode())
+
+        asyncio.run(scenario())
+        decoded = msgpack.unpackb(self._received('mp-1')[0], raw=False)
+        self.assertEqual((decoded['type'], decoded['id'], decoded['data']), (packet.ACK, 5, [{'raw': b'\x00\x01'}]))
+
+    def test_msgpack_can_be_disabled(self):
+        self.server.msgpack_enabled = False
+        asyncio.run(self._connect('client', 'serializer=msgpack'))
+        self.assertIs(self.server.packet_class_for('client'), self.server.packet_class)
+
+    def test_disconnect_forgets_the_format(self):
+        async def scenario():
+            await self._connect('mp-1', 'serializer=msgpack')
+            await self.server._handle_eio_disconnect('mp-1', self.server.reason.CLIENT_DISCONNECT)
+
+        asyncio.run(scenario())
+        self.assertNotIn('mp-1', self.server._msgpack_eio_sids)
+
+    def test_redis_manager_keeps_the_pubsub_codec(self):
+        manager = NegotiatingRedisManager('redis://127.0.0.1:1/0', codec=MsgPackCodec)
+        NegotiatingAsyncServer(client_manager=manager, async_mode='asgi')
+        self.assertIs(manager.json, MsgPackCodec)
+        payload = {'method': 'emit', 'data': b'\x00', 'room': None}
+        self.assertEqual(MsgPackCodec.loads(MsgPackCodec.dumps(payload)), payload)
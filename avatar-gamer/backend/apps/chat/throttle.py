@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import logging
+import math
+import time
+from typing import Dict, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# (tokens per second, burst) for every action, per role.
+Limits = Dict[str, Dict[str, Tuple[float, int]]]
+
+# Refills the bucket using Redis' clock and takes one token. Returns the number
+# of seconds to wait as a string ("0" when the token was granted).
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    """In-process token bucket; ``take`` returns 0 or the seconds to wait."""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Two-level token buckets for socket events.
+
+    Each socket has its own in-process buckets, so a single runaway client is
+    stopped without a Redis round trip. Each user also has a cluster-wide
+    bucket in Redis (``user_factor`` times the socket burst and rate), which
+    caps users that open many sockets. If Redis is unavailable the user bucket
+    falls back to one per process.
+    """
+
+    def __init__(self, *, limits: Limits, user_factor: float, default_role: str) -> None:
+        self.limits = limits
+        self.user_factor = user_factor
+        self.default_role = default_role
+        self._sockets: Dict[str, Dict[str, TokenBucket]] = {}
+        self._users: Dict[Tuple[int, str], TokenBucket] = {}
+
+    def _limit(self, role: Optional[str], action: str) -> Optional[Tuple[float, int]]:
+        per_role = self.limits.get(role or self.default_role) or self.limits.get(self.default_role, {})
+        return per_role.get(action)
+
+    async def check(self, sid: str, user_id: int, role: Optional[str], action: str) -> float:
+        """Take a token for ``action``; return 0 when allowed or the seconds to wait."""
+        limit = self._limit(role, action)
+        if limit is None:
+            return 0.0
+        rate, burst = limit
+
+        buckets = self._sockets.setdefault(sid, {})
+        bucket = buckets.get(action)
+        if bucket is None:
+            bucket = buckets[action] = TokenBucket(rate, burst)
+        wait = bucket.take()
+        if wait:
+            return wait
+
+        user_rate = rate * self.user_factor
+        user_burst = max(1, math.ceil(burst * self.user_factor))
+        try:
+            return float(await get_redis().eval(
+                _TAKE_SCRIPT, 1, f'chat:ratelimit:{action}:{user_id}', user_rate, user_burst,
+            ))
+        except RedisError as exc:
+            logger.warning('Rate limit check fell back to local buckets for user %s: %s', user_id, exc)
+            bucket = self._users.get((user_id, action))
+            if bucket is None:
+                bucket = self._users[(user_id, action)] = TokenBucket(user_rate, user_burst)
+            return bucket.take()
+
+    def forget(self, sid: str) -> None:
+        """Drop the buckets of a disconnected socket."""
+        self._sockets.pop(sid, None)
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from .views import ConversationListView, MessageSearchView, UnreadCountsView
+
+urlpatterns = [
+    path('conversations', ConversationListView.as_view()),  # GET /api/v1/chat/conversations
+    path('search', MessageSearchView.as_view()),  # GET /api/v1/chat/search?q=
+    path('unread', UnreadCountsView.as_view()),  # GET /api/v1/chat/unread
+]
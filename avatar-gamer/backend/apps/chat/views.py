@@ -0,0 +1,115 @@
+import logging
+
+from django.db.models import Prefetch
+from redis.exceptions import RedisError
+from rest_framework import generics, permissions, status
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import read_state, search
+from .models import ConversationParticipant
+from .serializers import ConversationListItemSerializer, MessageSearchResultSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class UnreadCountsView(APIView):
+    """
+    Unread messages per conversation for the current user, in one call.
+
+    Served from the counters kept in Redis by the socket server; nothing here
+    counts rows in ``ChatMessage``. Without Redis it answers 503 so the client
+    keeps the counts it already has.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            counts = read_state.unread_counts_sync(request.user.id)
+        except RedisError as exc:
+            logger.warning('Unread counts unavailable for user %s: %s', request.user.id, exc)
+            return Response(
+                {"detail": "Contadores no disponibles, intenta más tarde."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        return Response(read_state.as_payload(counts))
+
+
+class ConversationCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = ('-last_message_at', '-id')
+
+
+class ConversationListView(generics.ListAPIView):
+    """
+    The caller's conversations, most recent first.
+
+    Each page is a range scan over the ``(user, last_message_at)`` index plus
+    one query for the participants of the conversations on the page.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = ConversationListItemSerializer
+    pagination_class = ConversationCursorPagination
+
+    def get_queryset(self):
+        return (
+            ConversationParticipant.objects.filter(user=self.request.user)
+            .select_related('conversation')
+            .prefetch_related(
+                Prefetch(
+                    'conversation__participants',
+                    queryset=ConversationParticipant.objects.select_related('user').order_by('id'),
+                )
+            )
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        try:
+            context['unread_counts'] = read_state.unread_counts_sync(self.request.user.id)
+        except RedisError as exc:
+            logger.warning('Unread counts unavailable for the conversation list: %s', exc)
+        return context
+
+
+class MessageSearchView(APIView):
+    """
+    Full-text search over the caller's conversations.
+
+    GET /api/v1/chat/search?q=<texto>[&conversationId=...][&limit=20][&cursor=...]
+    ``q`` accepts web-search syntax ("frase exacta", -excluir, OR).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request):
+        text = (request.query_params.get('q') or '').strip()
+        if not text:
+            return Response({"detail": "El parámetro q es obligatorio."}, status=status.HTTP_400_BAD_REQUEST)
+
+        cursor = request.query_params.get('cursor')
+        decoded = search.decode_cursor(cursor)
+        if cursor and decoded is None:
+            return Response({"detail": "Cursor inválido."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        limit = max(1, min(limit, self.max_limit))
+
+        rows, has_more = search.search_messages(
+            request.user.id,
+            text,
+            limit=limit,
+            cursor=decoded,
+            conversation_id=request.query_params.get('conversationId'),
+        )
+        return Response({
+            "results": MessageSearchResultSerializer(rows, many=True).data,
+            "next": search.encode_cursor(rows[-1]) if has_more and rows else None,
+        })
@@ -0,0 +1,166 @@
+"""Per-client wire format negotiation for the Socket.IO server.
+
+Clients that connect with ``?serializer=msgpack`` in the handshake query (and
+use ``socket.io-msgpack-parser`` on their side) get MessagePack frames; every
+other client keeps receiving the default JSON packets, so older app builds
+continue to work against the same server.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Optional, Set, Type
+from urllib.parse import parse_qs
+
+import msgpack
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+from socketio.msgpack_packet import MsgPackPacket
+
+from .instrumentation import observe_emit
+
+MSGPACK = 'msgpack'
+
+_BINARY_TYPES = {packet.BINARY_EVENT: packet.EVENT, packet.BINARY_ACK: packet.ACK}
+
+
+def requested_serializer(environ: Dict[str, Any]) -> Optional[str]:
+    values = parse_qs(environ.get('QUERY_STRING', '')).get('serializer')
+    return values[0].lower() if values else None
+
+
+class NegotiatingAsyncServer(socketio.AsyncServer):
+    """AsyncServer that speaks JSON or MessagePack depending on the client."""
+
+    def __init__(self, *args, msgpack_enabled: bool = True, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.msgpack_enabled = msgpack_enabled
+        self._msgpack_eio_sids: Set[str] = set()
+
+    def packet_class_for(self, eio_sid: str) -> Type[packet.Packet]:
+        if eio_sid in self._msgpack_eio_sids:
+            return MsgPackPacket
+        return self.packet_class
+
+    async def _handle_eio_connect(self, eio_sid, environ):
+        if self.msgpack_enabled and requested_serializer(environ) == MSGPACK:
+            self._msgpack_eio_sids.add(eio_sid)
+        return await super()._handle_eio_connect(eio_sid, environ)
+
+    async def _handle_eio_disconnect(self, eio_sid, reason):
+        try:
+            return await super()._handle_eio_disconnect(eio_sid, reason)
+        finally:
+            self._msgpack_eio_sids.discard(eio_sid)
+
+    async def _handle_eio_message(self, eio_sid, data):
+        if eio_sid not in self._msgpack_eio_sids:
+            return await super()._handle_eio_message(eio_sid, data)
+
+        # MessagePack carries binary natively, so there are no attachment
+        # packets to reassemble here.
+        pkt = MsgPackPacket(encoded_packet=data)
+        if pkt.packet_type == packet.CONNECT:
+            await self._handle_connect(eio_sid, pkt.namespace, pkt.data)
+        elif pkt.packet_type == packet.DISCONNECT:
+            await self._handle_disconnect(eio_sid, pkt.namespace, self.reason.CLIENT_DISCONNECT)
+        elif pkt.packet_type == packet.EVENT:
+            await self._handle_event(eio_sid, pkt.namespace, pkt.id, pkt.data)
+        elif pkt.packet_type == packet.ACK:
+            await self._handle_ack(eio_sid, pkt.namespace, pkt.id, pkt.data)
+        else:
+            raise ValueError('Unexpected packet type for msgpack client.')
+
+    async def _send_packet(self, eio_sid, pkt):
+        if eio_sid in self._msgpack_eio_sids and not isinstance(pkt, MsgPackPacket):
+            pkt = MsgPackPacket(
+                _BINARY_TYPES.get(pkt.packet_type, pkt.packet_type),
+                data=pkt.data,
+                namespace=pkt.namespace,
+                id=pkt.id,
+            )
+        return await super()._send_packet(eio_sid, pkt)
+
+
+class _NegotiatingManagerMixin(socketio.AsyncManager):
+    """Encodes each broadcast once per wire format instead of once per server.
+
+    It sits below the pub/sub layer in the MRO, so it handles local delivery
+    both for emits that originate here and for emits received from Redis.
+    Encoded sizes are recorded here too, since this is the one place that
+    sees every payload.
+    """
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        server = self.server
+        if callback or not hasattr(server, 'packet_class_for'):
+            return await super().emit(
+                event, data, namespace, room=room, skip_sid=skip_sid, callback=callback, to=to, **kwargs
+            )
+
+        room = to or room
+        if namespace not in self.rooms:
+            return
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        encoded: Dict[Type[packet.Packet], List[eio_packet.Packet]] = {}
+        deliveries: Dict[Type[packet.Packet], int] = {}
+        tasks = []
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid in skip_sid:
+                continue
+            packet_class = server.packet_class_for(eio_sid)
+            eio_pkts = encoded.get(packet_class)
+            if eio_pkts is None:
+                pkt = packet_class(packet.EVENT, namespace=namespace, data=[event] + data)
+                payload = pkt.encode()
+                if not isinstance(payload, list):
+                    payload = [payload]
+                eio_pkts = encoded[packet_class] = [eio_packet.Packet(eio_packet.MESSAGE, p) for p in payload]
+            deliveries[packet_class] = deliveries.get(packet_class, 0) + 1
+            for p in eio_pkts:
+                tasks.append(asyncio.create_task(server._send_eio_packet(eio_sid, p)))
+        for packet_class, eio_pkts in encoded.items():
+            observe_emit(
+                event,
+                MSGPACK if packet_class is MsgPackPacket else 'json',
+                sum(len(p.data) for p in eio_pkts),
+                deliveries[packet_class],
+            )
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+class NegotiatingRedisManager(socketio.AsyncRedisManager, _NegotiatingManagerMixin):
+    def __init__(self, *args, codec: Any = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._codec = codec
+
+    def set_server(self, server):
+        super().set_server(server)
+        # set_server() resets the pub/sub codec to the packet JSON module.
+        if self._codec is not None:
+            self.json = self._codec
+
+
+class MsgPackCodec:
+    """``json``-compatible codec for the Redis pub/sub channel.
+
+    Every node publishing to the channel must use the same codec, so switch it
+    for the whole deployment at once.
+    """
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    @staticmethod
+    def loads(data: Any) -> Any:
+        return msgpack.unpackb(data, raw=False)
@@ -0,0 +1,133 @@
+import json
+import uuid
+
+import socketio
+from django.conf import settings
+from django.utils import timezone
+
+from apps.accounts.links import linked_user_ids_many
+from apps.accounts.models import Role
+from apps.chat.redis_client import get_redis
+from apps.chat.wire import MSGPACK, MsgPackCodec
+
+NAMESPACE = "/robot"
+EMPTY = {"command": ""}
+
+CACHE_PREFIX = "control:"
+# Tiempo durante el cual se reenvía al operador el ack de un comando.
+ACK_TTL = 60
+# Segundos que set_command espera el ack del robot antes de responder.
+ACK_WAIT = 2
+
+_emitter = None
+
+
+def robot_room(robot_id):
+    return f"robot:{robot_id}"
+
+
+def _command_key(robot_id):
+    return f"{CACHE_PREFIX}command:{robot_id}"
+
+
+def _ack_key(command_id):
+    return f"{CACHE_PREFIX}ack:{command_id}"
+
+
+def _ack_result_key(command_id):
+    return f"{CACHE_PREFIX}ack-result:{command_id}"
+
+
+def may_be_robot(identity):
+    """
+    Solo una cuenta de usuario activa puede conectarse como robot, y solo como
+    el suyo: la sala es la de su propio id. Operadores y admins solo controlan.
+    """
+    return identity["role"] == Role.USER and identity["is_active"]
+
+
+def may_command(user_id, user_role, robot_id):
+    """Bloqueante: el propio robot, el de un usuario vinculado o, para los admin, cualquiera."""
+    if robot_id == user_id or user_role == Role.ADMIN:
+        return True
+    return robot_id in linked_user_ids_many([user_id])[user_id]
+
+
+def build_command(command, robot_id):
+    """
+    Comando tal como lo reciben los robots y como queda guardado.
+
+    El commandId lo genera siempre el servidor: el destino del ack se guarda
+    bajo ese id, y uno elegido por el cliente permitiría a otro emisor
+    reemplazarlo y quedarse con los acks ajenos.
+    """
+    return {
+        "command": command,
+        "commandId": uuid.uuid4().hex,
+        "robotId": robot_id,
+        "issuedAt": timezone.now().isoformat(),
+    }
+
+
+async def aload_command(robot_id):
+    raw = await get_redis().get(_command_key(robot_id))
+    return json.loads(raw) if raw else None
+
+
+async def asave_command(command, sender_sid):
+    """
+    Guarda el último comando del robot y a quién devolver su ack.
+
+    El ack se asocia al commandId (no al último comando) para que un robot
+    lento pueda confirmar comandos que ya fueron reemplazados. Sin
+    ``sender_sid`` (comandos enviados por HTTP) el ack queda en Redis para
+    ``await_ack``.
+    """
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.set(_command_key(command["robotId"]), json.dumps(command))
+    pipe.set(
+        _ack_key(command["commandId"]),
+        json.dumps({"sid": sender_sid, "robotId": command["robotId"]}),
+        ex=ACK_TTL,
+    )
+    await pipe.execute()
+
+
+async def aload_ack_target(command_id):
+    raw = await get_redis().get(_ack_key(command_id))
+    return json.loads(raw) if raw else None
+
+
+async def asave_ack(command_id, ack):
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.rpush(_ack_result_key(command_id), json.dumps(ack))
+    pipe.expire(_ack_result_key(command_id), ACK_TTL)
+    await pipe.execute()
+
+
+async def await_ack(command_id, timeout=ACK_WAIT):
+    """Ack del robot para un comando enviado por HTTP, o None si no llega a tiempo."""
+    popped = await get_redis().blpop([_ack_result_key(command_id)], timeout=timeout)
+    return json.loads(popped[1]) if popped else None
+
+
+def get_emitter():
+    """
+    Manager Socket.IO de solo escritura para emitir desde vistas síncronas.
+
+    Publica en el mismo canal de Redis que el servidor, con el mismo códec,
+    así que cualquier worker entrega el evento a sus robots conectados.
+    """
+    global _emitter
+    if _emitter is None:
+        _emitter = socketio.RedisManager(
+            settings.SOCKETIO_CONFIG["REDIS_URL"],
+            write_only=True,
+            json=MsgPackCodec if settings.SOCKETIO_CONFIG["PUBSUB_SERIALIZER"] == MSGPACK else None,
+        )
+    return _emitter
+
+
+def push_command(command):
+    """Bloqueante: envía el comando a los robots conectados de ``command["robotId"]``."""
+    get_emitter().emit("robot:command", command, namespace=NAMESPACE, room=robot_room(command["robotId"]))
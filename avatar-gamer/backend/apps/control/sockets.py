@@ -0,0 +1,153 @@
+"""
+Namespace Socket.IO ``/robot``: los comandos del operador llegan al robot al
+instante, sin que el robot tenga que consultar ``get_command`` periódicamente.
+
+- Robots: se conectan con el JWT de la cuenta de usuario dueña del robot y
+  ``auth={"robot": true}`` (o ``?client=robot``). El servidor comprueba que la
+  cuenta pueda ser un robot (``commands.may_be_robot``); quedan en la sala
+  ``robot:<user_id>``, reciben ``robot:command`` y responden ``robot:ack``.
+- Operadores: se conectan con su JWT y emiten ``robot:command``
+  ``{command, robotId?}``. El callback confirma el envío con el ``commandId``
+  asignado y luego reciben ``robot:ack`` cuando el robot lo confirma. Los comandos enviados
+  por HTTP (``set_command``) reciben el ack en la respuesta.
+
+Un usuario puede controlar su propio robot (misma cuenta en ambos teléfonos)
+o el de un usuario vinculado por ``OperatorUserLink``; los admin, cualquiera.
+Los handlers se registran al importar este módulo desde ``config/asgi.py``.
+"""
+import logging
+
+from redis.exceptions import RedisError
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+
+from apps.accounts.models import Role
+from apps.chat import revocations
+from apps.chat.db import run_db
+from apps.chat.sockets import _extract_query_params, _extract_token, _resolve_user_from_token, sio
+from . import commands
+from .commands import NAMESPACE, robot_room
+
+logger = logging.getLogger(__name__)
+
+
+def _is_robot(auth, environ):
+    if isinstance(auth, dict) and auth.get("robot"):
+        return True
+    return _extract_query_params(environ).get("client") == "robot"
+
+
+def _error(code):
+    return {"status": "error", "code": code}
+
+
+async def _can_command(session, robot_id):
+    """Autoriza y recuerda en la sesión los robots que el usuario puede controlar."""
+    allowed = session.setdefault("robots", set())
+    if robot_id in allowed:
+        return True
+    if not await run_db(commands.may_command, session["user_id"], session["user_role"], robot_id):
+        return False
+    allowed.add(robot_id)
+    return True
+
+
+async def _revoke_robots(operator_id, user_id):
+    """Quita de las sesiones de este proceso los robots de un vínculo eliminado."""
+    pairs = {operator_id: user_id, user_id: operator_id}
+    # Los operadores no tienen sala propia en /robot: se recorren todos los sockets.
+    for sid, _ in list(sio.manager.get_participants(NAMESPACE, None)):
+        try:
+            session = await sio.get_session(sid, namespace=NAMESPACE)
+        except KeyError:
+            continue
+        robot_id = pairs.get(session.get("user_id"))
+        if robot_id is not None and session.get("user_role") != Role.ADMIN:
+            session.get("robots", set()).discard(robot_id)
+
+
+revocations.listener.add(_revoke_robots)
+
+
+@sio.on("connect", namespace=NAMESPACE)
+async def connect(sid, environ, auth):
+    token = _extract_token(auth, environ)
+    if not token:
+        logger.warning("Conexión /robot rechazada: falta el token.")
+        return False
+
+    try:
+        identity = await _resolve_user_from_token(token)
+    except (AuthenticationFailed, InvalidToken, TokenError) as exc:
+        logger.warning("Conexión /robot rechazada: token inválido. %s", exc)
+        return False
+
+    user_id = identity["user_id"]
+    is_robot = _is_robot(auth, environ)
+    if is_robot and not commands.may_be_robot(identity):
+        logger.warning("Conexión /robot rechazada: user=%s (%s) no puede ser un robot.", user_id, identity["role"])
+        return False
+    await sio.save_session(
+        sid,
+        {"user_id": user_id, "user_role": identity["role"], "robot": is_robot},
+        namespace=NAMESPACE,
+    )
+    if not is_robot:
+        return True
+
+    await sio.enter_room(sid, robot_room(user_id), namespace=NAMESPACE)
+    # Al (re)conectarse el robot recibe el último comando sin esperar uno nuevo.
+    try:
+        latest = await commands.aload_command(user_id)
+    except RedisError as exc:
+        logger.warning("No se pudo leer el último comando del robot %s: %s", user_id, exc)
+        latest = None
+    if latest:
+        await sio.emit("robot:command", latest, to=sid, namespace=NAMESPACE)
+    logger.debug("Robot conectado: sid=%s user=%s", sid, user_id)
+    return True
+
+
+@sio.on("robot:command", namespace=NAMESPACE)
+async def robot_command(sid, payload):
+    session = await sio.get_session(sid, namespace=NAMESPACE)
+    if not isinstance(payload, dict) or not isinstance(payload.get("command"), str):
+        return _error("invalid_payload")
+
+    try:
+        robot_id = int(payload.get("robotId") or session["user_id"])
+    except (TypeError, ValueError):
+        return _error("invalid_robot")
+    if not await _can_command(session, robot_id):
+        logger.warning("robot:command rechazado: user=%s robot=%s", session["user_id"], robot_id)
+        return _error("forbidden")
+
+    command = commands.build_command(payload["command"], robot_id)
+    # Se guarda antes de emitir para que el ack del robot siempre encuentre al
+    # operador; si Redis falla el comando igual se entrega.
+    try:
+        await commands.asave_command(command, sid)
+    except RedisError as exc:
+        logger.warning("No se pudo guardar el comando %s: %s", command["commandId"], exc)
+    await sio.emit("robot:command", command, room=robot_room(robot_id), namespace=NAMESPACE)
+    return {"status": "sent", "commandId": command["commandId"]}
+
+
+@sio.on("robot:ack", namespace=NAMESPACE)
+async def robot_ack(sid, payload):
+    """Reenvía la confirmación del robot al operador (o a ``set_command``) que envió el comando."""
+    session = await sio.get_session(sid, namespace=NAMESPACE)
+    if not session.get("robot") or not isinstance(payload, dict):
+        return
+
+    command_id = payload.get("commandId")
+    if not isinstance(command_id, str):
+        return
+    target = await commands.aload_ack_target(command_id)
+    if target is None or target["robotId"] != session["user_id"]:
+        return
+
+    ack = {"commandId": command_id, "robotId": session["user_id"], "status": payload.get("status", "received")}
+    if target["sid"] is None:
+        await commands.asave_ack(command_id, ack)
+        return
+    await sio.emit("robot:ack", ack, to=target["sid"], namespace=NAMESPACE)
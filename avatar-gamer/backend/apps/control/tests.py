@@ -1,3 +1,160 @@
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
 from django.test import TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.accounts.identity import identity_cache
+from apps.accounts.links import invalidate_linked_user_ids
+from apps.accounts.models import OperatorUserLink, Role
+from . import commands, sockets
+
+
+async def _db_in_test_thread(func, *args, **kwargs):
+    # Las queries corren en el thread del test para ver los datos de su transacción.
+    return await sync_to_async(func)(*args, **kwargs)
+
+
+class CommandViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user("operator")
+        cls.operator.profile.role = Role.OPERATOR
+        cls.operator.profile.save()
+        cls.robot = User.objects.create_user("robot")
+        cls.stranger = User.objects.create_user("stranger")
+        OperatorUserLink.objects.create(operator=cls.operator, user=cls.robot)
+
+    def setUp(self):
+        # Los ids se repiten entre corridas: las cachés compartidas no deben traer datos viejos.
+        users = (self.operator.id, self.robot.id, self.stranger.id)
+        for user_id in users:
+            identity_cache.invalidate(user_id)
+        invalidate_linked_user_ids(*users)
+        for target, value in (
+            ("apps.control.views.run_db", _db_in_test_thread),
+            ("apps.control.commands.asave_command", mock.AsyncMock()),
+            ("apps.control.commands.push_command", mock.Mock()),
+            ("apps.control.commands.await_ack", mock.AsyncMock(return_value=None)),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _post(self, body, user=None):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"} if user else {}
+        return self.client.post(
+            "/api/v1/set_command/", data=json.dumps(body), content_type="application/json", **headers
+        )
+
+    def test_requiere_token(self):
+        self.assertEqual(self._post({"command": "1", "robotId": self.robot.id}).status_code, 401)
+        self.assertEqual(self.client.get("/api/v1/get_command/").status_code, 401)
+        commands.push_command.assert_not_called()
+
+    def test_robot_no_vinculado(self):
+        response = self._post({"command": "1", "robotId": self.stranger.id}, user=self.operator)
+        self.assertEqual(response.status_code, 403)
+        commands.push_command.assert_not_called()
+
+    def test_envia_a_la_sala_del_robot_y_devuelve_el_ack(self):
+        commands.await_ack.return_value = {"status": "done"}
+
+        response = self._post({"command": "1", "robotId": self.robot.id}, user=self.operator)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["status"], body["robotId"], body["ack"]), ("acked", self.robot.id, "done"))
+        sent = commands.push_command.call_args.args[0]
+        self.assertEqual((sent["command"], sent["robotId"]), ("1", self.robot.id))
+        # Sin sid de operador: el ack del robot vuelve por Redis a esta respuesta.
+        commands.asave_command.assert_awaited_once_with(sent, None)
+        commands.await_ack.assert_awaited_once_with(sent["commandId"])
+
+    def test_command_id_lo_asigna_el_servidor(self):
+        response = self._post({"command": "1", "robotId": self.robot.id, "commandId": "ajeno"}, user=self.operator)
+
+        sent = commands.push_command.call_args.args[0]
+        self.assertNotEqual(sent["commandId"], "ajeno")
+        self.assertEqual(response.json()["commandId"], sent["commandId"])
+
+    def test_sin_ack_responde_enviado(self):
+        response = self._post({"command": "1"}, user=self.robot)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], "sent")
+        self.assertEqual(commands.push_command.call_args.args[0]["robotId"], self.robot.id)
+
+    def test_get_command_del_robot_propio(self):
+        stored = {"command": "2", "commandId": "c", "robotId": self.robot.id, "issuedAt": "x"}
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.robot)}"}
+        with mock.patch("apps.control.commands.aload_command", mock.AsyncMock(return_value=stored)) as load:
+            response = self.client.get("/api/v1/get_command/", **headers)
+        self.assertEqual(response.json(), stored)
+        load.assert_awaited_once_with(self.robot.id)
+
+
+class RobotCommandTests(TestCase):
+    def test_command_id_del_cliente_no_reemplaza_el_destino_de_otro_ack(self):
+        session = {"user_id": 3, "user_role": Role.OPERATOR, "robots": {7}}
+        with mock.patch.object(sockets.sio, "get_session", mock.AsyncMock(return_value=session)), \
+                mock.patch.object(sockets.sio, "emit", mock.AsyncMock()), \
+                mock.patch("apps.control.commands.asave_command", mock.AsyncMock()) as save:
+            payload = {"command": "1", "robotId": 7, "commandId": "c-1"}
+            result = async_to_sync(sockets.robot_command)("operator-sid", payload)
+
+        saved, sender = save.call_args.args
+        self.assertNotEqual(saved["commandId"], "c-1")
+        self.assertEqual((result["commandId"], sender), (saved["commandId"], "operator-sid"))
+
+
+class RobotConnectTests(TestCase):
+    def _connect(self, role):
+        identity = {"user_id": 7, "role": role, "is_active": True}
+        with mock.patch.object(sockets, "_resolve_user_from_token", mock.AsyncMock(return_value=identity)), \
+                mock.patch.object(sockets.sio, "save_session", mock.AsyncMock()), \
+                mock.patch.object(sockets.sio, "enter_room", mock.AsyncMock()) as enter_room, \
+                mock.patch("apps.control.commands.aload_command", mock.AsyncMock(return_value=None)):
+            accepted = async_to_sync(sockets.connect)("sid", {}, {"token": "t", "robot": True})
+        return accepted, enter_room
+
+    def test_usuario_se_registra_como_su_propio_robot(self):
+        accepted, enter_room = self._connect(Role.USER)
+        self.assertTrue(accepted)
+        enter_room.assert_awaited_once_with("sid", commands.robot_room(7), namespace=commands.NAMESPACE)
+
+    def test_operador_no_puede_registrarse_como_robot(self):
+        for role in (Role.OPERATOR, Role.ADMIN):
+            with self.subTest(role=role), self.assertLogs("apps.control.sockets", "WARNING"):
+                accepted, enter_room = self._connect(role)
+                self.assertFalse(accepted)
+                enter_room.assert_not_called()
+
+
+class RobotAckTests(TestCase):
+    def _ack(self, target):
+        session = {"user_id": 7, "user_role": Role.USER, "robot": True}
+        with mock.patch.object(sockets.sio, "get_session", mock.AsyncMock(return_value=session)), \
+                mock.patch.object(sockets.sio, "emit", mock.AsyncMock()) as emit, \
+                mock.patch("apps.control.commands.aload_ack_target", mock.AsyncMock(return_value=target)), \
+                mock.patch("apps.control.commands.asave_ack", mock.AsyncMock()) as save:
+            async_to_sync(sockets.robot_ack)("robot-sid", {"commandId": "c-1", "status": "done"})
+        return emit, save
+
+    def test_ack_de_comando_http_queda_en_redis(self):
+        emit, save = self._ack({"sid": None, "robotId": 7})
+        save.assert_awaited_once_with("c-1", {"commandId": "c-1", "robotId": 7, "status": "done"})
+        emit.assert_not_called()
+
+    def test_ack_se_reenvia_al_operador(self):
+        emit, save = self._ack({"sid": "operator-sid", "robotId": 7})
+        emit.assert_awaited_once()
+        self.assertEqual(emit.call_args.kwargs["to"], "operator-sid")
+        save.assert_not_called()
 
-# Create your tests here.
+    def test_ack_de_otro_robot_se_ignora(self):
+        emit, save = self._ack({"sid": "operator-sid", "robotId": 8})
+        emit.assert_not_called()
+        save.assert_not_called()
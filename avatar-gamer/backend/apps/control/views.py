@@ -1,37 +1,114 @@
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from redis.exceptions import RedisError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_api_settings
 import json
 
-# Variable global (se guarda el último comando enviado por el operador)
-LAST_COMMAND = {"command": ""}
+from apps.accounts.identity import get_identity
+from apps.chat.db import run_db
+from . import commands
+from .commands import EMPTY
+
+# El último comando de cada robot vive en Redis (compartido entre workers) y se
+# envía al instante a los robots de ese usuario conectados al namespace /robot.
+# Las vistas son async para esperar el ack del robot sin ocupar un thread.
+
+jwt_auth = JWTAuthentication()
+
+
+def _identity(request):
+    """Bloqueante: identidad del usuario del header ``Authorization: Bearer``, o None."""
+    header = jwt_auth.get_header(request)
+    raw_token = jwt_auth.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        user_id = int(jwt_auth.get_validated_token(raw_token)[jwt_api_settings.USER_ID_CLAIM])
+    except (InvalidToken, TokenError, KeyError, TypeError, ValueError):
+        return None
+    identity = get_identity(user_id)
+    if identity is None or not identity["is_active"]:
+        return None
+    return identity
+
+
+async def _authorize(request, robot_id):
+    """Devuelve ``(robot_id, error)``; ``robot_id`` por defecto es el del propio usuario."""
+    identity = await run_db(_identity, request)
+    if identity is None:
+        return None, JsonResponse({"error": "No autenticado"}, status=401)
+    try:
+        robot_id = int(robot_id or identity["user_id"])
+    except (TypeError, ValueError):
+        return None, JsonResponse({"error": "robotId inválido"}, status=400)
+    if not await run_db(commands.may_command, identity["user_id"], identity["role"], robot_id):
+        return None, JsonResponse({"error": "No autorizado para este robot"}, status=403)
+    return robot_id, None
+
 
 @csrf_exempt
-def set_command(request):
+async def set_command(request):
     """
-    Recibe un comando desde el teléfono A (operador)
+    Recibe un comando desde el teléfono A (operador) y lo envía al robot
     Ejemplo:
       POST /api/v1/set_command/
-      Body: { "command": "1" }
+      Authorization: Bearer <jwt>
+      Body: { "command": "1", "robotId": 12 }
+      Respuesta: { "status": "acked", "commandId": "...", "robotId": 12, "command": "1", "ack": "received" }
+
+    Sin ``robotId`` se envía al robot de la misma cuenta. Si el robot no
+    confirma en ``ACK_WAIT`` segundos se responde 202 con ``status: "sent"``.
     """
-    global LAST_COMMAND
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            comando = data.get("command", "")
-            LAST_COMMAND["command"] = comando
-            print(f"✅ Comando recibido del operador: {comando}")
-            return JsonResponse({"status": "ok", "command": comando})
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=400)
-    return JsonResponse({"error": "Método no permitido"}, status=405)
-
-
-def get_command(request):
+    if request.method != 'POST':
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+    if not isinstance(data, dict) or not isinstance(data.get("command", ""), str):
+        return JsonResponse({"error": "command debe ser texto"}, status=400)
+
+    robot_id, error = await _authorize(request, data.get("robotId"))
+    if error is not None:
+        return error
+
+    command = commands.build_command(data.get("command", ""), robot_id)
+    try:
+        await commands.asave_command(command, None)
+        await sync_to_async(commands.push_command, thread_sensitive=False)(command)
+        ack = await commands.await_ack(command["commandId"])
+    except RedisError as e:
+        return JsonResponse({"error": str(e)}, status=503)
+
+    response = {
+        "status": "acked" if ack else "sent",
+        "commandId": command["commandId"],
+        "robotId": robot_id,
+        "command": command["command"],
+    }
+    if ack:
+        response["ack"] = ack["status"]
+    return JsonResponse(response, status=200 if ack else 202)
+
+
+async def get_command(request):
     """
-    Devuelve el último comando guardado (para el teléfono B / robot)
+    Devuelve el último comando enviado a un robot (para el teléfono B / robot)
     Ejemplo:
-      GET /api/v1/get_command/
-      Respuesta: { "command": "1" }
+      GET /api/v1/get_command/?robotId=12
+      Authorization: Bearer <jwt>
+      Respuesta: { "command": "1", "commandId": "...", "robotId": 12, "issuedAt": "..." }
+
+    Los robots deberían suscribirse al namespace /robot en vez de consultar
+    este endpoint periódicamente.
     """
-    global LAST_COMMAND
-    return JsonResponse(LAST_COMMAND)
+    robot_id, error = await _authorize(request, request.GET.get("robotId"))
+    if error is not None:
+        return error
+    try:
+        return JsonResponse(await commands.aload_command(robot_id) or EMPTY)
+    except RedisError as e:
+        return JsonResponse({"error": str(e)}, status=503)
@@ -0,0 +1,28 @@
+"""Latency summaries shared by the chat load generator and the API benchmark."""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Optional, Sequence
+
+
+def percentile(samples: Sequence[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of ``samples`` (``None`` when empty)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct * len(ordered) / 100))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(samples: Sequence[float]) -> Dict[str, Any]:
+    """Count and p50/p95/p99/max of a list of seconds, reported in milliseconds."""
+    def _ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 2)
+
+    return {
+        'count': len(samples),
+        'p50': _ms(percentile(samples, 50)),
+        'p95': _ms(percentile(samples, 95)),
+        'p99': _ms(percentile(samples, 99)),
+        'max': _ms(max(samples) if samples else None),
+    }
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+
+from .registry import enabled, get_registry
+
+_registry = get_registry()
+REQUEST_DURATION = _registry.histogram(
+    'http_request_duration_seconds',
+    'Time spent serving HTTP requests, by route pattern.',
+    ('method', 'route'),
+)
+REQUESTS = _registry.counter(
+    'http_requests_total',
+    'HTTP responses, by route pattern and status code.',
+    ('method', 'route', 'status'),
+)
+
+
+def _route(request) -> str:
+    # The URL pattern ("api/v1/link-requests/<int:pk>") keeps label
+    # cardinality bounded; unknown paths are grouped together.
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    Records latency and status of every request per route.
+
+    Works natively in both sync and async stacks so it does not add a
+    thread hop under ASGI. Put it first in ``MIDDLEWARE`` to time the
+    whole chain.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self._async = iscoroutinefunction(get_response)
+        if self._async:
+            markcoroutinefunction(self)
+
+    def _record(self, request, response, started: float) -> None:
+        route = _route(request)
+        REQUEST_DURATION.labels(request.method, route).observe(time.perf_counter() - started)
+        REQUESTS.labels(request.method, route, str(response.status_code)).inc()
+
+    def __call__(self, request):
+        if self._async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, started)
+        return response
@@ -0,0 +1,146 @@
+"""
+Opt-in per-request SQL profiler (``QUERY_PROFILER["ENABLED"]``).
+
+Every query on every database connection used while serving the request is
+counted and timed through ``connection.execute_wrapper``, which works with
+``DEBUG = False``. Queries are grouped by fingerprint (the SQL with literals
+and ``IN`` lists collapsed), so a statement repeated once per row shows up as
+one fingerprint with a high count, the signature of an N+1.
+
+Results go to ``X-DB-*`` response headers and to one structured log line per
+request. Views can declare ``@query_budget(n)``; in strict mode (tests, CI,
+``bench_api``) exceeding it raises ``QueryBudgetExceeded`` instead of only
+logging it.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|\$\d+)\s*,?)+\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode when a view runs more queries than its budget."""
+
+
+def fingerprint(sql: str) -> str:
+    """Normalize ``sql`` so the same statement with other values maps to one key."""
+    sql = _STRING.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def query_budget(max_queries: int):
+    """Declare the most queries a view (class or function) may run per request."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def _budget_for(request) -> Optional[int]:
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    func = match.func
+    budget = getattr(getattr(func, 'view_class', None), 'query_budget', None)
+    return budget if budget is not None else getattr(func, 'query_budget', None)
+
+
+class QueryProfile:
+    """Collects the queries of one request (used as an ``execute_wrapper``)."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints: Counter = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        return {sql: count for sql, count in self.fingerprints.most_common() if count >= threshold}
+
+
+class QueryProfilerMiddleware:
+    """
+    Adds ``X-DB-Query-Count``, ``X-DB-Time-Ms`` and ``X-DB-Repeated-Queries``
+    headers and logs a JSON summary with the repeated fingerprints.
+
+    Opt-in: it removes itself from the stack unless ``QUERY_PROFILER["ENABLED"]``.
+    It is deliberately sync-only: under ASGI Django then runs it and the rest
+    of the chain in one thread-sensitive worker, which is the thread whose
+    connections the views use, so the wrappers installed here see every query.
+    """
+
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response) -> None:
+        config = settings.QUERY_PROFILER
+        if not config["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.strict = config["STRICT"]
+        self.threshold = config["REPEAT_THRESHOLD"]
+
+    def __call__(self, request):
+        profile = QueryProfile()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(profile))
+            response = self.get_response(request)
+        return self._report(request, response, profile)
+
+    def _report(self, request, response, profile: QueryProfile):
+        repeated = profile.repeated(self.threshold)
+        budget = _budget_for(request)
+        over_budget = budget is not None and profile.count > budget
+
+        response['X-DB-Query-Count'] = str(profile.count)
+        response['X-DB-Time-Ms'] = f'{profile.duration * 1000:.2f}'
+        response['X-DB-Repeated-Queries'] = str(sum(repeated.values()))
+        if budget is not None:
+            response['X-DB-Query-Budget'] = str(budget)
+
+        match = getattr(request, 'resolver_match', None)
+        payload: Dict[str, Any] = {
+            'method': request.method,
+            'route': match.route if match is not None else request.path,
+            'status': response.status_code,
+            'queries': profile.count,
+            'dbTimeMs': round(profile.duration * 1000, 2),
+            'budget': budget,
+            'repeated': [{'count': count, 'sql': sql} for sql, count in repeated.items()],
+        }
+        level = logging.WARNING if repeated or over_budget else logging.INFO
+        logger.log(level, 'query_profile %s', json.dumps(payload), extra={'query_profile': payload})
+
+        if over_budget and self.strict:
+            raise QueryBudgetExceeded(
+                f'{payload["method"]} {payload["route"]} ran {profile.count} queries '
+                f'(budget {budget}); repeated: {payload["repeated"]}'
+            )
+        return response
@@ -0,0 +1,266 @@
+"""
+Small in-process metrics registry with Prometheus text exposition.
+
+Metrics live in the memory of each worker process, so scrape every process
+(or every pod) rather than a load-balanced address. Recording a sample is a
+dict lookup, a ``bisect`` and a short critical section, cheap enough to
+leave on in production; all formatting happens at scrape time.
+
+The registry used by the project is chosen with ``METRICS_CONFIG["REGISTRY"]``
+(dotted path to a factory), so it can be swapped for an adapter to another
+client library without touching the instrumented code.
+"""
+from __future__ import annotations
+
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Seconds; covers sub-millisecond handlers up to slow requests.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes.
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# (suffix, label pairs, value) as produced by collectors.
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    rendered = ','.join(f'{name}="{_escape(str(value))}"' for name, value in pairs)
+    return f'{{{rendered}}}' if rendered else ''
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Child for one combination of label values (cached; keep cardinality bounded)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}, got {values}')
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self, lock: threading.Lock) -> None:
+        self.value = 0.0
+        self._lock = lock
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonic counter; by convention its name ends in ``_total``."""
+
+    kind = 'counter'
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild(self._lock)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [
+                ('', tuple(zip(self.labelnames, values)), child.value)
+                for values, child in self._children.items()
+            ]
+
+
+class _GaugeChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self, lock: threading.Lock) -> None:
+        self.value = 0.0
+        self._lock = lock
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild(self._lock)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [('', tuple(zip(self.labelnames, values)), child.value) for values, child in self._children.items()]
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds: Tuple[float, ...], lock: threading.Lock) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = lock
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets, self._lock)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> List[Sample]:
+        samples: List[Sample] = []
+        with self._lock:
+            snapshot = [(values, list(child.counts), child.sum, child.count) for values, child in self._children.items()]
+        for values, counts, total, count in snapshot:
+            labels = tuple(zip(self.labelnames, values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', labels + (('le', _format_value(bound)),), cumulative))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, count))
+        return samples
+
+
+class Registry:
+    """
+    Holds metrics and scrape-time collectors.
+
+    ``counter``/``gauge``/``histogram`` are idempotent per name, so modules
+    can declare their metrics at import time. Collectors are callables run on
+    every scrape that yield ``(name, kind, help, samples)`` for values that
+    are cheaper to read than to track (socket counts, pool stats).
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f'Metric {name} is already registered as a {metric.kind}.')
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]) -> None:
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        families = [(metric.name, metric.kind, metric.documentation, metric.samples()) for metric in metrics]
+        for collector in collectors:
+            families.extend(collector())
+
+        lines: List[str] = []
+        for name, kind, documentation, samples in families:
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples:
+                lines.append(f'{name}{suffix}{_format_labels(labels)} {_format_value(float(value))}')
+        return '\n'.join(lines) + '\n'
+
+
+_registry: Optional[Registry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> Registry:
+    """Process-wide registry, built from ``METRICS_CONFIG["REGISTRY"]`` on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                factory = settings.METRICS_CONFIG.get("REGISTRY")
+                _registry = import_string(factory)() if factory else Registry()
+    return _registry
+
+
+def enabled() -> bool:
+    return settings.METRICS_CONFIG["ENABLED"]
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from .latency import percentile, summarize
+
+
+def _metrics_config(**overrides):
+    return {**settings.METRICS_CONFIG, 'ENABLED': True, **overrides}
+
+
+class MetricsEndpointTests(SimpleTestCase):
+    @override_settings(METRICS_CONFIG=_metrics_config(TOKEN=''))
+    def test_closed_without_a_configured_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_CONFIG=_metrics_config(TOKEN='secret'))
+    def test_requires_the_bearer_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    @override_settings(METRICS_CONFIG=_metrics_config(ENABLED=False, TOKEN='secret'))
+    def test_disabled_endpoint_is_not_found(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 404)
+
+
+class LatencySummaryTests(SimpleTestCase):
+    def test_nearest_rank_percentiles_in_milliseconds(self):
+        samples = [index / 1000 for index in range(1, 101)]
+        self.assertEqual(summarize(samples), {'count': 100, 'p50': 50.0, 'p95': 95.0, 'p99': 99.0, 'max': 100.0})
+
+    def test_empty_samples(self):
+        self.assertEqual(summarize([]), {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None})
+        self.assertIsNone(percentile([], 50))
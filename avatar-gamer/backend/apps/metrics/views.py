@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+from .registry import enabled, get_registry
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; requires ``Bearer <METRICS_TOKEN>`` and is closed without a token."""
+    if not enabled():
+        raise Http404
+    token = settings.METRICS_CONFIG["TOKEN"]
+    if not token:
+        return HttpResponse(status=403)
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+        return HttpResponse(status=401)
+    return HttpResponse(get_registry().render(), content_type=CONTENT_TYPE)
@@ -8,6 +8,13 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django_asgi_app = get_asgi_application()
 
 # Import after Django is ready so the ORM can be used inside socket handlers.
+from apps.chat import sockets  # noqa: E402
 from apps.chat.sockets import sio  # noqa: E402
+from apps.control import sockets as control_sockets  # noqa: E402,F401  registers the /robot namespace
 
-application = ASGIApp(sio, django_asgi_app)
+application = ASGIApp(
+    sio,
+    django_asgi_app,
+    on_startup=sockets.startup,
+    on_shutdown=sockets.shutdown,
+)
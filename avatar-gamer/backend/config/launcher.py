@@ -0,0 +1,310 @@
+"""
+Multi-process launcher: ``python -m config.launcher``.
+
+Starts ``--workers`` (``WEB_CONCURRENCY``) uvicorn processes, each listening on
+its own Unix socket, plus a small asyncio proxy on the public port. The
+workers share state through the existing ``AsyncRedisManager`` (rooms, emits)
+and Redis/Postgres; the proxy only has to keep each Engine.IO session on the
+worker that created it:
+
+* every worker prefixes the sids it issues with its index
+  (``apps.chat.sticky``), so a long-polling request carrying ``?sid=3.…`` is
+  forwarded to worker 3 and a handshake (no sid) is assigned round-robin;
+* ``?worker=N`` pins any other request, e.g. to scrape ``/metrics`` of each
+  process;
+* WebSocket upgrades are piped in both directions for the socket's lifetime.
+  Plain HTTP requests are forwarded with ``Connection: close`` so a browser
+  that reuses one keep-alive connection for several sessions still gets each
+  request routed on its own.
+
+SIGTERM/SIGINT stop accepting connections, forward SIGTERM to the workers
+(uvicorn then closes its sockets and runs the lifespan shutdown, which flushes
+the chat buffers) and SIGKILL whatever is still alive after
+``--graceful-timeout``. A worker that dies on its own is restarted.
+
+Large deployments can put nginx in front instead (``hash $arg_sid`` upstream
+per worker socket); this launcher keeps the single-container setup simple.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from typing import List, Optional, Set
+from urllib.parse import parse_qs, urlsplit
+
+from apps.chat.sticky import worker_of
+
+logger = logging.getLogger('config.launcher')
+
+HEAD_LIMIT = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+RESTART_BACKOFF = 1.0
+
+
+class Worker:
+    """One uvicorn process bound to a Unix socket."""
+
+    def __init__(self, index: int, socket_path: str, options: argparse.Namespace) -> None:
+        self.index = index
+        self.socket_path = socket_path
+        self.options = options
+        self.process: Optional[asyncio.subprocess.Process] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        env = dict(os.environ, CHAT_WORKER_ID=str(self.index))
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, '-m', 'uvicorn', self.options.app,
+            '--uds', self.socket_path,
+            '--log-level', self.options.log_level,
+            '--timeout-graceful-shutdown', str(int(self.options.graceful_timeout)),
+            # Only the proxy can reach the socket, so its X-Forwarded-For is trusted.
+            '--proxy-headers', '--forwarded-allow-ips', '*',
+            env=env,
+        )
+        logger.info('worker %s started (pid %s)', self.index, self.process.pid)
+
+    async def wait_ready(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.alive:
+                raise RuntimeError(f'worker {self.index} exited during startup')
+            try:
+                _, writer = await asyncio.open_unix_connection(self.socket_path)
+            except OSError:
+                await asyncio.sleep(0.1)
+                continue
+            writer.close()
+            return
+        raise RuntimeError(f'worker {self.index} did not start listening within {timeout}s')
+
+    def terminate(self) -> None:
+        if self.alive:
+            self.process.send_signal(signal.SIGTERM)
+
+    async def wait_stopped(self, timeout: float) -> None:
+        if self.process is None:
+            return
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning('worker %s did not stop in %ss, killing it', self.index, timeout)
+            self.process.kill()
+            await self.process.wait()
+
+
+def _target_worker(target: bytes, count: int) -> Optional[int]:
+    query = parse_qs(urlsplit(target.decode('latin-1')).query)
+    sid = query.get('sid')
+    if sid:
+        index = worker_of(sid[0])
+    else:
+        pinned = query.get('worker', [''])[0]
+        index = int(pinned) if pinned.isdigit() else None
+    return index if index is not None and index < count else None
+
+
+def _rewrite_head(head: bytes, peer: Optional[str]) -> tuple[bytes, bytes, bool]:
+    """Return ``(target, head, upgrade)`` with proxy headers applied."""
+    lines = head.split(b'\r\n')
+    request_line = lines[0]
+    parts = request_line.split(b' ')
+    target = parts[1] if len(parts) == 3 else b'/'
+
+    headers: List[bytes] = []
+    forwarded_for = b''
+    upgrade = False
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(b':')
+        lowered = name.strip().lower()
+        if lowered == b'connection':
+            upgrade = b'upgrade' in value.lower()
+            continue
+        if lowered == b'x-forwarded-for':
+            forwarded_for = value.strip()
+            continue
+        headers.append(line)
+
+    if peer:
+        forwarded_for = forwarded_for + b', ' + peer.encode() if forwarded_for else peer.encode()
+    if forwarded_for:
+        headers.append(b'X-Forwarded-For: ' + forwarded_for)
+    headers.append(b'Connection: Upgrade' if upgrade else b'Connection: close')
+    return target, b'\r\n'.join([request_line, *headers, b'', b'']), upgrade
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            data = await reader.read(CHUNK_SIZE)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        if writer.can_write_eof():
+            try:
+                writer.write_eof()
+            except (OSError, RuntimeError):
+                pass
+
+
+class StickyProxy:
+    """TCP front end routing each request to the worker owning its session."""
+
+    def __init__(self, workers: List[Worker]) -> None:
+        self.workers = workers
+        self._round_robin = itertools.cycle(range(len(workers)))
+        self._connections: Set[asyncio.Task] = set()
+
+    def _pick(self, target: bytes) -> Worker:
+        index = _target_worker(target, len(self.workers))
+        if index is not None:
+            return self.workers[index]
+        for _ in range(len(self.workers)):
+            worker = self.workers[next(self._round_robin)]
+            if worker.alive:
+                return worker
+        return self.workers[next(self._round_robin)]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        upstream_writer = None
+        try:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                return
+            peer = writer.get_extra_info('peername')
+            target, head, upgrade = _rewrite_head(head, peer[0] if peer else None)
+            worker = self._pick(target)
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_unix_connection(worker.socket_path)
+            except OSError:
+                writer.write(b'HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                await writer.drain()
+                return
+            upstream_writer.write(head)
+            # Whatever follows the head (request body, WebSocket frames) is
+            # streamed as is; the response ends when the worker closes.
+            upload = asyncio.ensure_future(_pipe(reader, upstream_writer))
+            await _pipe(upstream_reader, writer)
+            if upgrade:
+                await upload
+            else:
+                upload.cancel()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for stream in (upstream_writer, writer):
+                if stream is not None:
+                    stream.close()
+            self._connections.discard(task)
+
+    def cancel_connections(self) -> None:
+        for task in list(self._connections):
+            task.cancel()
+
+
+class Launcher:
+    def __init__(self, options: argparse.Namespace) -> None:
+        self.options = options
+        self.socket_dir = tempfile.mkdtemp(prefix='avatar-gamer-')
+        self.workers = [
+            Worker(index, os.path.join(self.socket_dir, f'worker-{index}.sock'), options)
+            for index in range(options.workers)
+        ]
+        self.proxy = StickyProxy(self.workers)
+        self.stopping = asyncio.Event()
+
+    async def _supervise(self, worker: Worker) -> None:
+        while not self.stopping.is_set():
+            code = await worker.process.wait()
+            if self.stopping.is_set():
+                return
+            logger.error('worker %s exited with code %s, restarting', worker.index, code)
+            await asyncio.sleep(RESTART_BACKOFF)
+            await worker.start()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stopping.set)
+
+        for worker in self.workers:
+            await worker.start()
+        try:
+            await asyncio.gather(*(worker.wait_ready(self.options.startup_timeout) for worker in self.workers))
+        except RuntimeError:
+            await self._stop_workers()
+            raise
+
+        server = await asyncio.start_server(
+            self.proxy.handle, self.options.host, self.options.port, limit=HEAD_LIMIT,
+        )
+        supervisors = [asyncio.ensure_future(self._supervise(worker)) for worker in self.workers]
+        logger.info(
+            'listening on http://%s:%s with %s workers',
+            self.options.host, self.options.port, len(self.workers),
+        )
+
+        await self.stopping.wait()
+        logger.info('shutting down')
+        server.close()
+        await self._stop_workers()
+        for supervisor in supervisors:
+            supervisor.cancel()
+        self.proxy.cancel_connections()
+        await server.wait_closed()
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+    async def _stop_workers(self) -> None:
+        # Stop every worker at once so the whole shutdown takes one timeout.
+        for worker in self.workers:
+            worker.terminate()
+        # uvicorn's own timeout covers open connections; the margin covers the lifespan shutdown.
+        timeout = self.options.graceful_timeout + 5
+        await asyncio.gather(*(worker.wait_stopped(timeout) for worker in self.workers))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--app', default='config.asgi:application')
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY') or os.cpu_count() or 1))
+    parser.add_argument('--graceful-timeout', type=float, default=float(os.getenv('GRACEFUL_TIMEOUT', '20')))
+    parser.add_argument('--startup-timeout', type=float, default=60.0)
+    parser.add_argument('--log-level', default=os.getenv('LOG_LEVEL', 'info'))
+    options = parser.parse_args(argv)
+    if options.workers < 1:
+        parser.error('--workers must be at least 1')
+    return options
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    options = parse_args(argv)
+    logging.basicConfig(level=options.log_level.upper(), format='%(asctime)s [launcher] %(message)s')
+    asyncio.run(Launcher(options).run())
+
+
+if __name__ == '__main__':
+    main()
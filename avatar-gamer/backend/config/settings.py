@@ -20,15 +20,19 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'apps.accounts.apps.AccountsConfig',
     'apps.chat.apps.ChatConfig',
     'apps.control',
+    'apps.metrics.apps.MetricsConfig',
 
 ]
 
 MIDDLEWARE = [
+    'apps.metrics.middleware.MetricsMiddleware',
+    'apps.metrics.queries.QueryProfilerMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -140,8 +144,100 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"redis://{os.getenv('REDIS_HOST', 'redis')}:{os.getenv('REDIS_PORT', '6379')}/1",
+    }
+}
+
+# Tiempo (s) que se cachea la lista de contrapartes vinculadas de cada usuario.
+LINKS_CACHE_TTL = int(os.getenv("LINKS_CACHE_TTL", str(60 * 60)))
+
+# Caché de identidades (rol/is_active) usada al autenticar sockets.
+IDENTITY_CACHE = {
+    "MAX_SIZE": int(os.getenv("IDENTITY_CACHE_MAX_SIZE", "10000")),
+    "TTL": int(os.getenv("IDENTITY_CACHE_TTL", "60")),
+    "SHARED": os.getenv("IDENTITY_CACHE_SHARED", "1") == "1",
+}
+
+# Métricas en formato Prometheus (GET /metrics), por proceso.
+METRICS_CONFIG = {
+    "ENABLED": os.getenv("METRICS_ENABLED", "1") == "1",
+    # El scraper debe enviar "Authorization: Bearer <token>"; sin token /metrics responde 403.
+    "TOKEN": os.getenv("METRICS_TOKEN", ""),
+    # Ruta a una fábrica de registro alternativo (p. ej. un adaptador a otra librería).
+    "REGISTRY": os.getenv("METRICS_REGISTRY", ""),
+}
+
+# Perfilador de queries por request (cabeceras X-DB-* y un log JSON por request).
+# Desactivado por defecto; en modo estricto (tests/CI) superar @query_budget lanza un error.
+QUERY_PROFILER = {
+    "ENABLED": os.getenv("QUERY_PROFILER_ENABLED", "0") == "1",
+    "STRICT": os.getenv("QUERY_PROFILER_STRICT", "0") == "1",
+    # Una misma query (normalizada) repetida este número de veces se reporta como posible N+1.
+    "REPEAT_THRESHOLD": int(os.getenv("QUERY_PROFILER_REPEAT_THRESHOLD", "3")),
+}
+
 SOCKETIO_CONFIG = {
     "REDIS_URL": f"redis://{os.getenv('REDIS_HOST', 'redis')}:{os.getenv('REDIS_PORT', '6379')}/0",
     "ASYNC_MODE": "asgi",
     "CORS_ALLOWED_ORIGINS": CORS_ALLOWED_ORIGINS if not CORS_ALLOW_ALL_ORIGINS else "*",
+    # Permite que cada cliente pida MessagePack con ?serializer=msgpack; el resto sigue usando JSON.
+    "MSGPACK": os.getenv("SOCKETIO_MSGPACK", "1") == "1",
+    # Formato del canal pub/sub de Redis ("json" o "msgpack"); debe ser el mismo en todos los nodos.
+    "PUBSUB_SERIALIZER": os.getenv("SOCKETIO_PUBSUB_SERIALIZER", "json"),
+    # Índice del worker cuando se usa config.launcher (lo define el launcher; vacío = un solo proceso).
+    "WORKER_ID": os.getenv("CHAT_WORKER_ID", ""),
+}
+
+CHAT_CONFIG = {
+    # Cantidad de mensajes que se envían al unirse a una conversación y por página de historial.
+    "HISTORY_PAGE_SIZE": int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "200")),
+    # Buffer circular en Redis con los últimos mensajes ya serializados de cada conversación.
+    "HISTORY_CACHE_SIZE": int(os.getenv("CHAT_HISTORY_CACHE_SIZE", os.getenv("CHAT_HISTORY_PAGE_SIZE", "200"))),
+    "HISTORY_CACHE_TTL": int(os.getenv("CHAT_HISTORY_CACHE_TTL", str(60 * 60 * 24))),
+    # Claves de conversación (las que usan los clientes) -> id entero, en memoria de cada proceso.
+    "CONVERSATION_CACHE_SIZE": int(os.getenv("CHAT_CONVERSATION_CACHE_SIZE", "50000")),
+    # Persistencia diferida (write-behind): se emite el mensaje de inmediato y se guarda por lotes.
+    "WRITE_BEHIND": os.getenv("CHAT_WRITE_BEHIND") == "1",
+    "WRITE_BEHIND_BATCH_SIZE": int(os.getenv("CHAT_WRITE_BEHIND_BATCH_SIZE", "500")),
+    "WRITE_BEHIND_FLUSH_MS": int(os.getenv("CHAT_WRITE_BEHIND_FLUSH_MS", "50")),
+    "WRITE_BEHIND_MAX_PENDING": int(os.getenv("CHAT_WRITE_BEHIND_MAX_PENDING", "10000")),
+    "WRITE_BEHIND_SPOOL_DIR": os.getenv("CHAT_WRITE_BEHIND_SPOOL_DIR", str(BASE_DIR / "var" / "chat-spool")),
+    # Presencia: leases con TTL en Redis renovados por heartbeat (segundos).
+    "PRESENCE_LEASE_TTL": int(os.getenv("CHAT_PRESENCE_LEASE_TTL", "60")),
+    "PRESENCE_HEARTBEAT_INTERVAL": int(os.getenv("CHAT_PRESENCE_HEARTBEAT_INTERVAL", "20")),
+    "PRESENCE_SWEEP_INTERVAL": int(os.getenv("CHAT_PRESENCE_SWEEP_INTERVAL", "30")),
+    "PRESENCE_DB_SYNC_INTERVAL": int(os.getenv("CHAT_PRESENCE_DB_SYNC_INTERVAL", "5")),
+    # Ventana (ms) en la que se agrupan los cambios de presencia en un solo evento presence:batch.
+    "PRESENCE_BATCH_WINDOW_MS": int(os.getenv("CHAT_PRESENCE_BATCH_WINDOW_MS", "250")),
+    # Hilos (y por lo tanto conexiones a Postgres) por proceso para el ORM de los sockets.
+    "DB_EXECUTOR_WORKERS": int(os.getenv("CHAT_DB_EXECUTOR_WORKERS", "8")),
+    "DB_EXECUTOR_SLOW_WAIT_MS": int(os.getenv("CHAT_DB_EXECUTOR_SLOW_WAIT_MS", "200")),
+    # Ventana (s) en la que Redis detecta reintentos con el mismo clientMessageId.
+    "DEDUPE_TTL": int(os.getenv("CHAT_DEDUPE_TTL", str(60 * 10))),
+    # Marcas de lectura: se guardan en Redis y se vuelcan a Postgres por lotes.
+    "READ_FLUSH_INTERVAL": int(os.getenv("CHAT_READ_FLUSH_INTERVAL", "2")),
+    "READ_FLUSH_BATCH_SIZE": int(os.getenv("CHAT_READ_FLUSH_BATCH_SIZE", "500")),
+    # Máximo de no leídos que se cuentan por conversación (el cliente muestra "999+").
+    "UNREAD_CAP": int(os.getenv("CHAT_UNREAD_CAP", "999")),
+    # Particiones mensuales de mensajes (manage.py chat_partitions): meses creados por adelantado
+    # y meses que se conservan (0 = sin límite).
+    "PARTITION_MONTHS_AHEAD": int(os.getenv("CHAT_PARTITION_MONTHS_AHEAD", "3")),
+    "RETENTION_MONTHS": int(os.getenv("CHAT_RETENTION_MONTHS", "0")),
+    # Ventana (días) que se consulta primero al cargar historial, para que Postgres
+    # solo lea las particiones recientes en conversaciones activas.
+    "HISTORY_RECENT_WINDOW_DAYS": int(os.getenv("CHAT_HISTORY_RECENT_WINDOW_DAYS", "31")),
+    # Desactivar solo para pruebas de carga (manage.py chat_loadtest --no-rate-limits).
+    "RATE_LIMITS_ENABLED": os.getenv("CHAT_RATE_LIMITS_ENABLED", "1") == "1",
+    # Límites por socket (token bucket): (tokens por segundo, ráfaga) por rol y acción.
+    # "join" cubre chat:join y chat:sync; "history" cubre chat:history:page.
+    "RATE_LIMITS": {
+        "user": {"message": (1, 10), "join": (0.5, 10), "history": (1, 10)},
+        "operator": {"message": (3, 30), "join": (2, 30), "history": (3, 30)},
+        "admin": {"message": (5, 50), "join": (5, 50), "history": (5, 50)},
+    },
+    # El límite por usuario (todas sus conexiones, en Redis) es este múltiplo del límite por socket.
+    "RATE_LIMIT_USER_FACTOR": float(os.getenv("CHAT_RATE_LIMIT_USER_FACTOR", "2")),
 }
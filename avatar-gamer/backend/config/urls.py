@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenRefreshView
 from apps.accounts.views import MeView, SafeTokenObtainPairView
+from apps.metrics.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,4 +11,6 @@ urlpatterns = [
     path('api/v1/auth/token/refresh', TokenRefreshView.as_view(), name='token_refresh'), # JWT
     path('api/v1/me', MeView.as_view(), name='me'), # JWT
     path('api/v1/', include('apps.control.urls')),
+    path('api/v1/chat/', include('apps.chat.urls')),
+    path('metrics', metrics_view, name='metrics'), # Prometheus
 ]
@@ -38,5 +38,10 @@ PY
 # Ejecuta migraciones
 python manage.py migrate --noinput
 
-# Levanta el servidor ASGI con uvicorn
-uvicorn config.asgi:application --host 0.0.0.0 --port 8000
\ No newline at end of file
+# Levanta el servidor ASGI. Con WEB_CONCURRENCY > 1 se usa el launcher multiproceso
+# (N workers uvicorn detrás de un proxy con afinidad por sid de Engine.IO).
+WEB_CONCURRENCY="${WEB_CONCURRENCY:-1}"
+if [ "$WEB_CONCURRENCY" -gt 1 ]; then
+    exec python -m config.launcher --host 0.0.0.0 --port 8000 --workers "$WEB_CONCURRENCY"
+fi
+exec uvicorn config.asgi:application --host 0.0.0.0 --port 8000
\ No newline at end of file